@@ -1,37 +1,269 @@
 # flask app
-from flask import Flask
-from src.agent_controller import AgentController
+import os
+import uuid
+from flask import Flask, Response, send_file
 from flask import request
+from src.async_runner import AsyncChatRunner, ChatOverloadedError, ChatTimeoutError, ChatUnavailableError
+from src.batch_runner import BatchInputError, BatchJobs, detect_format
+from src.resources import lazy_resource, readiness, warm_up
+from src.faq_pdf_tool import answer_cache
+from src.generators import model_router
+from src.streaming import format_sse
+from src.tracing import metrics, recent_traces, start_trace, trace_id_from_headers
 
-app = Flask(__name__)   
-agent_controller = AgentController()
-agent = agent_controller.get_agent()
+DEBUG = True
+
+app = Flask(__name__)
+
+
+def _build_agent_controller():
+    # Imported lazily so the server can bind its port before the LLM stack loads.
+    from src.agent_controller import AgentController
+    return AgentController()
+
+
+agent_controller = lazy_resource("agent_controller", _build_agent_controller)
+chat_runner = AsyncChatRunner()
+batch_jobs = BatchJobs(lambda: agent_controller.get())
+metrics.gauge(
+    "agent_chat_turns",
+    "Chat turns accepted by the runner, by state.",
+    lambda: {(("state", "pending"),): chat_runner.pending, (("state", "in_flight"),): chat_runner.in_flight},
+)
 
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """
     Handles POST requests to /chat.
-    
-    This function expects a JSON payload with a single key 'query' with a string value.
-    The query is processed by the agent and the response is returned as a JSON string.
+
+    This function expects a JSON payload with a key 'query' with a string value,
+    and optionally a 'session_id' (or an X-Session-Id header) identifying the
+    conversation. The query is processed by that session's agent and the
+    response is returned as a string; the session id is echoed back in the
+    X-Session-Id header so clients can continue the conversation.
+
+    The turn runs on the shared async chat runner. When too many turns are
+    queued the request is rejected with 429, when no LLM slot frees up in
+    time with 503, and when the turn itself runs too long with 504.
+
+    With "stream": true in the payload (or an Accept: text/event-stream
+    header) the reply is sent as Server-Sent Events instead: 'token' events
+    with the answer text, 'interim' events with any text the agent writes
+    while deciding on tools, 'tool' events while tools such as the calendar
+    or FAQ lookup run, then a final 'done' (or 'error') event.
+
+    Every request is traced under the id of an incoming traceparent or
+    X-Request-Id header (or a new one), returned in the X-Trace-Id header;
+    GET /traces shows its latency breakdown.
     """
-    
+
     data = request.get_json()
     query = data['query']
-    response = agent.chat(query)
-    return response.response, 200
+    session_id = data.get('session_id') or request.headers.get('X-Session-Id') or uuid.uuid4().hex
+    stream = data.get('stream') or 'text/event-stream' in request.headers.get('Accept', '')
+    trace = start_trace("chat", trace_id_from_headers(request.headers))
+    headers = {'X-Session-Id': session_id, 'X-Trace-Id': trace.trace_id}
+    status = 500
+    try:
+        controller = agent_controller.get()
+        if stream:
+            events = chat_runner.stream(lambda sink: controller.astream_chat(query, sink, session_id=session_id))
+            status = None  # the trace ends with the stream
+            return Response(
+                _sse_frames(events, trace),
+                mimetype='text/event-stream',
+                headers={**headers, 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+            )
+        response = chat_runner.run(lambda: controller.achat(query, session_id=session_id))
+        status = 200
+    except ChatOverloadedError:
+        status = 429
+        return "Too many requests, please retry shortly.", 429, {**headers, 'Retry-After': '1'}
+    except ChatUnavailableError:
+        status = 503
+        return "Service busy, please retry shortly.", 503, {**headers, 'Retry-After': '5'}
+    except ChatTimeoutError:
+        status = 504
+        return "The request timed out, please try again.", 504, headers
+    finally:
+        if status is not None:
+            trace.finish(status)
+    return response.response, 200, headers
+
+def _sse_frames(events, trace):
+    status = 200
+    try:
+        for event in events:
+            if event["type"] == "done":
+                event = {"type": "done", "response": event["result"].response}
+            elif event["type"] == "error":
+                status = event["status"]
+            yield format_sse(event)
+    finally:
+        trace.finish(status)
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """
+    Handles POST requests to /chat/batch.
+
+    Accepts a CSV or JSONL file of inquiries, either as the request body or
+    as a multipart 'file' field, and answers every record with the agent in
+    the background, each in its own session. The format comes from ?format=,
+    the file name or the Content-Type; ?query_field= names the column or key
+    holding the inquiry. The upload is spooled to disk, so its size is not
+    bounded by memory.
+
+    Returns 202 with the job id and the URLs of its status and results.
+    """
+
+    # Only multipart bodies are parsed as a form; anything else is the file itself.
+    upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    filename = (upload.filename or '') if upload is not None else ''
+    declared = request.args.get('format')
+    if not declared and not os.path.splitext(filename)[1]:
+        declared = 'csv' if 'csv' in (request.mimetype or '') else 'jsonl'
+    try:
+        fmt = detect_format(filename, declared)
+        job = batch_jobs.submit(upload.save if upload is not None else _spool_body, fmt, request.args.get('query_field'))
+    except BatchInputError as e:
+        return {"error": str(e)}, 400
+    return {
+        "job_id": job.job_id,
+        "status_url": f"/chat/batch/{job.job_id}",
+        "results_url": f"/chat/batch/{job.job_id}/results",
+    }, 202
+
+
+def _spool_body(path):
+    with open(path, 'wb') as f:
+        while True:
+            chunk = request.stream.read(1 << 20)
+            if not chunk:
+                break
+            f.write(chunk)
+
+
+@app.route('/chat/batch/<job_id>', methods=['GET'])
+def chat_batch_status(job_id):
+    """
+    Handles GET requests to /chat/batch/<job_id>.
+
+    Returns the job's status (queued, running, completed, interrupted or
+    failed) with its progress: records succeeded, failed and skipped as
+    already done, throughput, latency and the most common errors.
+    """
+
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return {"error": "unknown batch job"}, 404
+    return job.as_dict(), 200
+
+
+@app.route('/chat/batch/<job_id>/results', methods=['GET'])
+def chat_batch_results(job_id):
+    """
+    Handles GET requests to /chat/batch/<job_id>/results.
+
+    Streams the results written so far as JSONL, one line per record in
+    completion order, each with the record's index, id, query, response or
+    error, latency and token usage.
+    """
+
+    job = batch_jobs.get(job_id)
+    if job is None or not os.path.exists(job.output_path):
+        return {"error": "no results for this batch job"}, 404
+    return send_file(os.path.abspath(job.output_path), mimetype='application/x-ndjson', conditional=False)
+
+
+@app.route('/chat/batch/<job_id>/<action>', methods=['POST'])
+def chat_batch_control(job_id, action):
+    """
+    Handles POST requests to /chat/batch/<job_id>/stop and /resume.
+
+    stop finishes the records in flight, checkpoints and stops the job;
+    resume queues a stopped, interrupted (e.g. by a restart) or failed job
+    again, continuing after the last record it wrote.
+    """
+
+    if action not in ('stop', 'resume'):
+        return {"error": f"unknown action '{action}'"}, 404
+    job = batch_jobs.stop(job_id) if action == 'stop' else batch_jobs.resume(job_id)
+    if job is None:
+        return {"error": "unknown batch job"}, 404
+    return job.as_dict(), 202
 
 @app.route('/ping',methods=['GET'])
 def ping():
     """
     Handles GET requests to /ping.
-    
-    This function simply returns a string 'Alive' as a confirmation of the
-    application being alive.
+
+    Liveness probe: returns 'Alive' as soon as the process is serving,
+    without waiting for models or indexes to load.
     """
-    
+
     return "Alive", 200
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Handles GET requests to /ready.
+
+    Readiness probe: returns 200 once the agent, embedding model, FAQ index
+    and LLM clients are built, and 503 while they are still warming up or if
+    one of them failed. The body reports per-resource state and build time,
+    how much traffic the intent router answered without the LLM and the
+    FAQ answer cache's hit rate.
+    """
+
+    is_ready, status = readiness()
+    status["chat"] = chat_runner.stats()
+    if agent_controller.ready:
+        controller = agent_controller.get()
+        status["prompt"] = controller.prompt.stats()
+        if controller.router:
+            status["intent_router"] = controller.router.stats()
+    if answer_cache.ready:
+        status["faq_cache"] = answer_cache.get().stats()
+    if model_router.ready:
+        status["llm"] = model_router.get().stats()
+    return status, 200 if is_ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Handles GET requests to /metrics.
+
+    Prometheus text format: request and span latency histograms (agent
+    steps, LLM, tool, calendar and retrieval calls), LLM token counters and
+    the chat runner's queue depth.
+    """
+
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/traces', methods=['GET'])
+def traces():
+    """
+    Handles GET requests to /traces.
+
+    Returns the most recent request traces (?limit=N, default 20), or the
+    one given by ?trace_id=, each with its spans and time spent per span name.
+    """
+
+    limit = int(request.args.get('limit', 20))
+    return {"traces": recent_traces(limit, request.args.get('trace_id'))}, 200
+
+
+def _is_reloader_parent():
+    # With debug=True the reloader's parent process only watches files;
+    # warming up there would load every model a second time.
+    return __name__ == "__main__" and DEBUG and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+
+
+if not _is_reloader_parent():
+    warm_up()
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=3389, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=3389, debug=DEBUG, threaded=True)
@@ -0,0 +1,119 @@
+"""
+Throughput and memory of answering a backlog of inquiries with the batch runner.
+
+Generates a JSONL backlog (availability, booking and FAQ inquiries) and runs
+it through BatchRunner against the fake LLM (--llm-latency-ms per
+completion) and FakeCalendarService:
+
+    sequential   the first --records/4 records one at a time, as posting
+                 them to /chat one by one would
+    concurrent   the same records --concurrency at a time
+    4x input     all --records records; peak RSS should barely move from
+                 the concurrent run, since records are streamed and their
+                 sessions dropped
+    resume       the 4x run stopped halfway and started again; every
+                 record must be written exactly once
+
+Usage:
+    python benchmarks/bench_batch.py [--records 800] [--concurrency 16] [--llm-latency-ms 100]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+QUERIES = [
+    "what slots are free on 2031-{month:02d}-{day:02d}?",
+    "please book a product demo on 2031-{month:02d}-{day:02d} at 10:00",
+    "what is your refund policy?",
+    "do you ship internationally?",
+]
+
+
+def write_backlog(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(records):
+            query = QUERIES[i % len(QUERIES)].format(month=i // 28 % 12 + 1, day=i % 28 + 1)
+            f.write(json.dumps({"id": f"inquiry-{i}", "query": query}) + "\n")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(label, controller, input_path, output_path, concurrency, stop_after=None):
+    from src.batch_runner import BatchRunner
+    runner = BatchRunner(controller, concurrency=concurrency, checkpoint_every=50)
+    if stop_after is not None:
+        threading.Timer(stop_after, runner.stop).start()
+    result = runner.run(input_path, output_path)
+    latency = result["latency_seconds"]
+    print(f"{label:11s}: {result['status']:11s} {result['succeeded']} ok, {result['failed']} failed, "
+          f"{result['skipped']} skipped, {result['records_per_minute']:.0f} records/min, "
+          f"mean {latency['mean'] or 0:.2f}s, peak RSS {peak_rss_mb():.0f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=800)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=100)
+    parser.add_argument("--port", type=int, default=18097)
+    args = parser.parse_args()
+
+    import fake_llm_server
+    server = fake_llm_server.start(args.port, latency_ms=args.llm_latency_ms)
+    workdir = tempfile.mkdtemp(prefix="batch-bench-")
+    os.environ.update(
+        GROQ_API_BASE=f"http://127.0.0.1:{args.port}/v1",
+        INTENT_ROUTER_ENABLED="false",
+        AGENT_SELECT_TOOLS="false",
+        FAQ_INDEX_DIR=os.path.join(workdir, "faq-index"),
+        BOOKING_CONFIRM_WAIT_SECONDS="0",
+    )
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+    os.environ.pop("FAQ_CACHE_PATH", None)
+
+    import calendar_service
+    from fake_calendar import FakeCalendarService
+    calendar_service.set_calendar_service(FakeCalendarService(latency_ms=5))
+    from fake_embedding import HashingEmbedding
+    from src import faq_pdf_tool
+    faq_pdf_tool.embed_model.factory = lambda: HashingEmbedding(embed_dim=384)
+    faq_pdf_tool.query_faq_pdf("What services do you offer?")  # builds the index outside the timings
+    from src.agent_controller import AgentController
+    controller = AgentController()
+
+    small, large = os.path.join(workdir, "small.jsonl"), os.path.join(workdir, "large.jsonl")
+    write_backlog(small, args.records // 4)
+    write_backlog(large, args.records)
+    print(f"{args.records // 4} and {args.records} inquiries, fake LLM at {args.llm_latency_ms:.0f}ms per completion")
+    sequential = run("sequential", controller, small, os.path.join(workdir, "seq.jsonl"), 1)
+    concurrent = run("concurrent", controller, small, os.path.join(workdir, "conc.jsonl"), args.concurrency)
+    rss = peak_rss_mb()
+    run("4x input", controller, large, os.path.join(workdir, "large.jsonl.out"), args.concurrency)
+    print(f"throughput {concurrent['records_per_minute'] / sequential['records_per_minute']:.1f}x sequential; "
+          f"peak RSS +{peak_rss_mb() - rss:.0f} MB for 4x the records; {len(controller.sessions)} sessions left in the pool")
+
+    output = os.path.join(workdir, "resumed.jsonl")
+    first = run("resume 1/2", controller, large, output, args.concurrency,
+                stop_after=args.records / concurrent["records_per_minute"] * 60 / 2)
+    run("resume 2/2", controller, large, output, args.concurrency)
+    with open(output, encoding="utf-8") as f:
+        indexes = [json.loads(line)["index"] for line in f]
+    print(f"resumed after {first['succeeded'] + first['failed']} records: {len(indexes)} results, "
+          f"{len(set(indexes))} distinct, {args.records - len(set(indexes))} missing")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Booking under concurrency: throughput, reply latency and correctness.
+
+Simulated users book meetings at the same time against FakeCalendarService,
+picking from a small set of slots so many of them compete for the same
+one. Some requests repeat the user's previous one (a retried tool call) and
+the fake calendar injects 429/503 responses and lost insert responses.
+After the booking queue has drained, the calendar is checked:
+
+    double_booked  booked events overlapping another event (must be 0)
+    duplicates     meetings inserted more than once (must be 0)
+    unconfirmed    "confirmed" bookings missing from the calendar (must be 0)
+
+--baseline runs the previous check-then-insert code path instead, with no
+reservation and a timestamp requestId, for comparison.
+
+Usage:
+    python benchmarks/bench_booking.py [--users 40] [--requests-per-user 5] [--slots 12]
+        [--calendar-latency-ms 80] [--error-rate 0.1] [--lost-response-rate 0.05] [--baseline]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def candidate_slots(count):
+    first = date.today() + timedelta(days=1)
+    slots = []
+    day = 0
+    while len(slots) < count:
+        for hour in range(9, 17):
+            slots.append(((first + timedelta(days=day)).isoformat(), f"{hour:02d}:00"))
+        day += 1
+    return slots[:count]
+
+
+def baseline_book(tools, date_str, time_str, subject, duration):
+    # The pre-queue code path: cached check, then an unguarded insert.
+    import pytz
+    if not tools.is_time_slot_available(date_str, time_str, duration):
+        return "❌ not available"
+    start = pytz.UTC.localize(datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M"))
+    end = start + timedelta(minutes=duration)
+    body = {
+        "summary": subject,
+        "start": {"dateTime": start.isoformat(), "timeZone": "UTC"},
+        "end": {"dateTime": end.isoformat(), "timeZone": "UTC"},
+        "conferenceData": {"createRequest": {"requestId": f"meet-{int(datetime.now().timestamp())}",
+                                             "conferenceSolutionKey": {"type": "hangoutsMeet"}}},
+    }
+    try:
+        tools.get_calendar_service().events().insert(calendarId=tools.CALENDAR_ID, body=body, conferenceDataVersion=1).execute()
+    except Exception:
+        return "❌ Sorry, I couldn’t schedule the meeting"
+    tools.freebusy_cache.add_busy(tools.CALENDAR_ID, start, end)
+    return "✅ Meeting scheduled"
+
+
+def check_calendar(service, booked_subjects):
+    events = service.calendars["primary"]
+    booked = [e for e in events if e.get("summary") in booked_subjects]
+    parse = lambda value: datetime.fromisoformat(value.replace("Z", "+00:00"))
+    spans = [(parse(e["start"]["dateTime"]), parse(e["end"]["dateTime"]), e["id"]) for e in events]
+    double_booked = 0
+    for event in booked:
+        start, end = parse(event["start"]["dateTime"]), parse(event["end"]["dateTime"])
+        if any(s < end and start < e and other != event["id"] for s, e, other in spans):
+            double_booked += 1
+    copies = Counter((e["summary"], e["start"]["dateTime"]) for e in booked)
+    duplicates = sum(n - 1 for n in copies.values() if n > 1)
+    return booked, double_booked, duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--requests-per-user", type=int, default=5)
+    parser.add_argument("--slots", type=int, default=24, help="distinct slots the users compete for")
+    parser.add_argument("--repeat-rate", type=float, default=0.2, help="fraction of requests repeating the previous one")
+    parser.add_argument("--calendar-latency-ms", type=float, default=80)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--lost-response-rate", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=4, help="booking queue threads")
+    parser.add_argument("--confirm-wait", type=float, default=0.0, help="BOOKING_CONFIRM_WAIT_SECONDS")
+    parser.add_argument("--baseline", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["BOOKING_WORKERS"] = str(args.workers)
+    os.environ["BOOKING_CONFIRM_WAIT_SECONDS"] = str(args.confirm_wait)
+    os.environ.setdefault("BOOKING_BACKOFF_SECONDS", "0.05")
+    os.environ.setdefault("BOOKING_BACKOFF_MAX_SECONDS", "1")
+
+    import calendar_service
+    from fake_calendar import FakeCalendarService
+    service = FakeCalendarService(latency_ms=args.calendar_latency_ms, busy_per_day=2,
+                                  error_rate=args.error_rate, lost_response_rate=args.lost_response_rate)
+    calendar_service.set_calendar_service(service)
+    from src import tools
+    from src.session_pool import bind_session_state
+
+    slots = candidate_slots(args.slots)
+    rng = random.Random(args.seed)
+    plans = []
+    for user in range(args.users):
+        requests, previous = [], None
+        for i in range(args.requests_per_user):
+            if previous is not None and rng.random() < args.repeat_rate:
+                requests.append(previous)
+            else:
+                slot_date, slot_time = rng.choice(slots)
+                previous = (slot_date, slot_time, f"bench user {user} meeting {i}")
+                requests.append(previous)
+        plans.append(requests)
+
+    latencies, outcomes = [], Counter()
+    lock = threading.Lock()
+
+    def run_user(user):
+        state = {"session_id": f"bench-{user}"}
+        for slot_date, slot_time, subject in plans[user]:
+            started = time.perf_counter()
+            with bind_session_state(state):
+                if args.baseline:
+                    reply = baseline_book(tools, slot_date, slot_time, subject, 60)
+                else:
+                    reply = tools.schedule_google_meet(slot_date, slot_time, subject, 60)
+            elapsed = (time.perf_counter() - started) * 1000
+            kind = "held" if reply.startswith("✅") else "unavailable" if "not available" in reply or "taken" in reply else "failed"
+            with lock:
+                latencies.append(elapsed)
+                outcomes[kind] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(run_user, range(args.users)))
+    replied = time.perf_counter() - started
+    if not args.baseline:
+        tools.booking_queue.drain(timeout=300)
+    finished = time.perf_counter() - started
+
+    subjects = {subject for requests in plans for _, _, subject in requests}
+    booked, double_booked, duplicates = check_calendar(service, subjects)
+    total = sum(outcomes.values())
+    print(f"mode={'baseline' if args.baseline else 'queue'} users={args.users} requests={total} slots={len(slots)}")
+    print(f"replies: {dict(outcomes)} in {replied:.2f}s ({total / replied:.1f} req/s)")
+    print(f"reply latency: p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms "
+          f"p99={percentile(latencies, 99):.1f}ms")
+    print(f"all bookings final after {finished:.2f}s; {len(booked)} events on the calendar "
+          f"({len(booked) / finished:.1f} bookings/s); API calls={service.calls} injected errors={service.failures}")
+    if not args.baseline:
+        with tools.booking_queue._lock:
+            statuses = Counter(booking.status for booking in tools.booking_queue._bookings.values())
+        on_calendar = {e["id"] for e in booked}
+        unconfirmed = sum(1 for booking in tools.booking_queue._bookings.values()
+                          if booking.status == "confirmed" and booking.key not in on_calendar)
+        print(f"booking statuses: {dict(statuses)}; unconfirmed={unconfirmed}")
+    print(f"double_booked={double_booked} duplicates={duplicates}")
+
+
+if __name__ == "__main__":
+    main()
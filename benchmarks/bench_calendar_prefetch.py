@@ -0,0 +1,104 @@
+"""
+Latency of scheduling turns with and without the speculative calendar prefetch.
+
+Turns go through the agent (intent router off) against the fake LLM with
+--llm-latency-ms per completion and FakeCalendarService with
+--calendar-latency-ms per call. Each turn names a date the free/busy cache
+has not seen yet, so without prefetching the calendar read starts only
+after the LLM has asked for the tool. The mix covers availability
+listings, bookings and (as a control that prefetches nothing) FAQ
+questions. Reports turn latency per mode and the prefetch hit rate, days
+fetched but never used, and calendar time taken off the turns.
+
+Usage:
+    python benchmarks/bench_calendar_prefetch.py [--turns 12] [--llm-latency-ms 300] [--calendar-latency-ms 250]
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+QUERIES = [
+    "what slots are free on {date}?",
+    "please book a product demo on {date} at 10:00",
+    "is there any availability on {date}?",
+    "what is your refund policy?",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--calendar-latency-ms", type=float, default=250)
+    parser.add_argument("--port", type=int, default=18093)
+    args = parser.parse_args()
+
+    import fake_llm_server
+    server = fake_llm_server.start(args.port, latency_ms=args.llm_latency_ms)
+    os.environ.update(
+        GROQ_API_BASE=f"http://127.0.0.1:{args.port}/v1",
+        INTENT_ROUTER_ENABLED="false",
+        AGENT_SELECT_TOOLS="false",
+        FAQ_INDEX_DIR=tempfile.mkdtemp(prefix="faq-index-bench-"),
+    )
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+    os.environ.pop("FAQ_CACHE_PATH", None)
+
+    import calendar_service
+    from fake_calendar import FakeCalendarService
+    service = FakeCalendarService(latency_ms=args.calendar_latency_ms)
+    calendar_service.set_calendar_service(service)
+    from fake_embedding import HashingEmbedding
+    from src import faq_pdf_tool, tools
+    faq_pdf_tool.embed_model.factory = lambda: HashingEmbedding(embed_dim=384)
+    faq_pdf_tool.query_faq_pdf("What services do you offer?")  # builds the index outside the timings
+    from src.agent_controller import AgentController
+    controller = AgentController()
+
+    first_day = date(2031, 1, 6)
+    results = {}
+    for mode in ("off", "on"):
+        controller.prefetcher = tools.calendar_prefetcher if mode == "on" else None
+        before = tools.calendar_prefetcher.stats()
+        calls_before = service.calls
+        latencies = []
+        for turn in range(args.turns + 1):
+            # A fresh weekday per turn and mode, so the busy cache never answers.
+            day = first_day + timedelta(weeks=turn, days=(mode == "on") * 2)
+            query = QUERIES[turn % len(QUERIES)].format(date=day.isoformat())
+            started = time.perf_counter()
+            controller.chat(query, session_id=f"prefetch-{mode}-{turn}")
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies = latencies[1:]  # the first turn warms up connections
+        tools.booking_queue.drain(timeout=60)
+        results[mode] = latencies
+        line = (f"prefetch {mode:3s}: p50={percentile(latencies, 50):.0f}ms p95={percentile(latencies, 95):.0f}ms "
+                f"mean={statistics.mean(latencies):.0f}ms calendar calls={service.calls - calls_before}")
+        if mode == "on":
+            after = tools.calendar_prefetcher.stats()
+            hits, misses = after["hits"] - before["hits"], after["misses"] - before["misses"]
+            saved = after["saved_seconds"] - before["saved_seconds"]
+            line += (f" | hit rate {hits}/{hits + misses} unused={after['unused'] - before['unused']} "
+                     f"saved {saved * 1000 / (args.turns + 1):.0f}ms/turn")
+        print(line)
+    print(f"mean turn latency {statistics.mean(results['off']) - statistics.mean(results['on']):.0f}ms lower with prefetch")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: FAQ ingestion (PDF parsing, chunking and embedding) into a fresh index store.
+
+The PDFs in src/faqs/ are copied --copies times into a temporary source
+directory to simulate a larger corpus (each copy is a separate file, so
+parsing parallelizes across them), then FaqIndexStore builds a store from
+scratch. Reports chunks/sec for parsing and embedding and the peak RSS of
+the process and its parse workers.
+
+Run one configuration per invocation so peak RSS is not inherited from an
+earlier run, e.g.:
+    python benchmarks/bench_faq_ingestion.py --copies 50 --workers 1 --backend huggingface
+    python benchmarks/bench_faq_ingestion.py --copies 50 --workers 4 --backend onnx --batch-size 128
+
+--backend mock uses llama-index's MockEmbedding to measure parsing and
+pipeline overhead without a model.
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.embedding_pipeline import build_embed_model, embed_texts, parse_pdfs  # noqa: E402
+from src.faq_pdf_tool import EMBED_MODEL_NAME, FAQ_DIR  # noqa: E402
+from src.faq_index_store import FaqIndexStore  # noqa: E402
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backend", choices=["huggingface", "onnx", "mock"], default="huggingface")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="faq-bench-")
+    source_dir = os.path.join(workdir, "faqs")
+    os.makedirs(source_dir)
+    for name in os.listdir(FAQ_DIR):
+        if name.lower().endswith(".pdf"):
+            for copy in range(args.copies):
+                shutil.copy(os.path.join(FAQ_DIR, name), os.path.join(source_dir, f"{copy:03d}-{name}"))
+
+    try:
+        started = time.perf_counter()
+        if args.backend == "mock":
+            from llama_index.core.embeddings import MockEmbedding
+            embed_model = MockEmbedding(embed_dim=384)
+        else:
+            embed_model = build_embed_model(EMBED_MODEL_NAME, args.backend, args.batch_size)
+        load_seconds = time.perf_counter() - started
+
+        store = FaqIndexStore(source_dir, os.path.join(workdir, "index"), EMBED_MODEL_NAME,
+                              parse_workers=args.workers, embed_batch_size=args.batch_size)
+        started = time.perf_counter()
+        parsed = parse_pdfs(store.source_files(), workers=args.workers)
+        parse_seconds = time.perf_counter() - started
+        texts = [record["embed_text"] for records in parsed.values() for record in records]
+        pages = len({(path, record["metadata"].get("page_label")) for path, records in parsed.items() for record in records})
+
+        started = time.perf_counter()
+        embed_texts(embed_model, texts, batch_size=args.batch_size)
+        embed_seconds = time.perf_counter() - started
+
+        # End to end through the store (parse + embed + persist).
+        started = time.perf_counter()
+        nodes = store.load_nodes(embed_model)
+        total_seconds = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    own_rss, worker_rss = peak_rss_mb()
+    print(f"backend={args.backend} workers={args.workers} batch_size={args.batch_size}")
+    print(f"files: {len(parsed)}  pages: ~{pages}  chunks: {len(texts)}")
+    print(f"model load:  {load_seconds:7.2f}s")
+    print(f"parse:       {parse_seconds:7.2f}s  ({len(texts) / parse_seconds:8.1f} chunks/s)")
+    print(f"embed:       {embed_seconds:7.2f}s  ({len(texts) / max(embed_seconds, 1e-9):8.1f} chunks/s)")
+    print(f"end to end:  {total_seconds:7.2f}s  ({len(nodes) / total_seconds:8.1f} chunks/s)")
+    print(f"peak RSS:    {own_rss:7.1f} MB main, {worker_rss:7.1f} MB largest parse worker")
+
+
+if __name__ == "__main__":
+    main()
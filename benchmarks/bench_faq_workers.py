@@ -0,0 +1,110 @@
+"""
+Benchmark: memory cost of the FAQ index per worker process, mmap vs in-memory.
+
+A store is built once from --copies copies of the PDFs in src/faqs/ (with
+MockEmbedding vectors of --dim dimensions, so no model is needed). Then
+--workers processes are started; each opens the index with the chosen
+backend, runs --queries vector searches and reports how much its
+proportional set size (PSS: private memory plus its share of shared pages)
+grew. With the mmap backend the vector and docstore pages are shared
+through the page cache, so the per-worker growth stays near zero as
+workers are added; the memory backend builds a full VectorStoreIndex in
+every worker.
+
+Linux only (reads /proc/self/smaps_rollup), e.g.:
+    python benchmarks/bench_faq_workers.py --copies 200 --workers 4 --backend mmap
+    python benchmarks/bench_faq_workers.py --copies 200 --workers 4 --backend memory
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from llama_index.core.embeddings import MockEmbedding  # noqa: E402
+from llama_index.core.schema import QueryBundle  # noqa: E402
+
+from src.faq_index_store import FaqIndexStore  # noqa: E402
+from src.faq_pdf_tool import FAQ_DIR  # noqa: E402
+
+
+def pss_mb():
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker(args, source_dir, store_dir, barrier, results):
+    embed_model = MockEmbedding(embed_dim=args.dim)
+    store = FaqIndexStore(source_dir, store_dir, "mock", index_dtype=args.dtype)
+    before = pss_mb()
+    if args.backend == "mmap":
+        retriever = store.open_mmap_index(embed_model).as_retriever(similarity_top_k=5)
+    else:
+        retriever = store.build_index(embed_model).as_retriever(similarity_top_k=5)
+    rng = np.random.default_rng(os.getpid())
+    latencies = []
+    for _ in range(args.queries):
+        query = QueryBundle("q", embedding=rng.standard_normal(args.dim).tolist())
+        started = time.perf_counter()
+        retriever.retrieve(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    # Measure once every worker has mapped the index, so shared pages are split between them.
+    barrier.wait()
+    results.put((pss_mb() - before, statistics.mean(latencies)))
+    barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backend", choices=["mmap", "memory"], default="mmap")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="faq-workers-")
+    source_dir = os.path.join(workdir, "faqs")
+    store_dir = os.path.join(workdir, "index")
+    os.makedirs(source_dir)
+    for name in os.listdir(FAQ_DIR):
+        if name.lower().endswith(".pdf"):
+            for copy in range(args.copies):
+                shutil.copy(os.path.join(FAQ_DIR, name), os.path.join(source_dir, f"{copy:03d}-{name}"))
+    try:
+        store = FaqIndexStore(source_dir, store_dir, "mock", index_dtype=args.dtype)
+        chunks, _ = store.refresh(MockEmbedding(embed_dim=args.dim))
+        files = {name: os.path.getsize(os.path.join(store_dir, name)) for name in os.listdir(store_dir)}
+        print(f"{len(chunks)} chunks, store files {sum(files.values()) / 2**20:.1f} MB")
+
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(args.workers)
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(args, source_dir, store_dir, barrier, results)) for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        measured = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        growth = [m[0] for m in measured]
+        print(
+            f"backend={args.backend} dtype={args.dtype} workers={args.workers}: "
+            f"PSS growth per worker mean={statistics.mean(growth):.1f} MB max={max(growth):.1f} MB, "
+            f"total {sum(growth):.1f} MB; search mean={statistics.mean(m[1] for m in measured):.2f} ms"
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
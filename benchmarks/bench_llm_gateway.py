@@ -0,0 +1,126 @@
+"""
+LLM calls under provider rate limits, with and without the LLM gateway.
+
+The fake LLM server enforces --rpm/--tpm per model like the provider
+(429 with retry-after past the limit). --calls distinct completions are
+sent from --threads threads, half of them at background priority, much
+faster than the limits allow:
+
+    gateway   calls are scheduled under the limits (LLM_RATE_LIMITS) and
+              429s retried with jittered backoff, coordinated across calls
+    baseline  no scheduling; each call retries 429s on its own in the
+              client (max_retries=3), as before the gateway
+
+Reports completed and failed calls, 429s received, throughput against the
+limit, and latency per priority. Then --identical concurrent copies of one
+FAQ question are sent to show how many upstream calls they cost.
+
+Usage:
+    python benchmarks/bench_llm_gateway.py [--calls 2400] [--threads 32] [--rpm 1200] [--tpm 100000] [--identical 50]
+"""
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+MODEL = "llama-3.1-8b-instant"
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))] if ordered else 0.0
+
+
+def build_llm(port, args, baseline):
+    from src.generators import ModelRouter
+    from src.llm_gateway import LLMGateway
+    os.environ["GROQ_API_BASE"] = f"http://127.0.0.1:{port}/v1"
+    if baseline:
+        gateway = LLMGateway(max_retries=0, coalesce=False)
+    else:
+        gateway = LLMGateway(limits={MODEL: (args.rpm, args.tpm)}, backoff_seconds=0.2)
+    router = ModelRouter(
+        tiers={"small": {"model": MODEL, "provider": "groq", "max_concurrency": args.threads}},
+        fallback=False, gateway=gateway,
+    )
+    llm = router.get_llm("small")
+    if baseline:
+        llm.max_retries = 3  # the client's own retries, as configured before the gateway
+    return llm
+
+
+def run_load(mode, port, args):
+    import fake_llm_server
+    from src.llm_gateway import llm_priority
+    server = fake_llm_server.start(port, latency_ms=args.llm_latency_ms, rpm=args.rpm, tpm=args.tpm)
+    llm = build_llm(port, args, baseline=mode == "baseline")
+    latencies = {"interactive": [], "background": []}
+    failures = []
+    lock = threading.Lock()
+
+    def call(i):
+        priority = "background" if i % 2 else "interactive"
+        started = time.perf_counter()
+        try:
+            with llm_priority(priority):
+                llm.complete(f"Summarize FAQ section {i} in one sentence.")
+        except Exception as e:
+            with lock:
+                failures.append(type(e).__name__)
+            return
+        with lock:
+            latencies[priority].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(call, range(args.calls)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    stats = server.stats
+    completed = sum(len(v) for v in latencies.values())
+    print(f"{mode:8s}: {completed} completed, {len(failures)} failed, {stats['rate_limited']} x 429 "
+          f"in {stats['requests']} requests; {completed / elapsed * 60:.0f} calls/min (limit {args.rpm}) over {elapsed:.1f}s")
+    for priority, values in latencies.items():
+        if values:
+            print(f"          {priority:11s} p50={percentile(values, 50):.1f}s p95={percentile(values, 95):.1f}s")
+
+
+def run_identical(port, args):
+    import fake_llm_server
+    server = fake_llm_server.start(port, latency_ms=args.llm_latency_ms)
+    llm = build_llm(port, args, baseline=False)
+    with ThreadPoolExecutor(max_workers=args.identical) as pool:
+        answers = list(pool.map(lambda _: llm.complete("What is your refund policy?").text, range(args.identical)))
+    server.shutdown()
+    print(f"identical: {args.identical} concurrent calls -> {server.stats['requests']} upstream call(s), "
+          f"{len(set(answers))} distinct answer(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2400)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rpm", type=int, default=1200)
+    parser.add_argument("--tpm", type=int, default=100000)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--identical", type=int, default=50)
+    parser.add_argument("--port", type=int, default=18096)
+    args = parser.parse_args()
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+
+    print(f"{args.calls} calls from {args.threads} threads against {args.rpm} requests/{args.tpm} tokens per minute")
+    run_load("baseline", args.port, args)
+    run_load("gateway", args.port + 1, args)
+    run_identical(args.port + 2, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Latency of agent turns whose LLM step asks for several tools at once.
+
+The fake LLM answers "compare ..." with four tool calls in one response
+(availability for three dates plus an FAQ lookup). Calendar calls go to
+FakeCalendarService with --calendar-latency-ms per call and the busy cache
+disabled, so every availability call pays a round trip. Turns are run with
+the tool calls executed one after another (AGENT_PARALLEL_TOOLS=false) and
+in parallel, on both the sync and async agent paths. (llama-index already
+gathers the calls of an async step; there the parallel worker adds the
+concurrency bound, timeouts and call-order results rather than speed.)
+
+Usage:
+    python benchmarks/bench_parallel_tools.py [--turns 10] [--calendar-latency-ms 200] [--llm-latency-ms 50]
+"""
+import argparse
+import asyncio
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+RULES = [{
+    "match": r"\bcompare\b",
+    "calls": [
+        {"tool": "get_calendar_availability", "arguments": {"date": "{date}"}},
+        {"tool": "get_calendar_availability", "arguments": {"date": "{date+1}"}},
+        {"tool": "get_calendar_availability", "arguments": {"date": "{date+2}"}},
+        {"tool": "faq_pdf_tool", "arguments": {"question": "What services do you offer?"}},
+    ],
+}]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--calendar-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=18090)
+    args = parser.parse_args()
+
+    import fake_llm_server
+    server = fake_llm_server.start(args.port, latency_ms=args.llm_latency_ms, rules=RULES)
+    os.environ.update(
+        GROQ_API_BASE=f"http://127.0.0.1:{args.port}/v1",
+        INTENT_ROUTER_ENABLED="false",
+        AGENT_SELECT_TOOLS="false",
+        FREEBUSY_CACHE_TTL_SECONDS="0",
+        FAQ_INDEX_DIR=tempfile.mkdtemp(prefix="faq-index-bench-"),
+    )
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+    os.environ.pop("FAQ_CACHE_PATH", None)
+
+    import calendar_service
+    from fake_calendar import FakeCalendarService
+    calendar_service.set_calendar_service(FakeCalendarService(latency_ms=args.calendar_latency_ms))
+    from fake_embedding import HashingEmbedding
+    from src import faq_pdf_tool
+    faq_pdf_tool.embed_model.factory = lambda: HashingEmbedding(embed_dim=384)
+    faq_pdf_tool.query_faq_pdf("What services do you offer?")  # builds the index outside the timings
+    from src.agent_controller import AgentController
+    controller = AgentController()
+
+    query = "compare {date} and the two days after, and tell me about your services"
+    expected = len(RULES[0]["calls"])
+
+    def check(response):
+        if len(response.sources) != expected:
+            raise RuntimeError(f"expected {expected} tool outputs, got {len(response.sources)}")
+
+    def run_sync(mode):
+        latencies = []
+        for turn in range(args.turns + 1):
+            started = time.perf_counter()
+            check(controller.chat(query.format(date=f"2030-02-{turn % 20 + 1:02d}"), session_id=f"{mode}-sync-{turn}"))
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies[1:]  # the first turn warms up connections
+
+    async def run_async(mode):
+        # One loop for all turns, as in the app's AsyncChatRunner.
+        latencies = []
+        for turn in range(args.turns + 1):
+            started = time.perf_counter()
+            check(await controller.achat(query.format(date=f"2030-02-{turn % 20 + 1:02d}"), session_id=f"{mode}-async-{turn}"))
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies[1:]
+
+    results = {}
+    for parallel in (False, True):
+        controller.parallel_tools = parallel
+        mode = "parallel" if parallel else "sequential"
+        for path in ("sync", "async"):
+            latencies = run_sync(mode) if path == "sync" else asyncio.run(run_async(mode))
+            results[(mode, path)] = latencies
+            print(f"{mode:10s} {path:5s}: p50={percentile(latencies, 50):.0f}ms p95={percentile(latencies, 95):.0f}ms "
+                  f"mean={statistics.mean(latencies):.0f}ms")
+    for path in ("sync", "async"):
+        speedup = statistics.mean(results[("sequential", path)]) / statistics.mean(results[("parallel", path)])
+        print(f"{path}: parallel turns are {speedup:.2f}x faster")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
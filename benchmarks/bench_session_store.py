@@ -0,0 +1,172 @@
+"""
+Cost of keeping conversations in the shared session store.
+
+Two AgentControllers stand in for two replicas behind a load balancer
+without sticky sessions: every turn of a conversation goes to the other
+replica than the one before. Each backend (none = in-process only, sqlite,
+redis against benchmarks/fake_redis.py) runs the same conversations
+against the fake LLM, and reports:
+
+    hydrate / persist  time the turn spends loading and saving its session
+    turn               whole-turn latency
+    continuity         turns whose replica saw every earlier user message
+                       (must be all of them for sqlite and redis)
+
+Turns of one conversation are spaced by --think-ms, like a user reading the
+reply; with write-behind a turn arriving sooner than SESSION_STORE_FLUSH_MS
+after the previous one may not see it yet (use --sync-writes to compare).
+Also prints the size of the stored messages against their JSON encoding.
+
+Usage:
+    python benchmarks/bench_session_store.py [--sessions 20] [--turns 6] [--think-ms 50] [--sync-writes]
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+QUERIES = [
+    "hi, which services do you offer?",
+    "what slots are free on {date}?",
+    "and on {date} in the afternoon?",
+    "what does a consultation cost?",
+    "thanks, can you repeat the free slots for {date}?",
+    "ok, that's all for now",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))] if ordered else 0.0
+
+
+def timed(timings, name, fn):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[name].append((time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+def run_backend(backend, args):
+    from llama_index.core.llms import MessageRole
+    from src.agent_controller import AgentController
+
+    os.environ["SESSION_STORE"] = backend
+    replicas = [AgentController(), AgentController()]
+    timings = defaultdict(list)
+    seen = []
+    for replica in replicas:
+        pool = replica.sessions
+        hydrate = timed(timings, "hydrate", pool.hydrate)
+
+        def checked(session, hydrate=hydrate):
+            hydrate(session)
+            users = sum(1 for m in session.agent.memory.get_all() if m.role == MessageRole.USER)
+            seen.append((session.session_id, users))
+        pool.hydrate = checked
+        pool.persist = timed(timings, "persist", pool.persist)
+
+    expected = defaultdict(int)
+    continuous = 0
+    prefix = f"{backend}-{time.time_ns()}"
+    for turn in range(args.turns):
+        started_round = time.perf_counter()
+        for i in range(args.sessions):
+            session_id = f"{prefix}-{i}"
+            query = QUERIES[turn % len(QUERIES)].format(date=f"2030-03-{i % 20 + 1:02d}")
+            replica = replicas[(turn + i) % 2]
+            started = time.perf_counter()
+            replica.chat(query, session_id)
+            timings["turn"].append((time.perf_counter() - started) * 1000)
+            _, users = seen[-1]
+            # Without a store the other replica starts from scratch.
+            continuous += users >= expected[session_id]
+            expected[session_id] += 1
+        remaining = args.think_ms / 1000 - (time.perf_counter() - started_round)
+        if remaining > 0:
+            time.sleep(remaining)
+    for replica in replicas:
+        replica.sessions.flush()
+
+    total = args.sessions * args.turns
+    line = f"{backend:6s}: continuity {continuous}/{total}"
+    for name in ("hydrate", "persist", "turn"):
+        values = timings[name]
+        line += f"  {name} p50={percentile(values, 50):.2f}ms p95={percentile(values, 95):.2f}ms"
+        if name != "turn":
+            line += f" ({statistics.mean(values) * len(values) / max(1, len(timings['turn'])):.2f}ms/turn)"
+    print(line)
+    return replicas, prefix
+
+
+def report_sizes(replica, prefix, sessions):
+    from src.conversation_store import encode_message
+    binary = json_size = count = 0
+    for i in range(sessions):
+        session = replica.sessions.get(f"{prefix}-{i}")
+        for message in session.agent.memory.get_all():
+            binary += len(encode_message(message))
+            json_size += len(message.model_dump_json().encode("utf-8"))
+            count += 1
+    print(f"stored messages: {count}, binary {binary / count:.0f} B/message vs JSON {json_size / count:.0f} B/message "
+          f"({json_size / binary:.1f}x smaller)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--think-ms", type=float, default=50, help="minimum time between turns of one conversation")
+    parser.add_argument("--sync-writes", action="store_true", help="SESSION_STORE_WRITE_BEHIND=false")
+    parser.add_argument("--llm-latency-ms", type=float, default=5)
+    parser.add_argument("--port", type=int, default=18091)
+    parser.add_argument("--redis-port", type=int, default=16399)
+    args = parser.parse_args()
+
+    import fake_llm_server
+    import fake_redis
+    llm = fake_llm_server.start(args.port, latency_ms=args.llm_latency_ms)
+    redis = fake_redis.start(args.redis_port)
+    os.environ.update(
+        GROQ_API_BASE=f"http://127.0.0.1:{args.port}/v1",
+        INTENT_ROUTER_ENABLED="false",
+        AGENT_SELECT_TOOLS="false",
+        SESSION_STORE_PATH=os.path.join(tempfile.mkdtemp(prefix="session-store-bench-"), "sessions.db"),
+        SESSION_STORE_URL=f"redis://127.0.0.1:{args.redis_port}/0",
+        SESSION_STORE_WRITE_BEHIND="false" if args.sync_writes else "true",
+        FAQ_INDEX_DIR=tempfile.mkdtemp(prefix="faq-index-bench-"),
+    )
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+    os.environ.pop("FAQ_CACHE_PATH", None)
+
+    import calendar_service
+    from fake_calendar import FakeCalendarService
+    calendar_service.set_calendar_service(FakeCalendarService(latency_ms=1))
+    from fake_embedding import HashingEmbedding
+    from src import faq_pdf_tool
+    faq_pdf_tool.embed_model.factory = lambda: HashingEmbedding(embed_dim=384)
+    faq_pdf_tool.query_faq_pdf("What services do you offer?")  # builds the index outside the timings
+
+    print(f"{args.sessions} conversations x {args.turns} turns, alternating between two replicas, "
+          f"{'synchronous writes' if args.sync_writes else 'write-behind'}")
+    for backend in ("none", "sqlite", "redis"):
+        replicas, prefix = run_backend(backend, args)
+    report_sizes(replicas[0], prefix, args.sessions)
+    llm.shutdown()
+    redis.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: slot generation, legacy nested loop vs. SlotEngine sweep.
+
+The legacy loop is the one get_calendar_availability used before the slot
+engine: for every 30-minute step it scanned every busy interval. Both are run
+day by day over the same random calendar and must return identical slots.
+
+Usage:
+    python benchmarks/bench_slot_engine.py [--events 5000] [--weeks 26]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.slot_engine import SlotEngine  # noqa: E402
+
+
+def random_events(n, first_day, days, seed=7):
+    rng = random.Random(seed)
+    start = pytz.UTC.localize(datetime.combine(first_day, datetime.min.time()))
+    events = []
+    for _ in range(n):
+        begin = start + timedelta(minutes=15 * rng.randrange(days * 96))
+        events.append((begin, begin + timedelta(minutes=15 * rng.randint(1, 4))))
+    # events().list(orderBy="startTime") returns events in start order.
+    return sorted(events)
+
+
+def legacy_slots(busy_intervals, day, duration_minutes):
+    current_time = pytz.UTC.localize(datetime.combine(day, datetime.strptime("08:00", "%H:%M").time()))
+    end_of_day = pytz.UTC.localize(datetime.combine(day, datetime.strptime("18:00", "%H:%M").time()))
+    slot_duration = timedelta(minutes=duration_minutes)
+    slots = []
+    while current_time + slot_duration <= end_of_day:
+        slot_end = current_time + slot_duration
+        if all(slot_end <= b_start or current_time >= b_end for b_start, b_end in busy_intervals):
+            slots.append((current_time, slot_end))
+        current_time += timedelta(minutes=30)
+    return slots
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--weeks", type=int, default=26)
+    parser.add_argument("--duration", type=int, default=60)
+    args = parser.parse_args()
+
+    first_day = date(2025, 9, 1)
+    days = args.weeks * 7
+    last_day = first_day + timedelta(days=days - 1)
+    events = random_events(args.events, first_day, days)
+    engine = SlotEngine()
+
+    # The legacy tool fetched one day at a time, so it only scanned that day's events.
+    by_day = {first_day + timedelta(days=i): [] for i in range(days)}
+    for event in events:
+        by_day[event[0].date()].append(event)
+        if event[1].date() != event[0].date() and event[1].date() in by_day:
+            by_day[event[1].date()].append(event)
+
+    started = time.perf_counter()
+    legacy = {day: legacy_slots(day_events, day, args.duration) for day, day_events in by_day.items()}
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    swept = engine.slots(events, first_day, last_day, args.duration)
+    sweep_seconds = time.perf_counter() - started
+
+    assert swept == legacy, "slot engine disagrees with the legacy loop"
+    total = sum(len(s) for s in swept.values())
+    print(f"events={args.events} days={days} slots={total}")
+    print(f"legacy nested loop : {legacy_seconds * 1000:9.1f} ms")
+    print(f"slot engine sweep  : {sweep_seconds * 1000:9.1f} ms  ({legacy_seconds / sweep_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Offline evaluation: FAQ retrieval quality (recall@k) and latency per retrieval mode.
+
+Each line of benchmarks/faq_eval.jsonl holds a question and a short passage
+that the right chunk contains. A question counts as recalled at k when one
+of the top-k retrieved chunks contains that passage (whitespace and case
+normalized). The PDFs in src/faqs/ are chunked with --chunk-size so the
+eval can be made harder than the production chunking.
+
+Modes: bm25, vector, hybrid (RRF of both) and, with --rerank-model,
+hybrid+rerank. With --e2e the production FAQ tool retrieval is timed as
+well; with FAQ_ANSWER_MODE=synthesize that is the query engine (retrieval
+plus LLM synthesis), which needs GROQ_API_KEY.
+
+Usage:
+    python benchmarks/eval_faq_retrieval.py [--k 1 2 5] [--chunk-size 128] [--modes bm25 hybrid]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llama_index.core import VectorStoreIndex  # noqa: E402
+from llama_index.core.node_parser import SentenceSplitter  # noqa: E402
+from llama_index.core.schema import QueryBundle, TextNode  # noqa: E402
+
+from src.embedding_pipeline import build_embed_model, parse_pdfs  # noqa: E402
+from src.faq_pdf_tool import EMBED_BACKEND, EMBED_MODEL_NAME, FAQ_DIR  # noqa: E402
+from src.hybrid_retriever import HybridRetriever, build_reranker  # noqa: E402
+
+EVAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq_eval.jsonl")
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def load_nodes(chunk_size):
+    paths = sorted(os.path.join(FAQ_DIR, n) for n in os.listdir(FAQ_DIR) if n.lower().endswith(".pdf"))
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=min(20, chunk_size // 8))
+    nodes = []
+    for path, records in parse_pdfs(paths).items():
+        for record in records:
+            for i, piece in enumerate(splitter.split_text(record["text"])):
+                nodes.append(TextNode(id_=f"{os.path.basename(path)}#{len(nodes)}-{i}", text=piece, metadata=record["metadata"]))
+    return nodes
+
+
+def evaluate(name, retrieve, cases, ks):
+    hits = {k: 0 for k in ks}
+    latencies = []
+    for case in cases:
+        started = time.perf_counter()
+        results = retrieve(case["question"])
+        latencies.append((time.perf_counter() - started) * 1000)
+        texts = [normalize(r.node.get_content()) for r in results]
+        expected = normalize(case["expected"])
+        for k in ks:
+            if any(expected in text for text in texts[:k]):
+                hits[k] += 1
+    recall = "  ".join(f"R@{k}={hits[k] / len(cases):.2f}" for k in ks)
+    p95 = sorted(latencies)[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{name:<15} {recall}   latency mean={statistics.mean(latencies):7.2f}ms p95={p95:7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 5])
+    parser.add_argument("--chunk-size", type=int, default=128)
+    parser.add_argument("--modes", nargs="+", default=["bm25", "vector", "hybrid"])
+    parser.add_argument("--rerank-model", default="")
+    parser.add_argument("--e2e", action="store_true")
+    args = parser.parse_args()
+
+    with open(EVAL_FILE, "r", encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    nodes = load_nodes(args.chunk_size)
+    depth = max(args.k)
+    print(f"{len(cases)} questions, {len(nodes)} chunks (chunk size {args.chunk_size})")
+
+    vector_retriever = None
+    if {"vector", "hybrid"} & set(args.modes) or args.rerank_model or args.e2e:
+        embed_model = build_embed_model(EMBED_MODEL_NAME, EMBED_BACKEND)
+        index = VectorStoreIndex(nodes=nodes, embed_model=embed_model)
+        vector_retriever = index.as_retriever(similarity_top_k=max(depth, 10))
+
+    hybrid = HybridRetriever(vector_retriever, nodes, top_k=depth, candidates=max(depth, 10))
+    if "bm25" in args.modes:
+        evaluate("bm25", lambda q: hybrid.bm25_retrieve(q, depth), cases, args.k)
+    if "vector" in args.modes:
+        evaluate("vector", lambda q: vector_retriever.retrieve(q)[:depth], cases, args.k)
+    if "hybrid" in args.modes:
+        evaluate("hybrid", hybrid.retrieve, cases, args.k)
+    if args.rerank_model:
+        reranker = build_reranker(args.rerank_model, depth)
+        wide = HybridRetriever(vector_retriever, nodes, top_k=10, candidates=10)
+
+        def reranked(question):
+            return reranker.postprocess_nodes(wide.retrieve(question), query_bundle=QueryBundle(question))
+
+        evaluate("hybrid+rerank", reranked, cases, args.k)
+    if args.e2e:
+        from src.faq_pdf_tool import faq_query_engine, retrieve_passages
+        if faq_query_engine is not None:
+            engine = faq_query_engine.get()
+            evaluate("e2e (engine)", lambda q: engine.query(q).source_nodes, cases, args.k)
+        else:
+            evaluate("e2e (passages)", lambda q: retrieve_passages(QueryBundle(q)), cases, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+In-process stand-in for the Google Calendar API service.
+
+Implements the calls the app makes (events().list, events().insert,
+events().get and freebusy().query, each ending in .execute()) over an
+in-memory event list seeded with random busy blocks, with a configurable
+per-call latency. Inserts honour client-supplied event ids (a duplicate id
+is a 409, like the real API), and failures can be injected: random 429/503
+responses, and inserts whose response is lost after the event was stored.
+Install it with calendar_service.set_calendar_service(FakeCalendarService()).
+"""
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import httplib2
+import pytz
+from googleapiclient.errors import HttpError
+
+
+class _Request:
+    def __init__(self, service, fn):
+        self.service = service
+        self.fn = fn
+
+    def execute(self):
+        self.service._call_started()
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        self.service._maybe_fail()
+        return self.fn()
+
+
+def _http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b'{"error": {"message": "injected"}}')
+
+
+class _Events:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, calendarId, timeMin, timeMax, pageToken=None, **kwargs):
+        return _Request(self.service, lambda: {"items": self.service.events_between(calendarId, timeMin, timeMax)})
+
+    def insert(self, calendarId, body, conferenceDataVersion=0, **kwargs):
+        def insert():
+            event = {**body, "id": body.get("id") or uuid.uuid4().hex}
+            event.pop("conferenceData", None)
+            if conferenceDataVersion:
+                event["conferenceData"] = {
+                    "entryPoints": [{"entryPointType": "video", "uri": f"https://meet.google.com/fake-{event['id'][:10]}"}]
+                }
+            with self.service.lock:
+                events = self.service.calendars.setdefault(calendarId, [])
+                if any(e["id"] == event["id"] for e in events):
+                    raise _http_error(409)
+                events.append(event)
+                self.service.inserted += 1
+            if self.service.lost_response_rate and self.service.rng.random() < self.service.lost_response_rate:
+                raise _http_error(503)
+            return event
+        return _Request(self.service, insert)
+
+    def get(self, calendarId, eventId, **kwargs):
+        def get():
+            with self.service.lock:
+                for event in self.service.calendars.get(calendarId, []):
+                    if event["id"] == eventId:
+                        return event
+            raise _http_error(404)
+        return _Request(self.service, get)
+
+
+class _FreeBusy:
+    def __init__(self, service):
+        self.service = service
+
+    def query(self, body):
+        def query():
+            return {
+                "calendars": {
+                    item["id"]: {
+                        "busy": [
+                            {"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]}
+                            for e in self.service.events_between(item["id"], body["timeMin"], body["timeMax"])
+                            # Like the real API: "show as available" and declined events are not busy.
+                            if e.get("transparency") != "transparent"
+                            and not any(a.get("self") and a.get("responseStatus") == "declined" for a in e.get("attendees", ()))
+                        ]
+                    }
+                    for item in body["items"]
+                }
+            }
+        return _Request(self.service, query)
+
+
+class FakeCalendarService:
+    """
+    Calendar service double with seeded busy blocks and simulated latency.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, busy_per_day: int = 4, days: int = 120, seed: int = 7,
+                 error_rate: float = 0.0, lost_response_rate: float = 0.0):
+        """
+        Args:
+            latency_ms (float): Added to every execute() call.
+            busy_per_day (int): Random 15-60 minute events per day on the "primary" calendar.
+            days (int): Days from today that are seeded.
+            seed (int): Random seed, so runs are comparable.
+            error_rate (float): Fraction of calls answered with a 429 or 503 instead.
+            lost_response_rate (float): Fraction of successful inserts that still raise a 503.
+        """
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.lost_response_rate = lost_response_rate
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.inserted = 0
+        self.failures = 0
+        self.calendars = {"primary": []}
+        rng = random.Random(seed)
+        self.rng = random.Random(seed + 1)
+        today = datetime.now(pytz.UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+        for day in range(days):
+            for _ in range(busy_per_day):
+                start = today + timedelta(days=day, hours=8, minutes=15 * rng.randrange(40))
+                end = start + timedelta(minutes=15 * rng.randint(1, 4))
+                self.calendars["primary"].append({
+                    "id": uuid.uuid4().hex,
+                    "summary": "busy",
+                    "start": {"dateTime": start.isoformat()},
+                    "end": {"dateTime": end.isoformat()},
+                })
+
+    def _call_started(self):
+        with self.lock:
+            self.calls += 1
+
+    def _maybe_fail(self):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            with self.lock:
+                self.failures += 1
+            raise _http_error(self.rng.choice((429, 503)))
+
+    def events_between(self, calendar_id, time_min, time_max):
+        start, end = _parse(time_min), _parse(time_max)
+        with self.lock:
+            events = list(self.calendars.get(calendar_id, []))
+        selected = [e for e in events if _parse(e["end"]["dateTime"]) > start and _parse(e["start"]["dateTime"]) < end]
+        return sorted(selected, key=lambda e: _parse(e["start"]["dateTime"]))
+
+    def events(self):
+        return _Events(self)
+
+    def freebusy(self):
+        return _FreeBusy(self)
+
+
+def _parse(value):
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else pytz.UTC.localize(parsed)
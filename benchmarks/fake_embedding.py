@@ -0,0 +1,47 @@
+"""
+Offline embedding model for benchmarks: hashed bag of words, no model download.
+
+Unlike llama-index's MockEmbedding (the same vector for every text), texts
+sharing words get similar vectors, so the semantic cache, curated-answer
+matching and vector retrieval see a realistic mix of hits and misses.
+"""
+import hashlib
+import math
+import re
+from typing import Any, List
+
+from llama_index.core.embeddings import BaseEmbedding
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedding(BaseEmbedding):
+    embed_dim: int = 384
+
+    def __init__(self, embed_dim: int = 384, **kwargs: Any) -> None:
+        super().__init__(embed_dim=embed_dim, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.embed_dim
+        for word in WORD_RE.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.embed_dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
@@ -0,0 +1,262 @@
+"""
+Local OpenAI/Groq-compatible chat completions server with scripted replies.
+
+Point the app at it with GROQ_API_BASE=http://127.0.0.1:<port>/v1. The last
+user message is matched against a script of rules; a matching rule answers
+with a tool call (only if that tool was offered in the request), and once
+the tool result comes back the model replies with text in the app's
+"Answer: ... / - Tool Used: ... / - Reasoning: ..." format. Streaming,
+usage reporting, latency (fixed + jitter + per streamed token),
+injected 429s and per-model requests/tokens-per-minute limits (answered
+with 429 and retry-after, like the provider) are supported.
+
+The default script covers availability, booking and FAQ questions; pass
+--script with a JSON list of {"match": regex, "tool": name, "arguments": {...}}
+rules to replace it. A rule with "calls": [{"tool": ..., "arguments": ...}, ...]
+instead asks for several tools in one response (those offered). Argument
+values may use {date}, {date+N}, {time} and {text}, filled in from the user
+message.
+
+Usage:
+    python benchmarks/fake_llm_server.py [--port 18080] [--latency-ms 300] [--jitter-ms 100] [--rpm 30] [--tpm 6000]
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DATE_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+TIME_RE = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)\b")
+DATE_OFFSET_RE = re.compile(r"\{date\+(\d+)\}")
+
+DEFAULT_SCRIPT = [
+    {"match": r"\b(book|schedule)\b", "tool": "schedule_google_meet",
+     "arguments": {"date": "{date}", "time": "{time}", "subject": "Product demo"}},
+    {"match": r"\bthis week\b|\bnext week\b", "tool": "get_multi_day_availability",
+     "arguments": {"start_date": "{date}", "end_date": "{date+6}"}},
+    {"match": r"\b(free|available|availability|slots?|open)\b", "tool": "get_formatted_availability",
+     "arguments": {"date": "{date}"}},
+    {"match": r"\?|\b(refund|shipping|order|policy|price|return)\b", "tool": "faq_pdf_tool",
+     "arguments": {"question": "{text}"}},
+]
+
+
+class Script:
+    """
+    Decides the reply to a chat completion request.
+    """
+
+    def __init__(self, rules):
+        self.rules = [
+            (re.compile(rule["match"], re.IGNORECASE), rule.get("calls") or [{"tool": rule["tool"], "arguments": rule["arguments"]}])
+            for rule in rules
+        ]
+
+    @staticmethod
+    def _fill(value, text):
+        found = DATE_RE.search(text)
+        day = date.fromisoformat(found.group(0)) if found else date.today() + timedelta(days=1)
+        time_found = TIME_RE.search(text)
+        value = DATE_OFFSET_RE.sub(lambda m: (day + timedelta(days=int(m.group(1)))).isoformat(), value)
+        return (
+            value.replace("{date}", day.isoformat())
+            .replace("{time}", f"{int(time_found.group(1)):02d}:{time_found.group(2)}" if time_found else "10:00")
+            .replace("{text}", text)
+        )
+
+    def reply(self, body):
+        """
+        Returns (content, tool_calls) for a request body.
+        """
+        messages = body.get("messages", [])
+        last = messages[-1] if messages else {"role": "user", "content": ""}
+        offered = {tool["function"]["name"] for tool in body.get("tools") or []}
+        if last.get("role") == "tool":
+            result = str(last.get("content", ""))[:200].replace("\n", " ")
+            return f"Answer: Here is what I found: {result}\n- Tool Used: lookup\n- Reasoning: Scripted reply.", None
+        text = str(last.get("content") or "")
+        for pattern, calls in self.rules:
+            if not pattern.search(text):
+                continue
+            tool_calls = []
+            for call in calls:
+                if call["tool"] not in offered:
+                    continue
+                filled = {key: self._fill(value, text) if isinstance(value, str) else value for key, value in call["arguments"].items()}
+                tool_calls.append({"id": f"call_{random.getrandbits(32):08x}", "type": "function",
+                                   "function": {"name": call["tool"], "arguments": json.dumps(filled)}})
+            if tool_calls:
+                return None, tool_calls
+        return "Answer: Happy to help with our services, FAQs or a meeting.\n- Tool Used: none\n- Reasoning: Scripted reply.", None
+
+
+class RateLimits:
+    """
+    Per-model requests and tokens per minute (0: no limit), replenished
+    continuously like the provider's limits: each budget holds one
+    minute's worth and refills at that rate.
+    """
+
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def admit(self, model, tokens):
+        """
+        Charges the call and returns None, or returns the seconds until it would fit.
+        """
+        if not self.rpm and not self.tpm:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            requests, used_tokens, updated = self.models.get(model, (self.rpm, self.tpm, now))
+            requests = min(self.rpm, requests + (now - updated) * self.rpm / 60)
+            used_tokens = min(self.tpm, used_tokens + (now - updated) * self.tpm / 60)
+            wait = 0.0
+            if self.rpm and requests < 1:
+                wait = (1 - requests) * 60 / self.rpm
+            if self.tpm and used_tokens < min(tokens, self.tpm):
+                wait = max(wait, (min(tokens, self.tpm) - used_tokens) * 60 / self.tpm)
+            if wait == 0:
+                requests -= 1 if self.rpm else 0
+                used_tokens -= min(tokens, self.tpm) if self.tpm else 0
+            self.models[model] = (requests, used_tokens, now)
+            return wait or None
+
+
+def make_handler(script, latency, jitter, token_delay, error_rate, limits=None, stats=None):
+    limits = limits or RateLimits()
+    stats = stats if stats is not None else Counter()
+    stats_lock = threading.Lock()
+
+    def count(key, amount=1):
+        with stats_lock:
+            stats[key] += amount
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+            count("requests")
+            if error_rate and random.random() < error_rate:
+                count("rate_limited")
+                self._json(429, {"error": {"message": "rate limit (injected)", "type": "rate_limit_exceeded"}})
+                return
+            content, tool_calls = script.reply(body)
+            prompt_tokens = len(json.dumps(body.get("messages", []))) // 4 + len(json.dumps(body.get("tools") or [])) // 4
+            completion_tokens = len(content or json.dumps(tool_calls)) // 4
+            model = body.get("model", "fake")
+            retry_after = limits.admit(model, prompt_tokens + completion_tokens)
+            if retry_after is not None:
+                count("rate_limited")
+                self._json(429, {"error": {"message": f"Rate limit reached for model `{model}`",
+                                           "type": "tokens", "code": "rate_limit_exceeded"}},
+                           {"retry-after": str(max(1, math.ceil(retry_after)))})
+                return
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+            count("completed")
+            count("tokens", prompt_tokens + completion_tokens)
+            if body.get("stream"):
+                self._stream(model, content, tool_calls)
+                return
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            self._json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        def _stream(self, model, content, tool_calls):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            def send(delta, finish=None):
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+
+            if tool_calls:
+                send({"role": "assistant", "tool_calls": [{"index": i, **call} for i, call in enumerate(tool_calls)]})
+                send({}, "tool_calls")
+            else:
+                send({"role": "assistant", "content": ""})
+                for word in content.split(" "):
+                    send({"content": word + " "})
+                    if token_delay:
+                        time.sleep(token_delay)
+                send({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return Handler
+
+
+def start(port=18080, latency_ms=0.0, jitter_ms=0.0, token_delay_ms=0.0, error_rate=0.0, rules=None, rpm=0, tpm=0):
+    """
+    Starts the server on a daemon thread and returns it (call .shutdown() to stop).
+
+    `server.stats` counts requests, completed calls, 429s and tokens served.
+    """
+    stats = Counter()
+    handler = make_handler(Script(rules or DEFAULT_SCRIPT), latency_ms / 1000, jitter_ms / 1000, token_delay_ms / 1000,
+                           error_rate, RateLimits(rpm, tpm), stats)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.stats = stats
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--token-delay-ms", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute per model (0: unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute per model (0: unlimited)")
+    parser.add_argument("--script", help="JSON file with a list of rules")
+    args = parser.parse_args()
+    rules = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+    start(args.port, args.latency_ms, args.jitter_ms, args.token_delay_ms, args.error_rate, rules, args.rpm, args.tpm)
+    print(f"fake LLM server on http://127.0.0.1:{args.port}/v1", flush=True)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Local stand-in for a Redis server, speaking the Redis wire protocol (RESP2).
+
+Implements the commands the session store uses (GET, SET [EX], INCR,
+RPUSH, LRANGE, LTRIM, EXPIRE, DEL, MULTI/EXEC) plus PING, AUTH, SELECT and FLUSHALL,
+over in-memory dicts. Point the app at it with SESSION_STORE=redis
+SESSION_STORE_URL=redis://127.0.0.1:<port>/0; several app processes can
+share it to try out stateless replicas without installing Redis.
+
+Usage:
+    python benchmarks/fake_redis.py [--port 6399]
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class Data:
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+        self.lock = threading.RLock()
+
+    def _live(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return self.values.get(key)
+
+    def transaction(self, commands):
+        with self.lock:
+            return [self.command(name, args) for name, args in commands]
+
+    def command(self, name, args):
+        with self.lock:
+            if name == "PING":
+                return "PONG"
+            if name in ("AUTH", "SELECT"):
+                return "OK"
+            if name == "FLUSHALL":
+                self.values.clear()
+                self.expires.clear()
+                return "OK"
+            if name == "GET":
+                value = self._live(args[0])
+                return value if value is None or isinstance(value, bytes) else WrongType()
+            if name == "SET":
+                self.values[args[0]] = args[1]
+                self.expires.pop(args[0], None)
+                if len(args) >= 4 and args[2].upper() == b"EX":
+                    self.expires[args[0]] = time.monotonic() + int(args[3])
+                return "OK"
+            if name == "INCR":
+                value = int(self._live(args[0]) or 0) + 1
+                self.values[args[0]] = str(value).encode()
+                return value
+            if name == "RPUSH":
+                items = self._live(args[0])
+                if items is None:
+                    items = self.values[args[0]] = []
+                items.extend(args[1:])
+                return len(items)
+            if name in ("LRANGE", "LTRIM"):
+                items = self._live(args[0]) or []
+                start, stop = int(args[1]), int(args[2])
+                start = max(0, start + len(items) if start < 0 else start)
+                stop = stop + len(items) if stop < 0 else stop
+                selected = items[start:stop + 1]
+                if name == "LRANGE":
+                    return selected
+                if args[0] in self.values:
+                    self.values[args[0]] = selected
+                return "OK"
+            if name == "EXPIRE":
+                if self._live(args[0]) is None:
+                    return 0
+                self.expires[args[0]] = time.monotonic() + int(args[1])
+                return 1
+            if name == "DEL":
+                removed = 0
+                for key in args:
+                    if self._live(key) is not None:
+                        removed += 1
+                    self.values.pop(key, None)
+                    self.expires.pop(key, None)
+                return removed
+            return Error(f"ERR unknown command '{name}'")
+
+
+class Error(str):
+    pass
+
+
+class WrongType(Error):
+    def __new__(cls):
+        return super().__new__(cls, "WRONGTYPE Operation against a key holding the wrong kind of value")
+
+
+def encode(value):
+    if isinstance(value, Error):
+        return b"-" + value.encode() + b"\r\n"
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+
+
+def make_handler(data):
+    class Handler(socketserver.StreamRequestHandler):
+        # Pipelined replies are written one by one; Nagle would hold them back.
+        disable_nagle_algorithm = True
+
+        def _read_command(self):
+            line = self.rfile.readline()
+            if not line:
+                return None
+            if not line.startswith(b"*"):
+                return line.split()  # inline command, e.g. from telnet
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            return args
+
+        def handle(self):
+            queued = None  # commands between MULTI and EXEC
+            while True:
+                args = self._read_command()
+                if args is None:
+                    return
+                if not args:
+                    continue
+                name = args[0].decode().upper()
+                if name == "MULTI":
+                    queued, reply = [], "OK"
+                elif name == "EXEC":
+                    reply = Error("ERR EXEC without MULTI") if queued is None else data.transaction(queued)
+                    queued = None
+                elif name == "DISCARD":
+                    queued, reply = None, "OK"
+                elif queued is not None:
+                    queued.append((name, args[1:]))
+                    reply = "QUEUED"
+                else:
+                    reply = data.command(name, args[1:])
+                self.wfile.write(encode(reply))
+
+    return Handler
+
+
+def start(port=6399):
+    """
+    Starts the server on a daemon thread and returns it (call .shutdown() to stop).
+    """
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), make_handler(Data()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+    start(args.port)
+    print(f"fake redis on redis://127.0.0.1:{args.port}/0", flush=True)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Load generator: latency percentiles, throughput and memory, fully offline.
+
+Targets:
+    chat      POST /chat against the app. Unless --url is given, starts the
+              fake LLM server and benchmarks/serve_offline.py (fake
+              calendar, hashing embeddings) as subprocesses and waits for
+              /ready. Memory is the server process's RSS and peak RSS.
+    faq       query_faq_pdf() in this process, over the questions in
+              benchmarks/faq_eval.jsonl (HashingEmbedding unless --embed).
+    calendar  get_calendar_availability() in this process against
+              FakeCalendarService, over the next 30 days.
+
+Each of --concurrency workers sends requests back to back until
+--requests have been sent. Reports p50/p95/p99/mean latency, req/s,
+errors and memory; --json-out appends the result as one JSON line so runs
+can be compared for regressions.
+
+Usage:
+    python benchmarks/load_test.py --target chat --requests 200 --concurrency 16 [--stream]
+    python benchmarks/load_test.py --target faq --requests 500 --concurrency 4 --no-cache
+    python benchmarks/load_test.py --target calendar --requests 2000 --concurrency 8 --calendar-latency-ms 50
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+# Per-request debug logs would dominate the in-process measurements.
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+CHAT_QUERIES = [
+    "hi!",
+    "What slots are free on {date}?",
+    "What is your refund policy?",
+    "How long does shipping take?",
+    "What is free next week?",
+    "Schedule a meeting on {date} at 14:00 about product demos",
+    "Can I change my order after placing it?",
+    "What services do you offer?",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    # Nearest-rank percentile.
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def rss_mb(pid="self"):
+    # (current RSS, peak RSS) in MB, from /proc.
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                key, amount, _ = line.split()
+                values[key] = int(amount) / 1024
+    return values.get("VmRSS:", 0.0), values.get("VmHWM:", 0.0)
+
+
+def run_load(call, requests, concurrency):
+    """
+    Runs call(i) `requests` times on `concurrency` closed-loop workers.
+
+    Returns (latencies in ms, errors, elapsed seconds, extra per-request values).
+    """
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    latencies, extras, errors = [], [], []
+
+    def worker(worker_id):
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            try:
+                extra = call(i, worker_id)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                continue
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if extra is not None:
+                    extras.append(extra)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return latencies, errors, time.perf_counter() - started, extras
+
+
+def _dates(n=30):
+    first = date.today() + timedelta(days=1)
+    return [(first + timedelta(days=i)).isoformat() for i in range(n)]
+
+
+def _wait_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def chat_target(args):
+    processes = []
+    url = args.url
+    try:
+        if not url:
+            llm_port, app_port = args.port + 1, args.port
+            processes.append(subprocess.Popen([
+                sys.executable, os.path.join(BENCH_DIR, "fake_llm_server.py"), "--port", str(llm_port),
+                "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms),
+                "--error-rate", str(args.llm_error_rate),
+            ]))
+            env = dict(os.environ)
+            if args.no_router:
+                env["INTENT_ROUTER_ENABLED"] = "false"
+            processes.append(subprocess.Popen([
+                sys.executable, os.path.join(BENCH_DIR, "serve_offline.py"), "--port", str(app_port),
+                "--llm-url", f"http://127.0.0.1:{llm_port}/v1", "--calendar-latency-ms", str(args.calendar_latency_ms),
+            ], env=env))
+            url = f"http://127.0.0.1:{app_port}"
+        _wait_ready(url, args.ready_timeout)
+        dates = _dates()
+
+        def call(i, worker_id):
+            query = CHAT_QUERIES[i % len(CHAT_QUERIES)].format(date=dates[i % len(dates)])
+            body = {"query": query, "session_id": f"load-{worker_id}", "stream": args.stream}
+            request = urllib.request.Request(
+                f"{url}/chat", data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}
+            )
+            started = time.perf_counter()
+            with urllib.request.urlopen(request, timeout=120) as response:
+                if not args.stream:
+                    response.read()
+                    return None
+                first_token = None
+                for line in response:
+                    if first_token is None and line.startswith(b"event: token"):
+                        first_token = (time.perf_counter() - started) * 1000
+                    if line.startswith(b"event: error"):
+                        raise RuntimeError("stream ended with an error event")
+                return first_token
+
+        result = run_load(call, args.requests, args.concurrency)
+        memory = rss_mb(processes[-1].pid) if processes else (None, None)
+        return result, memory
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+
+def faq_target(args):
+    if args.embed == "hashing":
+        os.environ["FAQ_INDEX_DIR"] = tempfile.mkdtemp(prefix="faq-index-bench-")
+    else:
+        os.environ["FAQ_EMBED_BACKEND"] = args.embed
+    if args.no_cache:
+        os.environ["FAQ_CACHE_THRESHOLD"] = "2"  # cosine never exceeds 1: every lookup misses
+    os.environ.pop("FAQ_CACHE_PATH", None)
+    from src import faq_pdf_tool
+    if args.embed == "hashing":
+        from fake_embedding import HashingEmbedding
+        faq_pdf_tool.embed_model.factory = lambda: HashingEmbedding(embed_dim=384)
+    with open(os.path.join(BENCH_DIR, "faq_eval.jsonl"), "r", encoding="utf-8") as f:
+        questions = [json.loads(line)["question"] for line in f if line.strip()]
+    faq_pdf_tool.query_faq_pdf(questions[0])  # builds the index, models and caches
+    result = run_load(lambda i, _: faq_pdf_tool.query_faq_pdf(questions[i % len(questions)]) and None,
+                      args.requests, args.concurrency)
+    return result, rss_mb()
+
+
+def calendar_target(args):
+    os.environ["FREEBUSY_CACHE_TTL_SECONDS"] = str(args.calendar_cache_ttl)
+    import calendar_service
+    from fake_calendar import FakeCalendarService
+    service = FakeCalendarService(latency_ms=args.calendar_latency_ms)
+    calendar_service.set_calendar_service(service)
+    from src.tools import get_calendar_availability
+    dates = _dates()
+
+    def call(i, _):
+        if get_calendar_availability(dates[i % len(dates)]) is None:
+            raise RuntimeError("no result")
+
+    result = run_load(call, args.requests, args.concurrency)
+    print(f"calendar API calls: {service.calls}")
+    return result, rss_mb()
+
+
+TARGETS = {"chat": chat_target, "faq": faq_target, "calendar": calendar_target}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=sorted(TARGETS), required=True)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--url", help="chat: an already running app instead of the offline one")
+    parser.add_argument("--port", type=int, default=3390, help="chat: app port (the fake LLM uses port + 1)")
+    parser.add_argument("--stream", action="store_true", help="chat: request SSE and report time to first token")
+    parser.add_argument("--no-router", action="store_true", help="chat: send every turn to the LLM agent")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--calendar-latency-ms", type=float, default=80)
+    parser.add_argument("--calendar-cache-ttl", type=float, default=60, help="calendar: busy-interval cache TTL (0 disables)")
+    parser.add_argument("--embed", choices=["hashing", "onnx", "huggingface"], default="hashing")
+    parser.add_argument("--no-cache", action="store_true", help="faq: disable semantic answer cache hits")
+    parser.add_argument("--ready-timeout", type=float, default=180)
+    parser.add_argument("--json-out", help="append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    (latencies, errors, elapsed, extras), (rss, peak) = TARGETS[args.target](args)
+    report = {
+        "target": args.target,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "req_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.mean(latencies), 2) if latencies else 0.0,
+        "rss_mb": round(rss, 1) if rss is not None else None,
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "self_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if extras:
+        report["ttft_p50_ms"] = round(percentile(extras, 50), 2)
+        report["ttft_p95_ms"] = round(percentile(extras, 95), 2)
+    print(
+        f"{args.target}: {report['ok']}/{args.requests} ok, {report['errors']} errors, {report['req_per_s']} req/s | "
+        f"p50={report['p50_ms']}ms p95={report['p95_ms']}ms p99={report['p99_ms']}ms mean={report['mean_ms']}ms | "
+        f"rss={report['rss_mb']}MB peak={report['peak_rss_mb']}MB"
+        + (f" | ttft p50={report['ttft_p50_ms']}ms p95={report['ttft_p95_ms']}ms" if extras else "")
+    )
+    if errors:
+        print(f"first errors: {errors[:3]}")
+    if args.json_out:
+        with open(args.json_out, "a", encoding="utf-8") as f:
+            f.write(json.dumps({**report, "at": time.strftime("%Y-%m-%dT%H:%M:%S")}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
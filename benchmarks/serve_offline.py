@@ -0,0 +1,58 @@
+"""
+Runs app.py with no network: LLM calls go to the fake LLM server, calendar
+calls to FakeCalendarService, and (with --embed hashing, the default) the
+FAQ index uses HashingEmbedding in a temporary index directory.
+
+The fake LLM server has to be running (benchmarks/fake_llm_server.py);
+benchmarks/load_test.py starts both for you.
+
+Usage:
+    python benchmarks/serve_offline.py [--port 3390] [--llm-url http://127.0.0.1:18080/v1]
+        [--calendar-latency-ms 80] [--embed hashing|onnx|huggingface]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=3390)
+    parser.add_argument("--llm-url", default="http://127.0.0.1:18080/v1")
+    parser.add_argument("--calendar-latency-ms", type=float, default=80)
+    parser.add_argument("--embed", choices=["hashing", "onnx", "huggingface"], default="hashing")
+    args = parser.parse_args()
+
+    os.environ["GROQ_API_BASE"] = args.llm_url
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+    if args.embed == "hashing":
+        # Never mix fake vectors into the real index store.
+        os.environ["FAQ_INDEX_DIR"] = tempfile.mkdtemp(prefix="faq-index-offline-")
+        os.environ.pop("FAQ_CACHE_PATH", None)
+    else:
+        os.environ["FAQ_EMBED_BACKEND"] = args.embed
+
+    import calendar_service
+    from fake_calendar import FakeCalendarService
+    calendar_service.set_calendar_service(FakeCalendarService(latency_ms=args.calendar_latency_ms))
+
+    if args.embed == "hashing":
+        from fake_embedding import HashingEmbedding
+        from src import faq_pdf_tool
+        faq_pdf_tool.embed_model.factory = lambda: HashingEmbedding(embed_dim=384)
+
+    # Per-request access log lines would slow the server under load.
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    # Importing the app starts the background warm-up.
+    import app
+    app.app.run(host="127.0.0.1", port=args.port, debug=False, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,43 @@
 import os
 import datetime
+import threading
+import time
+import httplib2
+import google_auth_httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
 
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
+TOKEN_FILE = "token.json"
+# Refresh the access token this long before it expires, so no request
+# ever has to wait for a refresh round trip.
+REFRESH_MARGIN = datetime.timedelta(seconds=int(os.environ.get("CALENDAR_TOKEN_REFRESH_MARGIN_SECONDS", 300)))
+HTTP_TIMEOUT = float(os.environ.get("CALENDAR_HTTP_TIMEOUT_SECONDS", 15))
 
-def get_calendar_service():
+_lock = threading.Lock()
+_service = None
+_credentials = None
+_refresher = None
+# httplib2 connections are not thread-safe, so each thread gets its own
+# authorized connection and keeps reusing it across requests.
+_local = threading.local()
+
+
+def _save_credentials(creds):
+    with open(TOKEN_FILE, "w") as token:
+        token.write(creds.to_json())
+
+
+def _load_credentials():
     creds = None
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+    if os.path.exists(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
@@ -22,8 +49,82 @@ def get_calendar_service():
             flow = InstalledAppFlow.from_client_secrets_file(creds_path, SCOPES)
             # flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
             creds = flow.run_local_server(port=0)
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-    return build("calendar", "v3", credentials=creds)
+        _save_credentials(creds)
+    return creds
+
+
+def _authorized_http():
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = google_auth_httplib2.AuthorizedHttp(_credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        _local.http = http
+    return http
+
+
+def _build_request(http, *args, **kwargs):
+    # Ignore the http the service was built with and use this thread's connection.
+    return HttpRequest(_authorized_http(), *args, **kwargs)
+
+
+def _seconds_until_refresh(creds):
+    if creds.expiry is None:
+        return REFRESH_MARGIN.total_seconds()
+    remaining = creds.expiry - datetime.datetime.utcnow() - REFRESH_MARGIN
+    return max(remaining.total_seconds(), 0)
+
+
+def _refresh_loop():
+    while True:
+        time.sleep(max(_seconds_until_refresh(_credentials), 5))
+        if not _credentials.refresh_token:
+            continue
+        try:
+            with _lock:
+                if _seconds_until_refresh(_credentials) <= 0:
+                    _credentials.refresh(Request())
+                    _save_credentials(_credentials)
+                    logger.info(f"calendar credentials refreshed, valid until {_credentials.expiry}")
+        except Exception as e:
+            # The next attempt (or AuthorizedHttp on a 401) will retry.
+            logger.warning(f"calendar credential refresh failed: {e}")
+
+
+def get_calendar_service():
+    """
+    Returns the process-wide Google Calendar service.
+
+    The service is built once (the client library ships the discovery
+    document, so later calls never parse or fetch it again), requests go
+    through a per-thread authorized HTTP connection, and a background thread
+    refreshes the access token shortly before it expires.
+    """
+    global _service, _credentials, _refresher
+    if _service is not None:
+        return _service
+    with _lock:
+        if _service is None:
+            _credentials = _load_credentials()
+            _service = build(
+                "calendar",
+                "v3",
+                http=_authorized_http(),
+                requestBuilder=_build_request,
+                cache_discovery=False,
+            )
+            if _refresher is None:
+                _refresher = threading.Thread(target=_refresh_loop, name="calendar-token-refresh", daemon=True)
+                _refresher.start()
+    return _service
+
 
+def set_calendar_service(service):
+    """
+    Makes get_calendar_service() return `service` instead of the Google client.
 
+    Used to run the app against a stand-in calendar (see
+    benchmarks/fake_calendar.py) with no credentials or network; pass None
+    to go back to building the real client on next use.
+    """
+    global _service
+    with _lock:
+        _service = service
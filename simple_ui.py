@@ -1,34 +1,65 @@
 import gradio as gr
-from src.agent_controller import AgentController
-agent_controller = AgentController()
-agent = agent_controller.get_agent()
+from src.async_runner import AsyncChatRunner, ChatOverloadedError
+from src.resources import lazy_resource, warm_up
+from src.utils.app_logger import GenericLogger
 
-def respond(message, history):
+logger = GenericLogger().get_logger()
+
+
+def _build_agent_controller():
+    # Imported lazily so the UI comes up before the LLM stack loads.
+    from src.agent_controller import AgentController
+    return AgentController()
+
+
+agent_controller = lazy_resource("agent_controller", _build_agent_controller)
+chat_runner = AsyncChatRunner()
+warm_up()
+
+def respond(message, history, request: gr.Request):
     # {"role": "user", "content": "message"}
     """
-    Function to handle user input and return a response from the agent.
+    Function to handle user input and stream a response from the agent.
 
     Args:
         message (str): The user's message.
         history (list): The chat history.
+        request (gr.Request): The Gradio request; its session hash selects the conversation.
 
-    Returns:
-        dict: A dictionary with the keys "role" and "content", where "role" is "assistant" and "content" is the response message.
+    Yields:
+        dict: A dictionary with the keys "role" and "content", where "role" is "assistant" and "content" is
+        the answer so far, followed by a progress note while a tool is running.
     """
-    response = agent.chat(message)
-    response = {"role": "assistant", "content": response.response}
-    return response    
+    controller = agent_controller.get()
+    session_id = request.session_hash
+    try:
+        events = chat_runner.stream(lambda sink: controller.astream_chat(message, sink, session_id=session_id))
+    except ChatOverloadedError:
+        yield {"role": "assistant", "content": "I'm handling a lot of conversations right now, please try again in a moment."}
+        return
+    answer, progress = "", ""
+    for event in events:
+        if event["type"] == "token":
+            answer += event["text"]
+        elif event["type"] == "tool":
+            progress = event["message"] if event["status"] == "started" else ""
+        elif event["type"] == "done":
+            answer, progress = event["result"].response, ""
+        elif event["type"] == "error":
+            answer, progress = "Sorry, something went wrong. Please try again.", ""
+        content = f"{answer}\n\n_{progress}_" if progress else answer
+        yield {"role": "assistant", "content": content}
 
-def reset_agent():
+def reset_agent(request: gr.Request):
     """
-    Resets the agent's current chat history.
+    Resets the current browser session's chat history.
 
-    This function prints the current chat history of the agent for logging purposes and
-    resets it to clear any past interactions. This is useful for starting a new conversation
-    session without any prior context.
+    This function logs which session is reset and drops its agent to clear any past
+    interactions. This is useful for starting a new conversation session without any
+    prior context.
     """
-    print("resetting agent current chat history: ", agent.chat_history)
-    agent.reset()
+    logger.info(f"resetting agent chat history for session: {request.session_hash}")
+    agent_controller.get().reset(request.session_hash)
 
 with gr.Blocks(theme=gr.themes.Default()) as demo:
     gr.Markdown("## Agentic Chatbot")
@@ -1,42 +1,104 @@
+import asyncio
+import os
+import time
 from llama_index.core.agent import FunctionCallingAgent
+from llama_index.core.chat_engine.types import AgentChatResponse
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.core.tools import FunctionTool
+from src.agent_worker import ParallelFunctionCallingAgentWorker
+from src.calendar_prefetch import bind_prefetch
 from src.generators import Generators
 from src.tools import *
 from src.utils.app_logger import GenericLogger
-from src.faq_pdf_tool import query_faq_pdf
+from src.faq_pdf_tool import embed_model, query_faq_pdf
+from src.conversation_store import open_session_store
+from src.intent_router import IntentRouter
+from src.prompt_builder import PromptBuilder, track_tokens
+from src.session_pool import DEFAULT_SESSION_ID, SessionPool, bind_session_state
+from src.streaming import bind_event_sink, emit_token, emit_tool
+from src.tracing import AgentStepSpans, span, traced
 
 logger = GenericLogger().get_logger()
 
+# Tools with side effects; never run alongside the other calls of a step.
+SEQUENTIAL_TOOLS = ("schedule_google_meet",)
+
+
+def _threaded(fn, name, progress=""):
+    """
+    Returns an async variant of a blocking tool for the agent's async path.
+
+    asyncio.to_thread copies the caller's context, so the tool still sees the
+    session state bound for the current turn. When the turn is streamed, a
+    progress event is emitted before and after the call.
+    """
+    async def _async_fn(*args, **kwargs):
+        emit_tool(name, "started", progress)
+        try:
+            with span(f"tool.{name}"):
+                return await asyncio.to_thread(fn, *args, **kwargs)
+        finally:
+            emit_tool(name, "finished")
+    return _async_fn
+
+
+def _traced(fn, name):
+    # Sync path of a tool, timed like the async one.
+    return traced(f"tool.{name}")(fn)
+
+
+def _router_embedding(text):
+    # The classifier only uses the embedding model once warm-up has loaded
+    # it; until then the router relies on its keyword rules alone.
+    return embed_model.get().get_query_embedding(text) if embed_model.ready else None
+
+
 # Create all the function tools
-greet_user_tool = FunctionTool.from_defaults(fn=greet_user_and_ask_name)
+greet_user_tool = FunctionTool.from_defaults(
+    fn=_traced(greet_user_and_ask_name, "greet_user_and_ask_name"),
+    async_fn=_threaded(greet_user_and_ask_name, "greet_user_and_ask_name"),
+)
 
 meet_tool = FunctionTool.from_defaults(
-    fn=schedule_google_meet,
+    fn=_traced(schedule_google_meet, "schedule_google_meet"),
+    async_fn=_threaded(schedule_google_meet, "schedule_google_meet", "Booking the meeting…"),
     name="schedule_google_meet",
     description="Schedule a Google Meet meeting. Provide date (YYYY-MM-DD), time (HH:MM), subject, and optionally duration. This function will automatically check if the time slot is available before scheduling."
 )
 
 # Create the FAQ tool from PDF documents
 faq_pdf_tool = FunctionTool.from_defaults(
-    fn=query_faq_pdf,
+    fn=_traced(query_faq_pdf, "faq_pdf_tool"),
+    async_fn=_threaded(query_faq_pdf, "faq_pdf_tool", "Searching the FAQ…"),
     name="faq_pdf_tool",
-    description="Answer company FAQs from PDF files."
+    description="Look up company FAQs and documents. Returns the matching FAQ answer, or the most relevant passages with their source for you to answer from."
 )
 
 availability_tool = FunctionTool.from_defaults(
-    fn=get_calendar_availability,
+    fn=_traced(get_calendar_availability, "get_calendar_availability"),
+    async_fn=_threaded(get_calendar_availability, "get_calendar_availability", "Checking availability…"),
     name="get_calendar_availability",
     description="Check available time slots for a specific date. Provide date (YYYY-MM-DD) and optional duration in minutes. Returns a list of available time slots."
 )
 
 formatted_availability_tool = FunctionTool.from_defaults(
-    fn=get_formatted_availability,
+    fn=_traced(get_formatted_availability, "get_formatted_availability"),
+    async_fn=_threaded(get_formatted_availability, "get_formatted_availability", "Checking availability…"),
     name="get_formatted_availability",
     description="Get formatted available time slots for display. Provide date (YYYY-MM-DD) and optional duration in minutes. Returns a user-friendly string with available time slots."
 )
 
+multi_day_availability_tool = FunctionTool.from_defaults(
+    fn=_traced(get_multi_day_availability, "get_multi_day_availability"),
+    async_fn=_threaded(get_multi_day_availability, "get_multi_day_availability", "Checking availability…"),
+    name="get_multi_day_availability",
+    description="Get available time slots for every day in a date range (e.g. a whole week) in one call. Provide start_date and end_date (YYYY-MM-DD) and optional duration in minutes."
+)
+
 is_available_tool = FunctionTool.from_defaults(
-    fn=is_time_slot_available,
+    fn=_traced(is_time_slot_available, "is_time_slot_available"),
+    async_fn=_threaded(is_time_slot_available, "is_time_slot_available", "Checking if that time is free…"),
     name="is_time_slot_available",
     description="Check if a specific time slot is available. Provide date (YYYY-MM-DD), time (HH:MM), and optional duration in minutes. Returns boolean indicating availability."
 )
@@ -45,24 +107,43 @@ class AgentController:
     def __init__(self):        
         """
         Initializes the AgentController class.
+
+        Each conversation gets its own agent from a bounded session pool, with
+        chat memory capped at CHAT_MEMORY_TOKEN_LIMIT tokens so the prompt size
+        per turn does not grow with the length of the conversation.
         """
         logger.info("creating AgentController")
         self.llm = Generators().get_llm()
+        self.memory_token_limit = int(os.environ.get("CHAT_MEMORY_TOKEN_LIMIT", 3000))
+        # Agent steps are traced; the console dump of every step is opt-in.
+        self.verbose = os.environ.get("AGENT_VERBOSE", "false").lower() in ("1", "true", "yes")
+        self.parallel_tools = os.environ.get("AGENT_PARALLEL_TOOLS", "true").lower() in ("1", "true", "yes")
+        # Calendar days named in the message are fetched while the LLM plans.
+        self.prefetcher = (
+            calendar_prefetcher
+            if os.environ.get("CALENDAR_PREFETCH", "true").lower() in ("1", "true", "yes")
+            else None
+        )
+        AgentStepSpans.install()
         self.system_prompt = """
                                 INSTRUCTIONS:
                                 You are an AI Support Agent for the company website. Your role is to assist clients with their questions about the company's services, products, and FAQs. 
 
                                 TOOLS:
-                                - FAQ Tool: Retrieve answers from the company FAQ documents (split into chunks).
+                                - FAQ Tool: Retrieve answers or relevant passages from the company FAQ documents; answer only from what it returns.
                                 - Meeting Scheduler: Schedule a Google Meet with the company team for clients who want more information about services or products. 
                                 - Availability Tools: Check available time slots before scheduling meetings to avoid conflicts.
                                 - Personalization Tools: Greet users, ask their names, and update stored names if needed.
 
                                 MEETING SCHEDULING WORKFLOW:
-                                1. When a user wants to schedule a meeting, FIRST check availability for their preferred date using get_formatted_availability or get_calendar_availability.
-                                2. If the user provides a specific time, use is_time_slot_available to verify it's free.
-                                3. Only use schedule_google_meet when the time slot is confirmed available.
-                                4. If a requested time is busy, show the user available alternatives using get_formatted_availability.
+                                1. Extract the date, time, and subject from the user's request.
+                                2. If the time is in 12-hour format (e.g., "9:00 AM"), convert it to 24-hour format (e.g., "09:00") before proceeding.
+                                3. FIRST check availability for their preferred date using get_formatted_availability or get_calendar_availability.
+                                4. If the user provides a specific time, use is_time_slot_available with the parsed 24-hour time to verify it's free.
+                                5. Only use schedule_google_meet when the time slot is confirmed available.
+                                6. If a requested time is busy, show the user available alternatives using get_formatted_availability.
+                                7. If the user asks about several days (e.g. "what's free this week"), use get_multi_day_availability once for the whole range instead of checking each date.
+                                8. Always confirm the full details (date, parsed time, subject) in your response before scheduling.
 
                                 RESPONSE RULES:
                                 1. If the question matches content in the FAQ, answer using the FAQ tool.  
@@ -70,15 +151,8 @@ class AgentController:
                                 3. If the question is unrelated to the company or outside its scope (e.g., "What is chemistry?"), politely decline and explain:  
                                 → "I'm here to help only with company-specific services, products, and FAQs."  
                                 4. If the client wants more details about services/products, or wishes to explore beyond what the FAQ covers, suggest scheduling a meeting. 
-                                5. Extract the date, time, and subject from the user's request.
-                                6. If the time is in 12-hour format (e.g., "9:00 AM"), mentally convert it to 24-hour format (e.g., "09:00") before proceeding. Use the parse_time helper if available in your tools. 
-                                7. FIRST check availability for their preferred date using get_formatted_availability or get_calendar_availability.
-                                8. If the user provides a specific time, use is_time_slot_available with the parsed 24-hour time to verify it's free.
-                                9. Only use schedule_google_meet when the time slot is confirmed available (after parsing and checking).
-                                10. If a requested time is busy, show the user available alternatives using get_formatted_availability.
-                                11. Always confirm the full details (date, parsed time, subject) in your response before scheduling.
-                                12. If the client is unsatisfied or wants personalized help, suggest connecting with a live human support agent.  
-                                13. Never hallucinate or make assumptions outside the FAQ, company knowledge, or provided tools.  
+                                5. If the client is unsatisfied or wants personalized help, suggest connecting with a live human support agent.  
+                                6. Never hallucinate or make assumptions outside the FAQ, company knowledge, or provided tools.  
 
                                 OUTPUT FORMAT:
                                 Always respond in the following format:
@@ -107,36 +181,179 @@ class AgentController:
                                 - Tool Used: get_formatted_availability  
                                 - Reasoning: The requested time was busy, so I'm showing available alternatives.
                                 """
-        self.agent = self.get_agent()
+        self.prompt = PromptBuilder(
+            self.system_prompt,
+            [
+                greet_user_tool,
+                meet_tool,
+                faq_pdf_tool,
+                availability_tool,
+                formatted_availability_tool,
+                multi_day_availability_tool,
+                is_available_tool,
+            ],
+            select_tools=os.environ.get("AGENT_SELECT_TOOLS", "true").lower() in ("1", "true", "yes"),
+        )
+        # With SESSION_STORE set, conversations live in a shared store and
+        # the pool only caches them, so any replica can serve any turn.
+        self.sessions = SessionPool(
+            self.get_agent,
+            max_sessions=int(os.environ.get("AGENT_MAX_SESSIONS", 500)),
+            idle_ttl_seconds=float(os.environ.get("AGENT_SESSION_TTL_SECONDS", 1800)),
+            store=open_session_store(),
+            history_messages=int(os.environ.get("SESSION_HISTORY_MESSAGES", 40)),
+            write_behind=os.environ.get("SESSION_STORE_WRITE_BEHIND", "true").lower() in ("1", "true", "yes"),
+            flush_interval=float(os.environ.get("SESSION_STORE_FLUSH_MS", 20)) / 1000,
+        )
+        self.router = None
+        if os.environ.get("INTENT_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes"):
+            self.router = IntentRouter(
+                embed_fn=_router_embedding,
+                threshold=float(os.environ.get("INTENT_ROUTER_THRESHOLD", 0.8)),
+            )
         logger.info("AgentController created")
     
     def get_agent(self):
         """
-        Creates and returns a FunctionCallingAgent initialized with a set of tools.
+        Creates and returns a FunctionCallingAgent with the compacted system
+        prompt, per-turn tool selection and its own token-limited chat memory.
+        Unless AGENT_PARALLEL_TOOLS is false, independent tool calls of one
+        step run concurrently (see src/agent_worker.py).
         """
         logger.info("creating Agent")
-        # Include all the available tools
-        tools = [
-            greet_user_tool, 
-            meet_tool, 
-            faq_pdf_tool, 
-            availability_tool,
-            formatted_availability_tool,
-            is_available_tool
-        ]
-        
-        agent = FunctionCallingAgent.from_tools(
-            tools, 
-            llm=self.llm,
-            verbose=True,
-            system_prompt=self.system_prompt
-        )
+        memory = ChatMemoryBuffer.from_defaults(llm=self.llm, token_limit=self.memory_token_limit)
+        # The prompt builder acts as the tool retriever, so each step only
+        # carries the (pre-serialized) schemas of the tools relevant to the turn.
+        if self.parallel_tools:
+            # Tool calls the LLM makes in the same step run concurrently.
+            worker = ParallelFunctionCallingAgentWorker.from_tools(
+                tool_retriever=self.prompt,
+                llm=self.llm,
+                verbose=self.verbose,
+                system_prompt=self.prompt.system_prompt,
+                sequential_tools=SEQUENTIAL_TOOLS,
+            )
+            agent = FunctionCallingAgent(agent_worker=worker, memory=memory, llm=self.llm, verbose=self.verbose)
+        else:
+            agent = FunctionCallingAgent.from_tools(
+                tool_retriever=self.prompt,
+                llm=self.llm,
+                verbose=self.verbose,
+                system_prompt=self.prompt.system_prompt,
+                memory=memory,
+            )
         logger.info("Agent created")
         return agent
     
-    def chat(self, query: str):
+    def _routed(self, session, query: str, answer: str) -> AgentChatResponse:
+        # Keep the agent's memory complete so a follow-up that does go to the
+        # LLM ("yes, book the 10:00 one") still sees this exchange.
+        session.agent.memory.put(ChatMessage(role=MessageRole.USER, content=query))
+        session.agent.memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+        self.prompt.remember_turn(query, ())
+        return AgentChatResponse(response=answer)
+
+    def _settle_bookings(self, session) -> str:
+        # Bookings that finished after their turn replied are reported at the
+        # start of the next one, and kept in the agent's memory.
+        notices = settle_bookings()
+        if not notices:
+            return ""
+        notice = "\n".join(notices)
+        session.agent.memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=notice))
+        return notice
+
+    def _with_notice(self, response, notice: str):
+        if notice:
+            response.response = f"{notice}\n\n{response.response}"
+        return response
+
+    def _with_usage(self, response, usage):
+        self.prompt.record(usage)
+        response.metadata = {**(response.metadata or {}), "tokens": usage.as_dict()}
+        logger.info(f"agent turn tokens: {usage.as_dict()}")
+        return response
+
+    def _prefetch(self, query: str):
+        # Starts before the first LLM call of the turn, so the calendar reads overlap it.
+        return self.prefetcher.start(query) if self.prefetcher is not None else None
+
+    async def _apersist(self, session):
+        # Write-behind only queues the write; a direct write must not block the loop.
+        if self.sessions.store is not None and self.sessions.writer is None:
+            await asyncio.to_thread(self.sessions.persist, session)
+        else:
+            self.sessions.persist(session)
+
+    def chat(self, query: str, session_id: str = DEFAULT_SESSION_ID):
+        """
+        Processes a chat query using the agent of the given session and returns the response.
+
+        Simple read-only requests the intent router can answer on its own
+        (greetings, availability for a given date) skip the LLM; bookings
+        always go to the agent.
+        """
+        session = self.sessions.get(session_id)
+        with span("agent.turn") as turn, session.lock, bind_session_state(session.state):
+            self.sessions.hydrate(session)
+            notice = self._settle_bookings(session)
+            with span("intent_router"):
+                answer = self.router.route(query) if self.router else None
+            turn.set(routed=answer is not None)
+            if answer is not None:
+                response = self._routed(session, query, answer)
+                self.sessions.persist(session)
+                return self._with_notice(response, notice)
+            started = time.perf_counter()
+            with track_tokens() as usage, bind_prefetch(self._prefetch(query)):
+                response = session.agent.chat(query)
+            self.prompt.remember_turn(query, [source.tool_name for source in response.sources])
+            if self.router:
+                self.router.record_agent_turn(time.perf_counter() - started)
+            turn.set(**usage.as_dict())
+            self.sessions.persist(session)
+        return self._with_notice(self._with_usage(response, usage), notice)
+
+    async def achat(self, query: str, session_id: str = DEFAULT_SESSION_ID):
+        """
+        Async variant of chat(); the agent's LLM calls run on the caller's event loop.
+        """
+        session = self.sessions.get(session_id)
+        with span("agent.turn") as turn:
+            async with session.async_lock:
+                with bind_session_state(session.state):
+                    if self.sessions.store is not None:
+                        await asyncio.to_thread(self.sessions.hydrate, session)
+                    notice = self._settle_bookings(session)
+                    if notice:
+                        emit_token(f"{notice}\n\n")
+                    with span("intent_router"):
+                        answer = await asyncio.to_thread(self.router.route, query) if self.router else None
+                    turn.set(routed=answer is not None)
+                    if answer is not None:
+                        emit_token(answer)
+                        response = self._routed(session, query, answer)
+                        await self._apersist(session)
+                        return self._with_notice(response, notice)
+                    started = time.perf_counter()
+                    with track_tokens() as usage, bind_prefetch(self._prefetch(query)):
+                        response = await session.agent.achat(query)
+                    self.prompt.remember_turn(query, [source.tool_name for source in response.sources])
+                    if self.router:
+                        self.router.record_agent_turn(time.perf_counter() - started)
+                    turn.set(**usage.as_dict())
+                    await self._apersist(session)
+        return self._with_notice(self._with_usage(response, usage), notice)
+
+    async def astream_chat(self, query: str, sink, session_id: str = DEFAULT_SESSION_ID):
+        """
+        Like achat(), but sends token and tool progress events to `sink` while the turn runs.
+        """
+        with bind_event_sink(sink):
+            return await self.achat(query, session_id=session_id)
+
+    def reset(self, session_id: str = DEFAULT_SESSION_ID):
         """
-        Processes a chat query using the initialized agent and returns the response.
+        Drops the chat history and tool state of the given session.
         """
-        response = self.agent.chat(query)
-        return response
\ No newline at end of file
+        self.sessions.reset(session_id)
\ No newline at end of file
@@ -0,0 +1,290 @@
+# src/agent_worker.py
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from llama_index.core.agent.function_calling.step import (
+    FunctionCallingAgentWorker,
+    build_error_tool_output,
+    build_missing_tool_output,
+    dispatcher,
+    get_function_by_name,
+)
+from llama_index.core.agent.types import Task, TaskStep, TaskStepOutput
+from llama_index.core.agent.utils import add_user_step_to_memory
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.callbacks import CBEventType, EventPayload, trace_method
+from llama_index.core.chat_engine.types import AgentChatResponse
+from llama_index.core.instrumentation.events.agent import AgentToolCallEvent
+from llama_index.core.llms.function_calling import ToolSelection
+from llama_index.core.tools import BaseTool, ToolOutput
+from llama_index.core.tools.calling import acall_tool_with_selection, call_tool_with_selection
+from llama_index.core.tools.types import ToolMetadata
+
+from src.tracing import span
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+ToolResult = Tuple[ToolOutput, bool]
+
+# Threads shared by every agent for the sync (non-async) path.
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _tool_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("AGENT_TOOL_THREADS", 32)), thread_name_prefix="agent-tool"
+                )
+    return _pool
+
+
+def parse_tool_timeouts(value: str) -> Dict[str, float]:
+    """
+    Parses "name=seconds,name=seconds" (the AGENT_TOOL_TIMEOUTS format) into a dict.
+    """
+    timeouts: Dict[str, float] = {}
+    for item in value.split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+class ParallelFunctionCallingAgentWorker(FunctionCallingAgentWorker):
+    """
+    Function calling worker that runs the tool calls of one step concurrently.
+
+    llama-index runs the calls of a step one after another on the sync path,
+    and with an unbounded gather (recording results in completion order) on
+    the async path. Here, consecutive calls run together, at most
+    `max_concurrency` at a time, so a step costs its slowest call rather
+    than the sum. Each call is cut off after its tool's timeout and reported
+    to the LLM as an error. Results go into memory in the order the LLM
+    asked for them, whatever order they finish in.
+
+    Tools listed in `sequential_tools` have side effects (e.g. booking a
+    meeting) and act as barriers: the calls before them finish first, they
+    run alone, and the calls after them start afterwards.
+    """
+
+    def __init__(self, *args: Any, max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                 tool_timeouts: Optional[Dict[str, float]] = None, sequential_tools: Iterable[str] = (),
+                 **kwargs: Any) -> None:
+        """
+        Args:
+            max_concurrency (int): Calls of one step running at once. Defaults to AGENT_TOOL_CONCURRENCY or 4.
+            timeout (float): Seconds a tool call may take. Defaults to AGENT_TOOL_TIMEOUT_SECONDS or 30.
+            tool_timeouts (Dict[str, float]): Per-tool overrides. Defaults to AGENT_TOOL_TIMEOUTS.
+            sequential_tools (Iterable[str]): Tools never run alongside other calls.
+            *args, **kwargs: Passed to FunctionCallingAgentWorker.
+        """
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max(1, max_concurrency or int(os.environ.get("AGENT_TOOL_CONCURRENCY", 4)))
+        self.timeout = timeout or float(os.environ.get("AGENT_TOOL_TIMEOUT_SECONDS", 30))
+        self.tool_timeouts = tool_timeouts if tool_timeouts is not None else parse_tool_timeouts(
+            os.environ.get("AGENT_TOOL_TIMEOUTS", "")
+        )
+        self.sequential_tools = frozenset(sequential_tools)
+
+    def _timeout_for(self, tool_call: ToolSelection) -> float:
+        return self.tool_timeouts.get(tool_call.tool_name, self.timeout)
+
+    def _batches(self, tool_calls: Sequence[ToolSelection]) -> List[List[int]]:
+        # Indices of calls that may run together, in call order.
+        batches: List[List[int]] = []
+        current: List[int] = []
+        for i, tool_call in enumerate(tool_calls):
+            if tool_call.tool_name in self.sequential_tools:
+                if current:
+                    batches.append(current)
+                    current = []
+                batches.append([i])
+            else:
+                current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _metadata(self, tool: Optional[BaseTool], tool_call: ToolSelection) -> ToolMetadata:
+        return tool.metadata if tool is not None else ToolMetadata(description="", name=tool_call.tool_name)
+
+    def _execute(self, tools: Sequence[BaseTool], tool_call: ToolSelection) -> ToolResult:
+        # FunctionCallingAgentWorker._call_function without the memory writes.
+        tool = get_function_by_name(tools, tool_call.tool_name)
+        tool_args_str = json.dumps(tool_call.tool_kwargs)
+        tool_metadata = self._metadata(tool, tool_call)
+        dispatcher.event(AgentToolCallEvent(arguments=tool_args_str, tool=tool_metadata))
+        with self.callback_manager.event(
+            CBEventType.FUNCTION_CALL,
+            payload={EventPayload.FUNCTION_CALL: tool_args_str, EventPayload.TOOL: tool_metadata},
+        ) as event:
+            tool_output = (
+                call_tool_with_selection(tool_call, tools, verbose=self._verbose)
+                if tool is not None
+                else build_missing_tool_output(tool_call)
+            )
+            event.on_end(payload={EventPayload.FUNCTION_OUTPUT: str(tool_output)})
+        return tool_output, tool.metadata.return_direct if tool is not None else False
+
+    async def _aexecute(self, tools: Sequence[BaseTool], tool_call: ToolSelection) -> ToolResult:
+        tool = get_function_by_name(tools, tool_call.tool_name)
+        tool_args_str = json.dumps(tool_call.tool_kwargs)
+        tool_metadata = self._metadata(tool, tool_call)
+        dispatcher.event(AgentToolCallEvent(arguments=tool_args_str, tool=tool_metadata))
+        with self.callback_manager.event(
+            CBEventType.FUNCTION_CALL,
+            payload={EventPayload.FUNCTION_CALL: tool_args_str, EventPayload.TOOL: tool_metadata},
+        ) as event:
+            tool_output = (
+                await acall_tool_with_selection(tool_call, tools, verbose=self._verbose)
+                if tool is not None
+                else build_missing_tool_output(tool_call)
+            )
+            event.on_end(payload={EventPayload.FUNCTION_OUTPUT: str(tool_output)})
+        return tool_output, tool.metadata.return_direct if tool is not None else False
+
+    def _timed_out(self, tool_call: ToolSelection) -> ToolResult:
+        seconds = self._timeout_for(tool_call)
+        logger.warning(f"tool '{tool_call.tool_name}' timed out after {seconds:g}s")
+        message = f"Tool {tool_call.tool_name} timed out after {seconds:g} seconds; tell the user it is unavailable right now."
+        return build_error_tool_output(tool_call.tool_name, tool_call.tool_kwargs, message), False
+
+    def _run_calls(self, tools: Sequence[BaseTool], tool_calls: Sequence[ToolSelection]) -> List[ToolResult]:
+        results: List[Optional[ToolResult]] = [None] * len(tool_calls)
+        pool = _tool_pool()
+        for batch in self._batches(tool_calls):
+            waiting = list(batch)
+            running: Dict[Future, Tuple[int, float]] = {}
+            while waiting or running:
+                while waiting and len(running) < self.max_concurrency:
+                    i = waiting.pop(0)
+                    # Each call gets a copy of this context: session state and the current span.
+                    context = contextvars.copy_context()
+                    future = pool.submit(context.run, self._execute, tools, tool_calls[i])
+                    running[future] = (i, time.monotonic() + self._timeout_for(tool_calls[i]))
+                next_deadline = min(deadline for _, deadline in running.values())
+                done, _ = wait(running, timeout=max(0.0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                now = time.monotonic()
+                for future, (i, deadline) in list(running.items()):
+                    if future in done:
+                        results[i] = future.result()
+                    elif deadline <= now:
+                        # The thread cannot be interrupted; it finishes in the background.
+                        future.cancel()
+                        results[i] = self._timed_out(tool_calls[i])
+                    else:
+                        continue
+                    del running[future]
+        return results
+
+    async def _arun_calls(self, tools: Sequence[BaseTool], tool_calls: Sequence[ToolSelection]) -> List[ToolResult]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(tool_call: ToolSelection) -> ToolResult:
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(self._aexecute(tools, tool_call), self._timeout_for(tool_call))
+                except asyncio.TimeoutError:
+                    return self._timed_out(tool_call)
+
+        results: List[ToolResult] = []
+        for batch in self._batches(tool_calls):
+            results.extend(await asyncio.gather(*(run(tool_calls[i]) for i in batch)))
+        return results
+
+    def _prepare(self, step: TaskStep, task: Task) -> List[BaseTool]:
+        if step.input is not None:
+            add_user_step_to_memory(step, task.extra_state["new_memory"], verbose=self._verbose)
+        return self.get_tools(task.input)
+
+    def _tool_calls(self, response: Any, task: Task) -> List[ToolSelection]:
+        tool_calls = self._llm.get_tool_calls_from_response(response, error_on_no_tool_call=False)
+        if response.message.content and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"LLM response: {response.message.content}")
+        if not self.allow_parallel_tool_calls and len(tool_calls) > 1:
+            raise ValueError("Parallel tool calls not supported for synchronous function calling agent")
+        task.extra_state["new_memory"].put(response.message)
+        if task.extra_state["n_function_calls"] >= self._max_function_calls:
+            return []
+        return tool_calls
+
+    def _finish_step(self, step: TaskStep, task: Task, response: Any, tool_calls: Sequence[ToolSelection],
+                     results: Sequence[ToolResult]) -> TaskStepOutput:
+        memory = task.extra_state["new_memory"]
+        tool_outputs: List[ToolOutput] = []
+        for tool_call, (tool_output, _) in zip(tool_calls, results):
+            memory.put(ChatMessage(
+                content=str(tool_output),
+                role=MessageRole.TOOL,
+                additional_kwargs={"name": tool_call.tool_name, "tool_call_id": tool_call.tool_id},
+            ))
+            tool_outputs.append(tool_output)
+        task.extra_state["sources"].extend(tool_outputs)
+        task.extra_state["n_function_calls"] += len(tool_calls)
+
+        is_done = not tool_calls
+        # As in llama-index, return_direct only applies to a single call.
+        if len(results) == 1 and results[0][1]:
+            is_done = True
+            response = tool_outputs[0].content
+        new_steps = [] if is_done else [step.get_next_step(step_id=str(uuid.uuid4()), input=None)]
+        try:
+            response_str = str(response.message.content)
+        except AttributeError:
+            response_str = str(response)
+        return TaskStepOutput(
+            output=AgentChatResponse(response=response_str, sources=tool_outputs),
+            task_step=step,
+            is_last=is_done,
+            next_steps=new_steps,
+        )
+
+    @trace_method("run_step")
+    def run_step(self, step: TaskStep, task: Task, **kwargs: Any) -> TaskStepOutput:
+        """Run step: one LLM call, then its tool calls in parallel."""
+        tools = self._prepare(step, task)
+        response = self._llm.chat_with_tools(
+            tools=tools,
+            user_msg=None,
+            chat_history=self.get_all_messages(task),
+            verbose=self._verbose,
+            allow_parallel_tool_calls=self.allow_parallel_tool_calls,
+        )
+        tool_calls = self._tool_calls(response, task)
+        results: List[ToolResult] = []
+        if tool_calls:
+            with span("agent.tools", calls=len(tool_calls)):
+                results = self._run_calls(tools, tool_calls)
+        return self._finish_step(step, task, response, tool_calls, results)
+
+    @trace_method("run_step")
+    async def arun_step(self, step: TaskStep, task: Task, **kwargs: Any) -> TaskStepOutput:
+        """Run step (async): one LLM call, then its tool calls in parallel."""
+        tools = self._prepare(step, task)
+        response = await self._llm.achat_with_tools(
+            tools=tools,
+            user_msg=None,
+            chat_history=self.get_all_messages(task),
+            verbose=self._verbose,
+            allow_parallel_tool_calls=self.allow_parallel_tool_calls,
+        )
+        tool_calls = self._tool_calls(response, task)
+        results: List[ToolResult] = []
+        if tool_calls:
+            with span("agent.tools", calls=len(tool_calls)):
+                results = await self._arun_calls(tools, tool_calls)
+        return self._finish_step(step, task, response, tool_calls, results)
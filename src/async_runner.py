@@ -0,0 +1,208 @@
+# src/async_runner.py
+
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from src.tracing import Trace, adopt_trace, current_trace, span
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+
+class ChatOverloadedError(Exception):
+    """Raised when too many chat requests are already queued (maps to HTTP 429)."""
+
+
+class ChatUnavailableError(Exception):
+    """Raised when a request waited too long for a free LLM slot (maps to HTTP 503)."""
+
+
+class ChatTimeoutError(Exception):
+    """Raised when a chat turn exceeds its time budget (maps to HTTP 504)."""
+
+
+class AsyncChatRunner:
+    """
+    Runs chat coroutines on one shared event loop thread.
+
+    Web server threads hand their turn over to the loop and wait for the
+    result, so the LLM and tool I/O of many conversations is multiplexed on
+    a single loop instead of pinning a thread per in-flight Groq call.
+
+    Admission control:
+        - at most `max_concurrency` turns run at once (semaphore);
+        - at most `max_pending` turns are accepted (running + waiting);
+          beyond that ChatOverloadedError is raised immediately;
+        - a turn that waits more than `queue_timeout` for a slot raises
+          ChatUnavailableError;
+        - a running turn is cancelled after `timeout` seconds with
+          ChatTimeoutError.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        timeout: Optional[float] = None,
+        tool_threads: Optional[int] = None,
+    ):
+        """
+        Args:
+            max_concurrency (int): Turns allowed to run at once. Defaults to CHAT_MAX_CONCURRENCY or 32.
+            max_pending (int): Turns accepted before rejecting. Defaults to CHAT_MAX_PENDING or 256.
+            queue_timeout (float): Seconds a turn may wait for a slot. Defaults to CHAT_QUEUE_TIMEOUT_SECONDS or 10.
+            timeout (float): Seconds a turn may run. Defaults to CHAT_TIMEOUT_SECONDS or 60.
+            tool_threads (int): Worker threads for blocking tool calls. Defaults to CHAT_TOOL_THREADS or 64.
+        """
+        self.max_concurrency = max_concurrency or int(os.environ.get("CHAT_MAX_CONCURRENCY", 32))
+        self.max_pending = max_pending or int(os.environ.get("CHAT_MAX_PENDING", 256))
+        self.queue_timeout = queue_timeout or float(os.environ.get("CHAT_QUEUE_TIMEOUT_SECONDS", 10))
+        self.timeout = timeout or float(os.environ.get("CHAT_TIMEOUT_SECONDS", 60))
+        self.tool_threads = tool_threads or int(os.environ.get("CHAT_TOOL_THREADS", 64))
+        self.pending = 0
+        self.in_flight = 0
+        self._pending_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """
+        The runner's event loop, started on a daemon thread on first use.
+        """
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    # Sync tools are run with asyncio.to_thread, which uses this executor.
+                    loop.set_default_executor(
+                        ThreadPoolExecutor(max_workers=self.tool_threads, thread_name_prefix="chat-tool")
+                    )
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    threading.Thread(target=loop.run_forever, name="chat-loop", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    async def _run(self, coro_factory: Callable[[], Awaitable[Any]], trace: Optional[Trace] = None) -> Any:
+        # The turn runs in a task on the loop thread; spans it opens belong
+        # to the trace of the request that submitted it.
+        adopt_trace(trace)
+        try:
+            with span("chat.queue_wait"):
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ChatUnavailableError(f"no LLM slot free within {self.queue_timeout}s")
+        self.in_flight += 1
+        try:
+            return await asyncio.wait_for(coro_factory(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ChatTimeoutError(f"chat turn exceeded {self.timeout}s")
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def run(self, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs a coroutine on the shared loop and blocks the calling thread until it finishes.
+
+        Args:
+            coro_factory (Callable[[], Awaitable[Any]]): Creates the coroutine; called on the loop thread.
+
+        Returns:
+            Any: The coroutine's result.
+
+        Raises:
+            ChatOverloadedError: The pending queue is full.
+            ChatUnavailableError: No concurrency slot became free in time.
+            ChatTimeoutError: The turn ran longer than the timeout.
+        """
+        self._admit()
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._run(coro_factory, current_trace()), self.loop)
+            try:
+                # Small grace period so the loop-side timeout fires first.
+                return future.result(self.queue_timeout + self.timeout + 1)
+            except FutureTimeoutError:
+                future.cancel()
+                raise ChatTimeoutError(f"chat turn exceeded {self.timeout}s")
+        finally:
+            self._release()
+
+    def stream(self, coro_factory: Callable[[Callable[[Dict[str, Any]], None]], Awaitable[Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Runs a coroutine on the shared loop and yields the events it emits.
+
+        Admission is checked before returning, so ChatOverloadedError is
+        raised here rather than in the middle of a response. The iterator
+        ends with a {"type": "done", "result": ...} event, or with a
+        {"type": "error", "status": ..., "message": ...} event if the turn
+        could not be completed.
+
+        Args:
+            coro_factory: Called on the loop thread with an event sink; returns the coroutine to run.
+
+        Returns:
+            Iterator[Dict[str, Any]]: The emitted events, followed by done or error.
+        """
+        self._admit()
+        return self._stream(coro_factory)
+
+    def _stream(self, coro_factory) -> Iterator[Dict[str, Any]]:
+        events: "queue.Queue[Any]" = queue.Queue()
+        finished = object()
+        future = None
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self._run(lambda: coro_factory(events.put), current_trace()), self.loop
+            )
+            future.add_done_callback(lambda _: events.put(finished))
+            deadline = self.queue_timeout + self.timeout + 1
+            while True:
+                try:
+                    event = events.get(timeout=deadline)
+                except queue.Empty:
+                    future.cancel()
+                    yield {"type": "error", "status": 504, "message": f"chat turn exceeded {self.timeout}s"}
+                    return
+                if event is finished:
+                    break
+                yield event
+            try:
+                yield {"type": "done", "result": future.result()}
+            except ChatUnavailableError as e:
+                yield {"type": "error", "status": 503, "message": str(e)}
+            except ChatTimeoutError as e:
+                yield {"type": "error", "status": 504, "message": str(e)}
+            except Exception as e:
+                logger.exception("streamed chat turn failed")
+                yield {"type": "error", "status": 500, "message": f"{type(e).__name__}: {e}"}
+        finally:
+            # Also runs when the client disconnects and the generator is closed.
+            if future is not None and not future.done():
+                future.cancel()
+            self._release()
+
+    def _admit(self):
+        with self._pending_lock:
+            if self.pending >= self.max_pending:
+                raise ChatOverloadedError(f"{self.pending} chat turns already pending")
+            self.pending += 1
+
+    def _release(self):
+        with self._pending_lock:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+        }
@@ -0,0 +1,598 @@
+# src/batch_runner.py
+
+import argparse
+import bisect
+import csv
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, IO, Iterator, NamedTuple, Optional, Set
+
+from src.llm_gateway import llm_priority
+from src.prompt_builder import without_tools
+from src.tracing import LATENCY_BUCKETS, metrics
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+# Columns (CSV) or keys (JSONL) taken as the inquiry text, in order of preference.
+QUERY_FIELDS = ("query", "message", "inquiry", "question", "text")
+ID_FIELDS = ("id", "record_id")
+FORMATS = ("csv", "jsonl")
+JOB_ID_RE = re.compile(r"^[0-9a-f]{12}$")
+# Records are answered unattended, with nobody to confirm a booking: tools
+# with side effects are never offered to the agent in a batch.
+BATCH_HIDDEN_TOOLS = ("schedule_google_meet",)
+
+BATCH_RECORDS = metrics.counter("agent_batch_records_total", "Batch records answered, by outcome.", ("outcome",))
+BATCH_RECORD_SECONDS = metrics.histogram("agent_batch_record_seconds", "Time to answer one batch record.")
+
+
+class BatchInputError(ValueError):
+    """Raised for an unreadable batch input, or one that does not match the checkpoint being resumed."""
+
+
+class BatchRecord(NamedTuple):
+    index: int
+    record_id: Any
+    query: Optional[str]
+    error: Optional[str] = None
+
+
+def detect_format(path: str, declared: Optional[str] = None) -> str:
+    """
+    Returns "csv" or "jsonl" for an input file, from `declared` or the file extension.
+    """
+    fmt = (declared or os.path.splitext(path)[1].lstrip(".")).lower()
+    fmt = {"ndjson": "jsonl", "json": "jsonl"}.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise BatchInputError(f"cannot tell the format of '{path}'; expected one of {FORMATS}")
+    return fmt
+
+
+def _jsonl_rows(lines: IO[str]) -> Iterator[Any]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+
+def _record(index: int, row: Any, query_field: Optional[str]) -> BatchRecord:
+    if isinstance(row, Exception):
+        return BatchRecord(index, index, None, f"invalid record: {row}")
+    if isinstance(row, str):
+        row = {"query": row}
+    if not isinstance(row, dict):
+        return BatchRecord(index, index, None, "invalid record: expected an object")
+    record_id = next((row[f] for f in ID_FIELDS if row.get(f) not in (None, "")), index)
+    fields = (query_field,) if query_field else QUERY_FIELDS
+    query = next((row[f] for f in fields if isinstance(row.get(f), str) and row[f].strip()), None)
+    if query is None:
+        return BatchRecord(index, record_id, None, f"no query in fields {list(fields)}")
+    return BatchRecord(index, record_id, query.strip())
+
+
+def read_records(path: str, fmt: Optional[str] = None, query_field: Optional[str] = None) -> Iterator[BatchRecord]:
+    """
+    Streams the records of a CSV or JSONL file, one at a time.
+
+    A record is numbered by its position among the data rows (blank JSONL
+    lines are skipped), which is what checkpoints refer to. Malformed rows
+    and rows without a query are yielded with an error rather than raised,
+    so one bad line does not stop a batch.
+
+    Args:
+        path (str): The input file.
+        fmt (str): "csv" or "jsonl"; taken from the extension when omitted.
+        query_field (str): Column or key holding the inquiry; by default the
+            first of QUERY_FIELDS present.
+
+    Returns:
+        Iterator[BatchRecord]: The records in file order.
+    """
+    fmt = detect_format(path, fmt)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = csv.DictReader(f) if fmt == "csv" else _jsonl_rows(f)
+        for index, row in enumerate(rows):
+            yield _record(index, row, query_field)
+
+
+def fingerprint(path: str) -> str:
+    """
+    Identifies an input file by its size and the hash of its first megabyte.
+    """
+    with open(path, "rb") as f:
+        head = f.read(1 << 20)
+    return f"{os.path.getsize(path)}:{hashlib.sha256(head).hexdigest()[:16]}"
+
+
+class Checkpoint:
+    """
+    Which records of an input have their result written, and how much output that is.
+
+    Records finish out of order, so progress is a watermark (every record
+    below it is done) plus the few done records above it. Memory stays
+    bounded by the records completed while the slowest one is in flight,
+    not by the size of the input. The file is replaced atomically.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Where the checkpoint is kept.
+        """
+        self.path = path
+        self.watermark = 0
+        self.done: Set[int] = set()
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.done
+
+    def mark(self, index: int):
+        self.done.add(index)
+        while self.watermark in self.done:
+            self.done.discard(self.watermark)
+            self.watermark += 1
+
+    @property
+    def count(self) -> int:
+        return self.watermark + len(self.done)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """
+        Reads the checkpoint; returns its fields, or None if there is none.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            raise BatchInputError(f"checkpoint '{self.path}' is corrupt: {e}")
+        self.watermark = int(state.get("watermark", 0))
+        self.done = set(state.get("done", ()))
+        return state
+
+    def save(self, **fields):
+        state = {**fields, "watermark": self.watermark, "done": sorted(self.done)}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+
+class BatchStats:
+    """
+    Counters for one batch, in constant memory: outcome counts, error types
+    and a latency histogram (percentiles are bucket upper bounds).
+    """
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.processed = 0
+        self.errors: Counter = Counter()
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_total = 0.0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    def add(self, result: Dict[str, Any], counted: bool = True):
+        """
+        Counts a written result; `counted` is False for results recovered from a previous run.
+        """
+        if result.get("error"):
+            self.failed += 1
+            self.errors[result["error"].split(":", 1)[0]] += 1
+        else:
+            self.succeeded += 1
+        if counted:
+            self.processed += 1
+            seconds = result.get("latency_ms", 0) / 1000
+            self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_total += seconds
+
+    def restore(self, saved: Dict[str, Any]):
+        # Outcome counts carry over a resume; throughput and latency are per run.
+        self.succeeded = saved.get("succeeded", 0)
+        self.failed = saved.get("failed", 0)
+        self.errors.update(saved.get("errors", {}))
+
+    def _percentile(self, q: float) -> Optional[float]:
+        rank = q / 100 * self.processed
+        seen = 0
+        for i, count in enumerate(self.latency_counts):
+            seen += count
+            if count and seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else None
+        return None
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "processed": self.processed,
+            "elapsed_seconds": round(elapsed, 1),
+            "records_per_minute": round(self.processed / elapsed * 60, 1) if elapsed > 0 else 0.0,
+            "latency_seconds": {
+                "mean": round(self.latency_total / self.processed, 3) if self.processed else None,
+                "p50": self._percentile(50),
+                "p95": self._percentile(95),
+            },
+            "errors": dict(self.errors.most_common(20)),
+        }
+
+
+def _recover(output_path: str, offset: int, checkpoint: Checkpoint, stats: BatchStats) -> int:
+    # Results written after the last checkpoint are kept: their records are
+    # marked done, and a line cut short by the interruption is dropped.
+    if not os.path.exists(output_path):
+        return 0
+    with open(output_path, "rb+") as f:
+        f.seek(offset)
+        end = offset
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+            except ValueError:
+                break
+            if not checkpoint.is_done(result["index"]):
+                checkpoint.mark(result["index"])
+                stats.add(result, counted=False)
+            end += len(line)
+        f.truncate(end)
+    return end
+
+
+class BatchRunner:
+    """
+    Answers every record of a CSV or JSONL file with the agent and writes the results as JSONL.
+
+    Records are read lazily and at most `concurrency` of them are in flight,
+    each in its own throwaway session, so memory does not grow with the
+    input. Results are appended as they finish (in completion order, keyed
+    by "index") and a checkpoint is saved every `checkpoint_every` records;
+    running again on the same input and output resumes where it stopped.
+    LLM calls run at background priority, so interactive chats sharing the
+    rate limits go first. Records can ask about availability but never book
+    (see BATCH_HIDDEN_TOOLS).
+    """
+
+    def __init__(self, controller: Any, concurrency: Optional[int] = None, checkpoint_every: Optional[int] = None,
+                 progress_seconds: Optional[float] = None, session_prefix: Optional[str] = None):
+        """
+        Args:
+            controller (AgentController): Answers the records.
+            concurrency (int): Records answered at once. Defaults to BATCH_CONCURRENCY or 8.
+            checkpoint_every (int): Records between checkpoints. Defaults to BATCH_CHECKPOINT_EVERY or 50.
+            progress_seconds (float): Seconds between progress log lines. Defaults to BATCH_PROGRESS_SECONDS or 30.
+            session_prefix (str): Prefix of the per-record session ids; unique per runner by default.
+        """
+        self.controller = controller
+        self.concurrency = concurrency or int(os.environ.get("BATCH_CONCURRENCY", 8))
+        self.checkpoint_every = checkpoint_every or int(os.environ.get("BATCH_CHECKPOINT_EVERY", 50))
+        self.progress_seconds = progress_seconds or float(os.environ.get("BATCH_PROGRESS_SECONDS", 30))
+        self.session_prefix = session_prefix or f"batch-{uuid.uuid4().hex[:8]}"
+        self.stats = BatchStats()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """
+        Stops reading new records; those in flight finish and are checkpointed.
+        """
+        self._stop.set()
+
+    def answer(self, record: BatchRecord) -> Dict[str, Any]:
+        """
+        Answers one record in a fresh session; errors are returned in the result, not raised.
+        """
+        result = {"index": record.index, "id": record.record_id, "query": record.query}
+        if record.error:
+            return {**result, "response": None, "error": record.error, "latency_ms": 0}
+        session_id = f"{self.session_prefix}-{record.index}"
+        started = time.perf_counter()
+        try:
+            with llm_priority("background"), without_tools(BATCH_HIDDEN_TOOLS):
+                response = self.controller.chat(record.query, session_id=session_id)
+            result.update(response=response.response, error=None)
+            tokens = (response.metadata or {}).get("tokens")
+            if tokens:
+                result["tokens"] = tokens
+        except Exception as e:
+            logger.warning(f"batch record {record.index} failed: {type(e).__name__}: {e}")
+            result.update(response=None, error=f"{type(e).__name__}: {e}")
+        finally:
+            # The conversation is not continued; keep neither the pool nor the store growing.
+            try:
+                self.controller.reset(session_id)
+            except Exception as e:
+                logger.warning(f"batch session '{session_id}' not dropped: {e}")
+        seconds = time.perf_counter() - started
+        BATCH_RECORD_SECONDS.observe(seconds)
+        result["latency_ms"] = round(seconds * 1000, 1)
+        return result
+
+    def run(self, input_path: str, output_path: str, fmt: Optional[str] = None, query_field: Optional[str] = None,
+            resume: bool = True, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Processes the input, resuming from `<output_path>.checkpoint` when there is one.
+
+        Args:
+            input_path (str): CSV or JSONL file of inquiries.
+            output_path (str): JSONL file the results are appended to.
+            fmt (str): Input format; taken from the extension when omitted.
+            query_field (str): Column or key holding the inquiry.
+            resume (bool): Continue a previous run; with False the output starts over.
+            on_progress (Callable): Called with the stats at every checkpoint.
+
+        Returns:
+            Dict[str, Any]: Final stats, with "status" "completed" or "interrupted".
+
+        Raises:
+            BatchInputError: The input cannot be read, or differs from the one being resumed.
+        """
+        fmt = detect_format(input_path, fmt)
+        source = fingerprint(input_path)
+        checkpoint = Checkpoint(f"{output_path}.checkpoint")
+        offset = 0
+        if resume:
+            state = checkpoint.load()
+            if state is not None:
+                if state.get("input") != source:
+                    raise BatchInputError(
+                        f"'{input_path}' is not the input '{output_path}' was started with; "
+                        "use a new output or start over"
+                    )
+                self.stats.restore(state.get("stats", {}))
+                offset = _recover(output_path, state.get("offset", 0), checkpoint, self.stats)
+            if checkpoint.count:
+                logger.info(f"resuming batch '{input_path}': {checkpoint.count} records already done")
+        elif os.path.exists(checkpoint.path):
+            os.remove(checkpoint.path)
+
+        status = "interrupted"
+        in_flight: Set[Future] = set()
+        since_checkpoint = 0
+        last_progress = time.monotonic()
+        with open(output_path, "ab" if offset else "wb") as out, ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="batch"
+        ) as pool:
+
+            def save():
+                out.flush()
+                checkpoint.save(input=source, offset=out.tell(), status=status, stats=self.stats.as_dict())
+                if on_progress is not None:
+                    on_progress(self.summary(status))
+
+            def collect(block: bool):
+                nonlocal in_flight, since_checkpoint, last_progress
+                done, in_flight = wait(in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    out.write(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+                    checkpoint.mark(result["index"])
+                    self.stats.add(result)
+                    BATCH_RECORDS.inc(outcome="failed" if result["error"] else "succeeded")
+                    since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    save()
+                    since_checkpoint = 0
+                if time.monotonic() - last_progress >= self.progress_seconds:
+                    last_progress = time.monotonic()
+                    logger.info(f"batch '{input_path}': {self.summary('running')}")
+
+            try:
+                for record in read_records(input_path, fmt, query_field):
+                    if self._stop.is_set():
+                        break
+                    if checkpoint.is_done(record.index):
+                        self.stats.skipped += 1
+                        continue
+                    while len(in_flight) >= self.concurrency:
+                        collect(block=True)
+                    in_flight.add(pool.submit(self.answer, record))
+                else:
+                    status = "completed"
+            finally:
+                # Also on KeyboardInterrupt: what is in flight is finished and recorded.
+                while in_flight:
+                    collect(block=True)
+                self.stats.finished = time.monotonic()
+                save()
+        logger.info(f"batch '{input_path}' {status}: {self.summary(status)}")
+        return self.summary(status)
+
+    def summary(self, status: str) -> Dict[str, Any]:
+        return {"status": status, **self.stats.as_dict()}
+
+
+class BatchJob:
+    """
+    A batch submitted over HTTP, kept in its own directory under BATCH_DIR
+    (input file, results.jsonl and its checkpoint), so it can be inspected
+    and resumed after a restart.
+    """
+
+    def __init__(self, job_id: str, directory: str, fmt: str, query_field: Optional[str] = None):
+        self.job_id = job_id
+        self.directory = directory
+        self.fmt = fmt
+        self.query_field = query_field
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.runner: Optional[BatchRunner] = None
+
+    @property
+    def input_path(self) -> str:
+        return os.path.join(self.directory, f"input.{self.fmt}")
+
+    @property
+    def output_path(self) -> str:
+        return os.path.join(self.directory, "results.jsonl")
+
+    def save_meta(self):
+        with open(os.path.join(self.directory, "job.json"), "w", encoding="utf-8") as f:
+            json.dump({"format": self.fmt, "query_field": self.query_field}, f)
+
+    def as_dict(self) -> Dict[str, Any]:
+        status = {"job_id": self.job_id, "status": self.status}
+        if self.runner is not None:
+            status.update(self.runner.stats.as_dict())
+        else:
+            try:
+                with open(f"{self.output_path}.checkpoint", encoding="utf-8") as f:
+                    saved = json.load(f)
+                status.update(saved.get("stats", {}))
+                if self.status == "queued" or saved.get("status") == "completed":
+                    status["status"] = saved.get("status", self.status)
+            except (FileNotFoundError, ValueError):
+                pass
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+class BatchJobs:
+    """
+    Runs batch jobs one after another on a background thread.
+
+    Jobs are processed in submission order, so a second upload waits
+    instead of splitting the LLM rate limits with the first one.
+    """
+
+    def __init__(self, controller_factory: Callable[[], Any], directory: Optional[str] = None):
+        """
+        Args:
+            controller_factory (Callable[[], Any]): Returns the AgentController, called when a job starts.
+            directory (str): Where jobs are kept. Defaults to BATCH_DIR or "batch_jobs".
+        """
+        self.controller_factory = controller_factory
+        self.directory = directory or os.environ.get("BATCH_DIR", "batch_jobs")
+        self._jobs: Dict[str, BatchJob] = {}
+        self._queue: "queue.Queue[BatchJob]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, save_input: Callable[[str], None], fmt: str, query_field: Optional[str] = None) -> BatchJob:
+        """
+        Creates a job and queues it.
+
+        Args:
+            save_input (Callable[[str], None]): Writes the uploaded input to the given path.
+            fmt (str): "csv" or "jsonl".
+            query_field (str): Column or key holding the inquiry.
+
+        Returns:
+            BatchJob: The queued job.
+        """
+        fmt = detect_format("", fmt)
+        job_id = uuid.uuid4().hex[:12]
+        job = BatchJob(job_id, os.path.join(self.directory, job_id), fmt, query_field)
+        os.makedirs(job.directory, exist_ok=True)
+        save_input(job.input_path)
+        job.save_meta()
+        self._enqueue(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        """
+        Returns the job, also one left on disk by an earlier process, or None.
+        """
+        if not JOB_ID_RE.match(job_id):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        directory = os.path.join(self.directory, job_id)
+        try:
+            with open(os.path.join(directory, "job.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        job = BatchJob(job_id, directory, meta["format"], meta.get("query_field"))
+        job.status = "interrupted"
+        return job
+
+    def resume(self, job_id: str) -> Optional[BatchJob]:
+        """
+        Queues an interrupted or failed job again; it continues from its checkpoint.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in ("queued", "running"):
+            return job
+        job.status, job.error, job.runner = "queued", None, None
+        self._enqueue(job)
+        return job
+
+    def stop(self, job_id: str) -> Optional[BatchJob]:
+        """
+        Stops a running job after its in-flight records; it can be resumed later.
+        """
+        job = self.get(job_id)
+        if job is not None and job.runner is not None:
+            job.runner.stop()
+        return job
+
+    def _enqueue(self, job: BatchJob):
+        with self._lock:
+            self._jobs[job.job_id] = job
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name="batch-jobs", daemon=True)
+                self._worker.start()
+        self._queue.put(job)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            try:
+                job.runner = BatchRunner(self.controller_factory(), session_prefix=f"batch-{job.job_id}")
+                result = job.runner.run(job.input_path, job.output_path, job.fmt, job.query_field)
+                job.status = result["status"]
+            except Exception as e:
+                logger.exception(f"batch job {job.job_id} failed")
+                job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a CSV or JSONL file of inquiries with the agent.")
+    parser.add_argument("input", help="CSV or JSONL file, one inquiry per row")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: <input>.results.jsonl)")
+    parser.add_argument("--format", choices=FORMATS, help="input format (default: from the extension)")
+    parser.add_argument("--query-field", help=f"column or key holding the inquiry (default: first of {', '.join(QUERY_FIELDS)})")
+    parser.add_argument("--concurrency", type=int, help="records answered at once (default: BATCH_CONCURRENCY or 8)")
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint and start over")
+    args = parser.parse_args()
+
+    from src.agent_controller import AgentController
+    output = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    runner = BatchRunner(AgentController(), concurrency=args.concurrency)
+    try:
+        result = runner.run(args.input, output, args.format, args.query_field, resume=not args.fresh)
+    except BatchInputError as e:
+        parser.exit(2, f"error: {e}\n")
+    except KeyboardInterrupt:
+        result = runner.summary("interrupted")
+    print(json.dumps({"output": output, **result}, indent=2))
+    if result["status"] != "completed":
+        print("Run the same command again to resume.")
+
+
+if __name__ == "__main__":
+    main()
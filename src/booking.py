@@ -0,0 +1,417 @@
+# src/booking.py
+
+import hashlib
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from src.tracing import metrics, span
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+# Calendar API statuses worth retrying: rate limits and transient server errors.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+BOOKING_ATTEMPTS = metrics.counter(
+    "agent_booking_attempts_total", "Calendar calls made while booking, by operation and outcome.", ("operation", "outcome")
+)
+BOOKINGS = metrics.counter("agent_bookings_total", "Bookings by final status.", ("status",))
+BOOKING_SECONDS = metrics.histogram(
+    "agent_booking_confirm_seconds", "Time from reservation to the booking's final status.", ("status",)
+)
+
+
+def idempotency_key(calendar_id: str, start: datetime, duration_minutes: int, subject: str, owner: str) -> str:
+    """
+    Derives a stable key from what is being booked and by whom.
+
+    Asking twice for the same meeting (a retried tool call, a user repeating
+    themselves) gives the same key, so it maps to the same booking and the
+    same calendar event. The key is lowercase hex, which is valid both as a
+    Calendar event id and as a conference requestId.
+
+    Args:
+        calendar_id (str): Calendar the event goes into.
+        start (datetime): Timezone-aware start of the meeting.
+        duration_minutes (int): Length of the meeting.
+        subject (str): Meeting title; case and surrounding whitespace are ignored.
+        owner (str): Who is booking, e.g. the chat session id.
+
+    Returns:
+        str: A 32 character hex key.
+    """
+    content = "|".join([calendar_id, start.isoformat(), str(int(duration_minutes)), " ".join(subject.lower().split()), owner])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+
+def http_status(error: BaseException) -> Optional[int]:
+    """
+    Returns the HTTP status of a googleapiclient HttpError, or None for other errors.
+    """
+    resp = getattr(error, "resp", None)
+    status = getattr(resp, "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    True for rate limits, 5xx responses and dropped connections.
+    """
+    status = http_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return isinstance(error, (socket.timeout, TimeoutError, ConnectionError))
+
+
+def backoff_delay(attempt: int, base: float, cap: float, error: Optional[BaseException] = None) -> float:
+    """
+    Exponential backoff with full jitter; a Retry-After header, when present, is a lower bound.
+
+    Args:
+        attempt (int): Zero-based number of the attempt that just failed.
+        base (float): Delay scale in seconds.
+        cap (float): Upper bound of the exponential part in seconds.
+        error (BaseException): The error that caused the retry.
+
+    Returns:
+        float: Seconds to sleep before the next attempt.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    retry_after = getattr(getattr(error, "resp", None), "get", lambda *_: None)("retry-after")
+    try:
+        return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        return delay
+
+
+def call_with_retries(fn: Callable[[], Any], attempts: int = 5, base: float = 0.5, cap: float = 8.0,
+                      sleep: Callable[[float], None] = time.sleep, operation: str = "call") -> Any:
+    """
+    Calls fn(), retrying retryable errors with exponential backoff.
+
+    Args:
+        fn (Callable[[], Any]): The call, typically ending in .execute().
+        attempts (int): Maximum number of calls.
+        base (float): Backoff scale in seconds.
+        cap (float): Maximum backoff in seconds.
+        sleep (Callable[[float], None]): Used to wait between attempts.
+        operation (str): Label for the attempts metric.
+
+    Returns:
+        Any: What fn() returned.
+    """
+    for attempt in range(attempts):
+        try:
+            result = fn()
+        except Exception as e:
+            if attempt + 1 >= attempts or not is_retryable(e):
+                BOOKING_ATTEMPTS.inc(operation=operation, outcome="error")
+                raise
+            BOOKING_ATTEMPTS.inc(operation=operation, outcome="retry")
+            delay = backoff_delay(attempt, base, cap, e)
+            logger.warning(f"calendar call failed ({http_status(e) or type(e).__name__}), retrying in {delay:.2f}s")
+            sleep(delay)
+            continue
+        BOOKING_ATTEMPTS.inc(operation=operation, outcome="ok")
+        return result
+
+
+class Lease:
+    """
+    A slot held for one booking until it is confirmed, fails or expires.
+    """
+
+    __slots__ = ("key", "calendar_id", "start", "end", "expires_at")
+
+    def __init__(self, key: str, calendar_id: str, start: datetime, end: datetime, expires_at: float):
+        self.key = key
+        self.calendar_id = calendar_id
+        self.start = start
+        self.end = end
+        self.expires_at = expires_at
+
+
+class SlotLeases:
+    """
+    In-process reservation table: at most one booking holds any instant of a calendar.
+
+    Availability checks read a cache that every booking in flight has already
+    passed, so two users could both see a slot as free. Taking a lease is the
+    atomic step that decides who gets it. Leases expire after `ttl_seconds`
+    so a crashed booking cannot hold a slot forever.
+    """
+
+    def __init__(self, ttl_seconds: float = 120):
+        """
+        Args:
+            ttl_seconds (float): How long a lease is held without being released.
+        """
+        self.ttl_seconds = ttl_seconds
+        self._leases: Dict[str, List[Lease]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(leases) for leases in self._leases.values())
+
+    def acquire(self, key: str, calendar_id: str, start: datetime, end: datetime) -> Optional[Lease]:
+        """
+        Holds [start, end) for `key`.
+
+        Returns:
+            Optional[Lease]: The lease (the existing one if `key` already holds
+            this slot), or None if another booking overlaps it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            leases = [lease for lease in self._leases.get(calendar_id, []) if lease.expires_at > now]
+            self._leases[calendar_id] = leases
+            for lease in leases:
+                if lease.start < end and start < lease.end:
+                    return lease if lease.key == key else None
+            lease = Lease(key, calendar_id, start, end, now + self.ttl_seconds)
+            leases.append(lease)
+            return lease
+
+    def release(self, lease: Lease):
+        with self._lock:
+            leases = self._leases.get(lease.calendar_id, [])
+            if lease in leases:
+                leases.remove(lease)
+            if not leases:
+                self._leases.pop(lease.calendar_id, None)
+
+
+class Booking:
+    """
+    One meeting request and its progress through the queue.
+
+    Status goes from "reserved" to "confirmed", "conflict" (the slot was
+    taken outside this process) or "failed".
+    """
+
+    def __init__(self, key: str, calendar_id: str, start: datetime, end: datetime, subject: str,
+                 lease: Lease, on_done: Optional[Callable[["Booking"], None]] = None):
+        self.key = key
+        self.calendar_id = calendar_id
+        self.start = start
+        self.end = end
+        self.subject = subject
+        self.lease = lease
+        self.on_done = on_done
+        self.status = "reserved"
+        self.meet_link: Optional[str] = None
+        self.error: Optional[str] = None
+        self.reserved_at = time.monotonic()
+        self.done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+
+
+class BookingQueue:
+    """
+    Books meetings on background workers so a chat turn only waits for the reservation.
+
+    reserve() runs in the caller: it takes the slot lease, re-checks the
+    slot against the busy-interval cache and enqueues the booking. A worker
+    then re-reads the day from the Calendar API (catching bookings made by
+    other processes or by hand), inserts the event with the booking's
+    idempotency key as event id, and retries 429/5xx responses with backoff.
+    If an earlier attempt reached Google but its response was lost, the retry
+    gets a 409 and the existing event is fetched instead of creating a copy.
+
+    Bookings are remembered by key (up to `max_kept` finished ones), so
+    asking for the same meeting again returns its current state.
+    """
+
+    def __init__(self, service_getter: Callable[[], Any], freebusy_cache: Any, workers: Optional[int] = None,
+                 lease_seconds: Optional[float] = None, attempts: Optional[int] = None, verify: Optional[bool] = None,
+                 max_kept: int = 1000):
+        """
+        Args:
+            service_getter (Callable[[], Any]): Returns the Calendar API service.
+            freebusy_cache (FreeBusyCache): Shared busy-interval cache, updated with each new event.
+            workers (int): Booking threads. Defaults to BOOKING_WORKERS or 4.
+            lease_seconds (float): Lease TTL. Defaults to BOOKING_LEASE_SECONDS or 120.
+            attempts (int): Insert attempts per booking. Defaults to BOOKING_MAX_ATTEMPTS or 5.
+            verify (bool): Re-read the day from the API before inserting. Defaults to BOOKING_VERIFY_FRESH or true.
+            max_kept (int): Finished bookings remembered for repeated requests.
+        """
+        self.service_getter = service_getter
+        self.freebusy_cache = freebusy_cache
+        self.workers = workers or int(os.environ.get("BOOKING_WORKERS", 4))
+        self.leases = SlotLeases(lease_seconds or float(os.environ.get("BOOKING_LEASE_SECONDS", 120)))
+        self.attempts = attempts or int(os.environ.get("BOOKING_MAX_ATTEMPTS", 5))
+        self.backoff_base = float(os.environ.get("BOOKING_BACKOFF_SECONDS", 0.5))
+        self.backoff_cap = float(os.environ.get("BOOKING_BACKOFF_MAX_SECONDS", 8))
+        self.verify = verify if verify is not None else os.environ.get("BOOKING_VERIFY_FRESH", "true").lower() == "true"
+        self.max_kept = max_kept
+        self._bookings: "OrderedDict[str, Booking]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Booking]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+    def _start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"booking-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def get(self, key: str) -> Optional[Booking]:
+        with self._lock:
+            return self._bookings.get(key)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for booking in self._bookings.values() if not booking.done.is_set())
+
+    def reserve(self, key: str, calendar_id: str, start: datetime, end: datetime, subject: str,
+                on_done: Optional[Callable[[Booking], None]] = None) -> Optional[Booking]:
+        """
+        Holds the slot and queues the booking.
+
+        Returns:
+            Optional[Booking]: The booking (an existing one for a repeated
+            key), or None if the slot is taken.
+        """
+        with self._lock:
+            existing = self._bookings.get(key)
+            if existing is not None and existing.status in ("reserved", "confirmed"):
+                return existing
+        with span("booking.reserve", calendar=calendar_id) as reserve_span:
+            lease = self.leases.acquire(key, calendar_id, start, end)
+            if lease is None:
+                reserve_span.set(outcome="held")
+                return None
+            # Checked after taking the lease: a booking that just finished has
+            # added its event to the cache before releasing its lease.
+            try:
+                free = self._is_free(calendar_id, start, end)
+            except Exception:
+                self.leases.release(lease)
+                raise
+            if not free:
+                self.leases.release(lease)
+                reserve_span.set(outcome="busy")
+                return None
+            reserve_span.set(outcome="reserved")
+        booking = Booking(key, calendar_id, start, end, subject, lease, on_done)
+        with self._lock:
+            existing = self._bookings.get(key)
+            if existing is not None and existing.status in ("reserved", "confirmed"):
+                # A concurrent request for the same meeting got there first (and shares the lease).
+                return existing
+            self._bookings[key] = booking
+            self._bookings.move_to_end(key)
+            while len(self._bookings) > self.max_kept:
+                oldest_key, oldest = next(iter(self._bookings.items()))
+                if not oldest.done.is_set():
+                    break
+                del self._bookings[oldest_key]
+            self._start()
+        self._queue.put(booking)
+        return booking
+
+    def _work(self):
+        while True:
+            booking = self._queue.get()
+            try:
+                self._book(booking)
+            except Exception as e:
+                logger.exception(f"booking {booking.key} failed: {e}")
+                booking.status, booking.error = "failed", f"{type(e).__name__}: {e}"
+            finally:
+                self.leases.release(booking.lease)
+                BOOKINGS.inc(status=booking.status)
+                BOOKING_SECONDS.observe(time.monotonic() - booking.reserved_at, status=booking.status)
+                if booking.on_done is not None:
+                    try:
+                        booking.on_done(booking)
+                    except Exception as e:
+                        logger.warning(f"booking callback failed: {e}")
+                booking.done.set()
+                self._queue.task_done()
+
+    def _is_free(self, calendar_id: str, start: datetime, end: datetime) -> bool:
+        # A cache miss reads the day from the API, which can be rate limited too.
+        return call_with_retries(lambda: self.freebusy_cache.is_free(calendar_id, start, end), self.attempts,
+                                 self.backoff_base, self.backoff_cap, operation="read")
+
+    def _event_body(self, booking: Booking) -> Dict[str, Any]:
+        return {
+            "id": booking.key,
+            "summary": booking.subject,
+            "start": {"dateTime": booking.start.isoformat(), "timeZone": "UTC"},
+            "end": {"dateTime": booking.end.isoformat(), "timeZone": "UTC"},
+            "conferenceData": {
+                "createRequest": {
+                    "requestId": booking.key,
+                    "conferenceSolutionKey": {"type": "hangoutsMeet"},
+                }
+            },
+        }
+
+    def _book(self, booking: Booking):
+        with span("booking.confirm", calendar=booking.calendar_id) as confirm_span:
+            if self.verify:
+                # The cache may be up to a TTL old; re-read the days being booked.
+                day = booking.start.date()
+                while day <= (booking.end - timedelta(microseconds=1)).date():
+                    self.freebusy_cache.invalidate(booking.calendar_id, day)
+                    day += timedelta(days=1)
+                if not self._is_free(booking.calendar_id, booking.start, booking.end):
+                    booking.status = "conflict"
+                    confirm_span.set(status="conflict")
+                    return
+            service = self.service_getter()
+            event = call_with_retries(lambda: self._insert(service, booking), self.attempts,
+                                      self.backoff_base, self.backoff_cap, operation="insert")
+            self.freebusy_cache.add_busy(booking.calendar_id, booking.start, booking.end)
+            entry_points = event.get("conferenceData", {}).get("entryPoints", [])
+            booking.meet_link = entry_points[0]["uri"] if entry_points else None
+            booking.status = "confirmed"
+            confirm_span.set(status="confirmed")
+
+    def _insert(self, service: Any, booking: Booking) -> Dict[str, Any]:
+        try:
+            with span("calendar.insert_event", calendar=booking.calendar_id):
+                return service.events().insert(
+                    calendarId=booking.calendar_id,
+                    body=self._event_body(booking),
+                    conferenceDataVersion=1,
+                ).execute()
+        except Exception as e:
+            if http_status(e) != 409:
+                raise
+        # 409: the event id exists, so an earlier attempt went through.
+        logger.info(f"booking {booking.key} already on the calendar, fetching it")
+        with span("calendar.get_event", calendar=booking.calendar_id):
+            return service.events().get(calendarId=booking.calendar_id, eventId=booking.key).execute()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every queued booking is finished; True if it did within `timeout`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                waiting = [booking for booking in self._bookings.values() if not booking.done.is_set()]
+            if not waiting:
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            waiting[0].wait(remaining)
@@ -0,0 +1,238 @@
+# src/calendar_prefetch.py
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pytz
+
+from src.message_parsing import TIME_RE, extract_dates, extract_times
+from src.tracing import metrics, span
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+PREFETCH_DAYS = metrics.counter(
+    "agent_calendar_prefetch_days_total",
+    "Calendar days fetched ahead of the LLM, by what the tools made of them (hit, unused) "
+    "and days the tools needed that were not prefetched (miss).",
+    ("outcome",),
+)
+PREFETCH_SAVED = metrics.counter(
+    "agent_calendar_prefetch_saved_seconds_total",
+    "Calendar latency taken off agent turns by prefetching.",
+)
+
+_current: contextvars.ContextVar[Optional["TurnPrefetch"]] = contextvars.ContextVar("calendar_prefetch", default=None)
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _prefetch_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("CALENDAR_PREFETCH_THREADS", 4)), thread_name_prefix="calendar-prefetch"
+                )
+    return _pool
+
+
+class _Fetch:
+    def __init__(self, started: float):
+        self.future: Optional[Future] = None
+        self.started = started
+        self.finished: Optional[float] = None
+        self.claimed = False
+
+
+class TurnPrefetch:
+    """
+    The calendar days being fetched for one agent turn.
+    """
+
+    def __init__(self, prefetcher: "CalendarPrefetcher"):
+        self.prefetcher = prefetcher
+        self.fetches: Dict[Tuple[str, date], _Fetch] = {}
+
+    def finish(self):
+        with self.prefetcher._lock:
+            unused = sum(1 for fetch in self.fetches.values() if not fetch.claimed)
+            self.prefetcher.unused += unused
+        if unused:
+            PREFETCH_DAYS.inc(unused, outcome="unused")
+
+
+class CalendarPrefetcher:
+    """
+    Starts the calendar reads a turn will probably need while the LLM plans.
+
+    The user message is scanned for dates and times; the UTC days the
+    availability tools would read for them (the working hours of each date,
+    and the requested slot when a time is given) are fetched on a
+    background pool through the free/busy cache. Tool calls of the same
+    turn then take the prefetched day, waiting for it if it is still in
+    flight, instead of issuing their own request (see claim_prefetched()).
+    """
+
+    def __init__(self, cache, calendar_id: str, slot_engine, max_days: int = 3,
+                 meeting_minutes: int = 60):
+        """
+        Args:
+            cache (FreeBusyCache): Cache the prefetched days are read through.
+            calendar_id (str): Calendar the tools read.
+            slot_engine (SlotEngine): Gives the working hours of a date.
+            max_days (int): Most days prefetched for one message.
+            meeting_minutes (int): Slot length assumed for a time without a duration.
+        """
+        self.cache = cache
+        self.calendar_id = calendar_id
+        self.slot_engine = slot_engine
+        self.max_days = max_days
+        self.meeting_minutes = meeting_minutes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.unused = 0
+        self.saved_seconds = 0.0
+
+    def days_for(self, text: str, today: Optional[date] = None) -> List[date]:
+        """
+        Returns the UTC days the tools would read to answer `text`.
+        """
+        dates = extract_dates(text, today)
+        if not dates:
+            return []
+        times = extract_times(text) if TIME_RE.search(text) else []
+        days: List[date] = []
+
+        def add(start: datetime, end: datetime):
+            day = start.astimezone(pytz.UTC).date()
+            while day <= (end - timedelta(microseconds=1)).astimezone(pytz.UTC).date():
+                if day not in days:
+                    days.append(day)
+                day += timedelta(days=1)
+
+        for requested in dates:
+            for _, start, end in self.slot_engine.working_windows(requested, requested):
+                add(start, end)
+            for clock in times:
+                start = pytz.UTC.localize(datetime.strptime(f"{requested.isoformat()} {clock}", "%Y-%m-%d %H:%M"))
+                add(start, start + timedelta(minutes=self.meeting_minutes))
+        return days[:self.max_days]
+
+    def start(self, text: str) -> Optional[TurnPrefetch]:
+        """
+        Starts fetching the days `text` refers to that are not already cached.
+
+        Returns:
+            Optional[TurnPrefetch]: The turn's prefetch, to be bound with
+            bind_prefetch(); None when the message names no dates.
+        """
+        try:
+            days = self.days_for(text)
+        except Exception as e:
+            logger.debug(f"calendar prefetch skipped: {e}")
+            return None
+        if not days:
+            return None
+        prefetch = TurnPrefetch(self)
+        pool = _prefetch_pool()
+        for day in days:
+            if self.cache.is_cached(self.calendar_id, day):
+                continue
+            started = time.monotonic()
+            # The fetch runs in a copy of this context so its spans join the
+            # turn's trace; the prefetch itself is not bound there yet.
+            context = contextvars.copy_context()
+            fetch = _Fetch(started)
+            fetch.future = pool.submit(context.run, self._fetch, day, fetch)
+            prefetch.fetches[(self.calendar_id, day)] = fetch
+        logger.debug(f"calendar prefetch of {len(prefetch.fetches)} days for {[d.isoformat() for d in days]}")
+        return prefetch
+
+    def _fetch(self, day: date, fetch: _Fetch):
+        _current.set(None)  # never wait on our own fetch
+        try:
+            with span("calendar.prefetch", day=day.isoformat()):
+                return self.cache.busy_for_day(self.calendar_id, day)
+        finally:
+            fetch.finished = time.monotonic()
+
+    def stats(self):
+        """
+        Returns hit/miss/unused counts, the hit rate and the latency saved so far.
+        """
+        with self._lock:
+            needed = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "unused": self.unused,
+                "hit_rate": self.hits / needed if needed else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
+
+
+@contextmanager
+def bind_prefetch(prefetch: Optional[TurnPrefetch]) -> Iterator[Optional[TurnPrefetch]]:
+    """
+    Makes `prefetch` the current turn's prefetch for the enclosed block and
+    counts the prefetched days no tool asked for when the block ends.
+    """
+    token = _current.set(prefetch)
+    try:
+        yield prefetch
+    finally:
+        _current.reset(token)
+        if prefetch is not None:
+            prefetch.finish()
+
+
+def claim_prefetched(calendar_id: str, day: date, cached: bool = False):
+    """
+    Returns the current turn's prefetched busy intervals for a day, or None.
+
+    Called by the free/busy cache for every day a tool reads. `cached` says
+    the cache can already answer, in which case the call only records that
+    the prefetch was used. Otherwise a fetch still in flight is waited for;
+    a failed prefetch returns None so the caller fetches (and reports the
+    error) as usual.
+    """
+    prefetch = _current.get()
+    if prefetch is None:
+        return None
+    prefetcher = prefetch.prefetcher
+    fetch = prefetch.fetches.get((calendar_id, day))
+    if cached and (fetch is None or not fetch.future.done()):
+        return None
+    claimed_at = time.monotonic()
+    busy = None
+    if fetch is not None:
+        try:
+            busy = fetch.future.result()
+        except Exception as e:
+            logger.debug(f"calendar prefetch of {day} failed, fetching again: {e}")
+    if busy is None:
+        if not cached:
+            PREFETCH_DAYS.inc(outcome="miss")
+            with prefetcher._lock:
+                prefetcher.misses += 1
+        return None
+    with prefetcher._lock:
+        if fetch.claimed:
+            return busy
+        fetch.claimed = True
+        # The part of the fetch that ran before the tool asked for it.
+        saved = max(0.0, min(fetch.finished or claimed_at, claimed_at) - fetch.started)
+        prefetcher.hits += 1
+        prefetcher.saved_seconds += saved
+    PREFETCH_DAYS.inc(outcome="hit")
+    PREFETCH_SAVED.inc(saved)
+    return busy
@@ -0,0 +1,616 @@
+# src/conversation_store.py
+
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from src.tracing import metrics
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+STORE_SECONDS = metrics.histogram(
+    "agent_session_store_seconds", "Session store calls by operation.", ("backend", "operation"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+# Message encoding: format byte, role byte, flags byte, then the body
+# (varint-prefixed content and additional_kwargs JSON), zlib-compressed
+# when that makes it smaller.
+FORMAT_VERSION = 1
+ROLES = [role for role in MessageRole]
+ROLE_CODES = {role: i for i, role in enumerate(ROLES)}
+HAS_CONTENT, HAS_KWARGS, COMPRESSED = 1, 2, 4
+COMPRESS_MIN_BYTES = 256
+
+
+class SessionStoreError(Exception):
+    """Raised when the session store backend fails or answers with an error."""
+
+
+class StoreConnectionError(SessionStoreError):
+    """Raised when the connection to the store breaks; a write sent on it may or may not have been applied."""
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _jsonable(value: Any) -> Any:
+    # Tool calls from the OpenAI-style clients are pydantic models.
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+def encode_message(message: ChatMessage) -> bytes:
+    """
+    Serializes a chat message into the compact binary format.
+
+    Args:
+        message (ChatMessage): Message to encode; tool calls in additional_kwargs become plain dicts.
+
+    Returns:
+        bytes: The encoded message.
+    """
+    flags = 0
+    body = bytearray()
+    if message.content is not None:
+        flags |= HAS_CONTENT
+        content = str(message.content).encode("utf-8")
+        body += _varint(len(content)) + content
+    if message.additional_kwargs:
+        flags |= HAS_KWARGS
+        kwargs = json.dumps(message.additional_kwargs, separators=(",", ":"), default=_jsonable).encode("utf-8")
+        body += _varint(len(kwargs)) + kwargs
+    payload = bytes(body)
+    if len(payload) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            flags |= COMPRESSED
+            payload = compressed
+    return struct.pack("BBB", FORMAT_VERSION, ROLE_CODES[message.role], flags) + payload
+
+
+def decode_message(data: bytes) -> ChatMessage:
+    """
+    Inverse of encode_message().
+    """
+    version, role, flags = struct.unpack_from("BBB", data)
+    if version != FORMAT_VERSION:
+        raise SessionStoreError(f"unknown message format {version}")
+    body = data[3:]
+    if flags & COMPRESSED:
+        body = zlib.decompress(body)
+    pos = 0
+    content = None
+    kwargs: Dict[str, Any] = {}
+    if flags & HAS_CONTENT:
+        length, pos = _read_varint(body, pos)
+        content = body[pos:pos + length].decode("utf-8")
+        pos += length
+    if flags & HAS_KWARGS:
+        length, pos = _read_varint(body, pos)
+        kwargs = json.loads(body[pos:pos + length])
+    return ChatMessage(role=ROLES[role], content=content, additional_kwargs=kwargs)
+
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    return json.dumps(state, separators=(",", ":"), default=_jsonable).encode("utf-8")
+
+
+def decode_state(data: Optional[bytes]) -> Optional[Dict[str, Any]]:
+    if not data:
+        return None
+    state = json.loads(data)
+    if isinstance(state.get("start_time"), str):
+        state["start_time"] = datetime.fromisoformat(state["start_time"])
+    return state
+
+
+class SessionWrite(NamedTuple):
+    """What one or more turns of a session add to the store."""
+    session_id: str
+    state: bytes
+    messages: List[bytes]
+
+
+class StoredSession(NamedTuple):
+    """A session as loaded from the store: its version, state and most recent messages."""
+    version: int
+    state: Optional[Dict[str, Any]]
+    messages: List[ChatMessage]
+
+
+class SessionStore:
+    """
+    Durable conversation storage shared by every replica.
+
+    Each session has a version that every save increments, its tool-side
+    state (name, meetings, ...) and an append-only list of encoded chat
+    messages of which the last `max_messages` are kept. Sessions untouched
+    for `ttl_seconds` expire.
+    """
+
+    backend = "base"
+
+    def __init__(self, max_messages: int = 200, ttl_seconds: float = 7 * 86400):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+
+    def _timed(self, operation: str, fn: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            STORE_SECONDS.observe(time.perf_counter() - started, backend=self.backend, operation=operation)
+
+    def version(self, session_id: str) -> int:
+        """
+        Returns the stored version of a session (0 if it was never saved).
+        """
+        return self._timed("version", lambda: self._version(session_id))
+
+    def load(self, session_id: str, last_messages: int) -> StoredSession:
+        """
+        Loads a session's state and only its `last_messages` most recent messages.
+        """
+        return self._timed("load", lambda: self._load(session_id, last_messages))
+
+    def save_many(self, writes: Sequence[SessionWrite]) -> Dict[str, Tuple[int, int]]:
+        """
+        Applies a batch of writes in one transaction or round trip.
+
+        Returns:
+            Dict[str, Tuple[int, int]]: Per session, the version before the
+            batch and the version after it.
+        """
+        return self._timed("save", lambda: self._save_many(writes))
+
+    def delete(self, session_id: str):
+        self._timed("delete", lambda: self._delete(session_id))
+
+    def _version(self, session_id: str) -> int:
+        raise NotImplementedError
+
+    def _load(self, session_id: str, last_messages: int) -> StoredSession:
+        raise NotImplementedError
+
+    def _save_many(self, writes: Sequence[SessionWrite]) -> Dict[str, Tuple[int, int]]:
+        raise NotImplementedError
+
+    def _delete(self, session_id: str):
+        raise NotImplementedError
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in a local SQLite file (WAL mode), shared by the worker processes of one host.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY, version INTEGER NOT NULL, count INTEGER NOT NULL,
+                    state BLOB, updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL, seq INTEGER NOT NULL, data BLOB NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                ) WITHOUT ROWID;
+            """)
+            expired = [row[0] for row in db.execute(
+                "SELECT id FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+            )]
+            for session_id in expired:
+                self._delete_rows(db, session_id)
+        if expired:
+            logger.info(f"session store: dropped {len(expired)} expired sessions")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _version(self, session_id: str) -> int:
+        row = self._connection().execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _load(self, session_id: str, last_messages: int) -> StoredSession:
+        db = self._connection()
+        row = db.execute("SELECT version, state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return StoredSession(0, None, [])
+        rows = db.execute(
+            "SELECT data FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?", (session_id, last_messages)
+        ).fetchall()
+        return StoredSession(row[0], decode_state(row[1]), [decode_message(data) for (data,) in reversed(rows)])
+
+    def _save_many(self, writes: Sequence[SessionWrite]) -> Dict[str, Tuple[int, int]]:
+        db = self._connection()
+        versions: Dict[str, Tuple[int, int]] = {}
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for write in writes:
+                row = db.execute("SELECT version, count FROM sessions WHERE id = ?", (write.session_id,)).fetchone()
+                version, count = row if row else (0, 0)
+                db.executemany(
+                    "INSERT INTO messages (session_id, seq, data) VALUES (?, ?, ?)",
+                    [(write.session_id, count + i, data) for i, data in enumerate(write.messages)],
+                )
+                count += len(write.messages)
+                db.execute(
+                    "INSERT INTO sessions (id, version, count, state, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET version = excluded.version, count = excluded.count, "
+                    "state = excluded.state, updated_at = excluded.updated_at",
+                    (write.session_id, version + 1, count, write.state, now),
+                )
+                if count > self.max_messages:
+                    db.execute("DELETE FROM messages WHERE session_id = ? AND seq < ?",
+                               (write.session_id, count - self.max_messages))
+                versions[write.session_id] = (version, version + 1)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return versions
+
+    @staticmethod
+    def _delete_rows(db: sqlite3.Connection, session_id: str):
+        db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def _delete(self, session_id: str):
+        self._delete_rows(self._connection(), session_id)
+
+
+class RespConnection:
+    """
+    Minimal client for the Redis wire protocol (RESP2), one socket per thread.
+
+    Covers what the session store needs: single commands and pipelines of
+    commands sent in one write, with one reconnect on a broken connection.
+    """
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock, self._local.file = sock, sock.makefile("rb")
+        setup = ([("AUTH", self.password)] if self.password else []) + ([("SELECT", self.db)] if self.db else [])
+        if setup:
+            self._round_trip(setup)
+
+    @staticmethod
+    def _encode(args: Sequence[Any]) -> bytes:
+        out = bytearray(b"*%d\r\n" % len(args))
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out += b"$%d\r\n%s\r\n" % (len(data), data)
+        return bytes(out)
+
+    def _read(self) -> Any:
+        line = self._local.file.readline()
+        if not line:
+            raise ConnectionError("connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return SessionStoreError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.file.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise SessionStoreError(f"unexpected reply {line!r}")
+
+    def _round_trip(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        self._local.sock.sendall(b"".join(self._encode(command) for command in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, SessionStoreError):
+                raise reply
+        return replies
+
+    def pipeline(self, commands: Sequence[Sequence[Any]], retry: bool = True) -> List[Any]:
+        """
+        Sends all commands at once and returns their replies in order.
+
+        Args:
+            commands (Sequence[Sequence[Any]]): The commands to send.
+            retry (bool): Send them again on a new connection if the first one
+                breaks; only safe for commands that may run twice (reads).
+        """
+        for attempt in range(2 if retry else 1):
+            try:
+                if getattr(self._local, "sock", None) is None:
+                    self._connect()
+                return self._round_trip(commands)
+            except (ConnectionError, OSError) as e:
+                if getattr(self._local, "sock", None) is not None:
+                    self._local.sock.close()
+                self._local.sock = None
+                if attempt or not retry:
+                    raise StoreConnectionError(f"redis at {self.host}:{self.port} unavailable: {e}") from e
+
+    def execute(self, *args: Any) -> Any:
+        return self.pipeline([args])[0]
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Session store on any server speaking the Redis protocol, shared by replicas on any host.
+
+    Keys per session: `<prefix><id>:v` (version counter), `:state` and `:msgs`
+    (a list of encoded messages). A save is one MULTI/EXEC transaction for
+    the whole batch, which also sets each session's `:w` key to a token of
+    the batch. Writes are never re-sent blindly: when the connection breaks
+    the batch may already have been applied, so the next save of those
+    sessions first reads `:w` and leaves out the messages that made it.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, prefix: str = "chat:", **kwargs: Any):
+        super().__init__(**kwargs)
+        self.connection = RespConnection(url)
+        self.prefix = prefix
+        # session id -> (batch token, messages in that write) for writes whose outcome is unknown
+        self._unresolved: Dict[str, Tuple[str, int]] = {}
+        self._unresolved_lock = threading.Lock()
+
+    def _key(self, session_id: str, part: str) -> str:
+        return f"{self.prefix}{session_id}:{part}"
+
+    def _version(self, session_id: str) -> int:
+        value = self.connection.execute("GET", self._key(session_id, "v"))
+        return int(value) if value else 0
+
+    def _load(self, session_id: str, last_messages: int) -> StoredSession:
+        version, state, messages = self.connection.pipeline([
+            ("GET", self._key(session_id, "v")),
+            ("GET", self._key(session_id, "state")),
+            ("LRANGE", self._key(session_id, "msgs"), -last_messages, -1),
+        ])
+        # The session is reloaded from what the store holds; its next write starts from there.
+        with self._unresolved_lock:
+            self._unresolved.pop(session_id, None)
+        if not version:
+            return StoredSession(0, None, [])
+        return StoredSession(int(version), decode_state(state), [decode_message(data) for data in messages or []])
+
+    def _resolve(self, writes: Sequence[SessionWrite]) -> Dict[str, int]:
+        # Messages at the start of each write that an earlier, interrupted
+        # write already stored. A retried write always starts with the
+        # messages of the one that failed (see SessionPool.persist).
+        with self._unresolved_lock:
+            unresolved = [(write.session_id, self._unresolved.pop(write.session_id))
+                          for write in writes if write.session_id in self._unresolved]
+        if not unresolved:
+            return {}
+        try:
+            markers = self.connection.pipeline([("GET", self._key(session_id, "w")) for session_id, _ in unresolved])
+        except Exception:
+            with self._unresolved_lock:
+                for session_id, pending in unresolved:
+                    self._unresolved.setdefault(session_id, pending)
+            raise
+        return {
+            session_id: count
+            for (session_id, (token, count)), marker in zip(unresolved, markers)
+            if marker is not None and marker.decode() == token
+        }
+
+    def _save_many(self, writes: Sequence[SessionWrite], resend: bool = True) -> Dict[str, Tuple[int, int]]:
+        ttl = int(self.ttl_seconds)
+        landed = self._resolve(writes)
+        token = uuid.uuid4().hex
+        commands: List[Tuple[Any, ...]] = [("MULTI",)]
+        version_index: Dict[str, int] = {}
+        for write in writes:
+            msgs, state, version, marker = (self._key(write.session_id, part) for part in ("msgs", "state", "v", "w"))
+            messages = write.messages[landed.get(write.session_id, 0):]
+            if messages:
+                commands.append(("RPUSH", msgs, *messages))
+                commands.append(("LTRIM", msgs, -self.max_messages, -1))
+            commands.append(("SET", state, write.state, "EX", ttl))
+            version_index[write.session_id] = len(commands) - 1  # position in the EXEC reply
+            commands.append(("INCR", version))
+            commands.append(("EXPIRE", version, ttl))
+            commands.append(("EXPIRE", msgs, ttl))
+            commands.append(("SET", marker, token, "EX", ttl))
+        commands.append(("EXEC",))
+        try:
+            replies = self.connection.pipeline(commands, retry=False)[-1]
+        except StoreConnectionError:
+            with self._unresolved_lock:
+                for write in writes:
+                    self._unresolved[write.session_id] = (token, len(write.messages))
+            if not resend:
+                raise
+            # Usually a connection the server had closed; find out what was applied and send the rest.
+            return self._save_many(writes, resend=False)
+        for reply in replies:
+            if isinstance(reply, SessionStoreError):
+                raise reply
+        # A write that an interrupted attempt already applied counted one version more.
+        return {
+            session_id: (replies[i] - 1 - (session_id in landed), replies[i])
+            for session_id, i in version_index.items()
+        }
+
+    def _delete(self, session_id: str):
+        with self._unresolved_lock:
+            self._unresolved.pop(session_id, None)
+        self.connection.execute("DEL", *(self._key(session_id, part) for part in ("v", "state", "msgs", "w")))
+
+
+class WriteBehind:
+    """
+    Batches session writes and applies them on a background thread.
+
+    Writes are coalesced per session and flushed every `interval` seconds
+    (or as soon as `max_batch` sessions are waiting), so a chat turn only
+    pays for encoding its new messages. A failed batch is retried on the
+    next flush, up to three times; after that the write is given up and its
+    failure callbacks run, so the session re-sends the changes with its next
+    turn (a newer write already queued for the session carries them instead).
+    """
+
+    def __init__(self, store: SessionStore, interval: float = 0.02, max_batch: int = 256):
+        self.store = store
+        self.interval = interval
+        self.max_batch = max_batch
+        self._pending: Dict[str, Tuple[SessionWrite, List[Tuple[Callable[[int, int], None], Optional[Callable[[], None]]]], int]] = {}
+        self._condition = threading.Condition()
+        self._flushing = False
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+
+    def submit(self, write: SessionWrite, on_saved: Callable[[int, int], None],
+               on_failed: Optional[Callable[[], None]] = None):
+        """
+        Queues a write; `on_saved(before, after)` runs once it is stored, `on_failed()` if it is given up.
+        """
+        with self._condition:
+            queued = self._pending.get(write.session_id)
+            if queued is not None:
+                previous, callbacks, attempts = queued
+                write = SessionWrite(write.session_id, write.state, previous.messages + write.messages)
+                self._pending[write.session_id] = (write, callbacks + [(on_saved, on_failed)], attempts)
+            else:
+                self._pending[write.session_id] = (write, [(on_saved, on_failed)], 0)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-write-behind", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait(self.interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Writes everything pending now, in the calling thread.
+        """
+        with self._condition:
+            while self._flushing:
+                self._condition.wait()
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._flushing = True
+        try:
+            results = self.store.save_many([write for write, _, _ in batch.values()])
+        except Exception as e:
+            logger.warning(f"session store write of {len(batch)} sessions failed: {e}")
+            results = None
+        with self._condition:
+            self._flushing = False
+            if results is None:
+                for session_id, (write, callbacks, attempts) in batch.items():
+                    if session_id in self._pending:
+                        # A newer write of the session is queued; it carries these changes too.
+                        newer, newer_callbacks, newer_attempts = self._pending[session_id]
+                        merged = SessionWrite(session_id, newer.state, write.messages + newer.messages)
+                        retries = attempts + 1 if attempts < 2 else newer_attempts
+                        self._pending[session_id] = (merged, callbacks + newer_callbacks, retries)
+                    elif attempts < 2:
+                        self._pending[session_id] = (write, callbacks, attempts + 1)
+                    else:
+                        # The session keeps serving from its local copy and re-sends
+                        # the changes with its next turn. Run under the lock, so no
+                        # newer write of the session can be queued in between.
+                        logger.error(f"session '{session_id}' write given up after 3 failures; retried with its next turn")
+                        for _, on_failed in callbacks:
+                            if on_failed is not None:
+                                on_failed()
+            self._condition.notify_all()
+        if results is None:
+            return
+        for session_id, (_, callbacks, _) in batch.items():
+            before, after = results[session_id]
+            for on_saved, _ in callbacks:
+                on_saved(before, after)
+
+
+def open_session_store() -> Optional[SessionStore]:
+    """
+    Opens the store selected by SESSION_STORE (none, sqlite or redis); None keeps sessions in process only.
+    """
+    backend = os.environ.get("SESSION_STORE", "none").lower()
+    options = {
+        "max_messages": int(os.environ.get("SESSION_STORE_MAX_MESSAGES", 200)),
+        "ttl_seconds": float(os.environ.get("SESSION_STORE_TTL_SECONDS", 7 * 86400)),
+    }
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.environ.get("SESSION_STORE_PATH", "sessions.db"), **options)
+    if backend == "redis":
+        return RedisSessionStore(os.environ.get("SESSION_STORE_URL", "redis://127.0.0.1:6379/0"), **options)
+    if backend not in ("", "none", "memory"):
+        raise ValueError(f"unknown SESSION_STORE '{backend}' (expected none, sqlite or redis)")
+    return None
@@ -0,0 +1,145 @@
+# src/embedding_pipeline.py
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+EMBED_BACKENDS = ("huggingface", "onnx")
+
+
+def build_embed_model(model_name: str, backend: str = "huggingface", batch_size: int = 64):
+    """
+    Creates the embedding model for a backend.
+
+    "huggingface" is the PyTorch sentence-transformers path. "onnx" runs the
+    int8-quantized ONNX export of the model on ONNX Runtime through
+    fastembed (pip install llama-index-embeddings-fastembed); it needs no
+    PyTorch and uses a fraction of the memory on CPU.
+
+    Args:
+        model_name (str): Hugging Face model id, e.g. "BAAI/bge-small-en-v1.5".
+        backend (str): One of EMBED_BACKENDS.
+        batch_size (int): Texts per forward pass.
+
+    Returns:
+        BaseEmbedding: The embedding model.
+    """
+    if backend == "onnx":
+        try:
+            from llama_index.embeddings.fastembed import FastEmbedEmbedding
+        except ImportError as e:
+            raise ImportError(
+                "FAQ_EMBED_BACKEND=onnx needs llama-index-embeddings-fastembed"
+            ) from e
+        return FastEmbedEmbedding(model_name=model_name, embed_batch_size=batch_size)
+    if backend != "huggingface":
+        raise ValueError(f"unknown embedding backend '{backend}', expected one of {EMBED_BACKENDS}")
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name=model_name, embed_batch_size=batch_size)
+
+
+def store_model_name(model_name: str, backend: str) -> str:
+    """
+    Returns the model name recorded in the index store.
+
+    Vectors from different backends are close but not identical, so a
+    backend switch re-embeds everything; the default backend keeps the
+    plain model name so existing stores stay valid.
+    """
+    return model_name if backend == "huggingface" else f"{model_name}@{backend}"
+
+
+def parse_pdf(path: str) -> List[dict]:
+    """
+    Parses one PDF into chunk records (plain dicts, so they can cross process boundaries).
+
+    Each record holds the chunk text, its metadata and excluded metadata
+    keys, and "embed_text", the exact text the embedding model sees.
+    """
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.core.schema import MetadataMode
+
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    records = []
+    for node in SentenceSplitter().get_nodes_from_documents(documents):
+        records.append({
+            "text": node.get_content(metadata_mode=MetadataMode.NONE),
+            "metadata": node.metadata,
+            "excluded_embed_metadata_keys": node.excluded_embed_metadata_keys,
+            "excluded_llm_metadata_keys": node.excluded_llm_metadata_keys,
+            "embed_text": node.get_content(metadata_mode=MetadataMode.EMBED),
+        })
+    return records
+
+
+def parse_pdfs(paths: Sequence[str], workers: int = 1) -> Dict[str, List[dict]]:
+    """
+    Parses and chunks several PDFs, in parallel worker processes when there is more than one.
+
+    PDF text extraction is pure Python, so threads would serialize on the
+    GIL. While the process has a single thread (ingestion scripts), workers
+    are forked: they start instantly with the parsing stack already
+    imported. Forking is not safe once other threads run (a lock held by
+    one, e.g. a logging handler's, stays locked in the child), so the app's
+    warm-up thread gets its workers from a fork server instead; those
+    re-import the entry script, whose warm_up() then does nothing. Where
+    neither is available the files are parsed one after another.
+
+    Args:
+        paths (Sequence[str]): PDF files to parse.
+        workers (int): Maximum number of worker processes.
+
+    Returns:
+        Dict[str, List[dict]]: Chunk records per path.
+    """
+    workers = min(workers, len(paths))
+    methods = multiprocessing.get_all_start_methods()
+    method = "fork" if threading.active_count() == 1 and "fork" in methods else "forkserver"
+    if workers <= 1 or method not in methods:
+        return {path: parse_pdf(path) for path in paths}
+    context = multiprocessing.get_context(method)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return dict(zip(paths, pool.map(parse_pdf, paths)))
+
+
+def embed_texts(embed_model, texts: Sequence[str], batch_size: int = 64) -> np.ndarray:
+    """
+    Embeds texts batch by batch into a preallocated float32 matrix.
+
+    Only one batch of Python float lists is alive at a time, so peak memory
+    is the output matrix plus a single batch regardless of corpus size.
+
+    Args:
+        embed_model: Embedding model with get_text_embedding_batch().
+        texts (Sequence[str]): Texts to embed.
+        batch_size (int): Texts per call to the model.
+
+    Returns:
+        np.ndarray: One row per text.
+    """
+    matrix = None
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        vectors = np.asarray(embed_model.get_text_embedding_batch(list(batch)), dtype=np.float32)
+        if matrix is None:
+            matrix = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        matrix[start:start + len(batch)] = vectors
+    if matrix is None:
+        return np.zeros((0, 0), dtype=np.float32)
+    return matrix
+
+
+def default_workers() -> int:
+    """
+    Returns FAQ_PARSE_WORKERS, or up to four workers bounded by the CPU count.
+    """
+    return int(os.environ.get("FAQ_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
@@ -0,0 +1,118 @@
+# src/faq_answers.py
+
+import os
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+# "3. Can I change my order after placing it?" starts a Q/A pair.
+QUESTION_RE = re.compile(r"^\s*\d+\.\s+(.+\?)\s*$")
+
+
+def extract_qa_pairs(path: str) -> List[Dict[str, str]]:
+    """
+    Extracts numbered question/answer pairs from an FAQ PDF.
+
+    A line such as "3. Can I change my order after placing it?" starts a
+    pair; the lines up to the next numbered question form its answer.
+
+    Args:
+        path (str): PDF file laid out as a numbered FAQ.
+
+    Returns:
+        List[Dict[str, str]]: Pairs with "question", "answer", "file" and "page".
+    """
+    from llama_index.core import SimpleDirectoryReader
+
+    pairs: List[Dict[str, str]] = []
+    current = None
+    for document in SimpleDirectoryReader(input_files=[path]).load_data():
+        for line in document.text.splitlines():
+            match = QUESTION_RE.match(line)
+            if match:
+                current = {
+                    "question": match.group(1).strip(),
+                    "answer": "",
+                    "file": os.path.basename(path),
+                    "page": document.metadata.get("page_label", ""),
+                }
+                pairs.append(current)
+            elif current is not None and line.strip():
+                current["answer"] = f"{current['answer']} {line.strip()}".strip()
+    return [pair for pair in pairs if pair["answer"]]
+
+
+class QAMatcher:
+    """
+    Matches a question embedding against curated FAQ questions.
+
+    Curated answers are exact company wording, so a close enough match is
+    returned as is, without retrieval or an LLM call.
+    """
+
+    def __init__(self, pairs: Sequence[Dict[str, str]], embed_fn: Callable[[str], List[float]], threshold: float = 0.9):
+        """
+        Args:
+            pairs (Sequence[Dict]): Q/A pairs from extract_qa_pairs().
+            embed_fn (Callable[[str], List[float]]): Embeds a question (same model as the query vectors).
+            threshold (float): Minimum cosine similarity to answer directly.
+        """
+        self.pairs = list(pairs)
+        self.threshold = threshold
+        if self.pairs:
+            matrix = np.asarray([embed_fn(pair["question"]) for pair in self.pairs], dtype=np.float32)
+            self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        logger.info(f"loaded {len(self.pairs)} curated FAQ answers")
+
+    def match(self, vector: np.ndarray) -> Optional[Tuple[Dict[str, str], float]]:
+        """
+        Returns (pair, similarity) for the closest curated question, or None below the threshold.
+
+        Args:
+            vector (np.ndarray): Unit-normalized question embedding.
+        """
+        if not self.pairs:
+            return None
+        scores = self.matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self.pairs[best], float(scores[best])
+
+
+def format_direct_answer(pair: Dict[str, str]) -> str:
+    """
+    Formats a curated answer with its source for the agent.
+    """
+    return f"FAQ answer ({pair['file']}, page {pair['page']}):\nQ: {pair['question']}\nA: {pair['answer']}"
+
+
+def format_passages(nodes) -> str:
+    """
+    Formats retrieved chunks, best first, with their source file, page and score.
+
+    Args:
+        nodes (List[NodeWithScore]): Retrieved chunks.
+
+    Returns:
+        str: Numbered passages, or a note that nothing relevant was found.
+    """
+    if not nodes:
+        return "No relevant FAQ passages found."
+    blocks = []
+    for i, scored in enumerate(nodes, start=1):
+        metadata = scored.node.metadata
+        source = metadata.get("file_name", "FAQ")
+        if metadata.get("page_label"):
+            source += f", page {metadata['page_label']}"
+        score = f", score {scored.score:.3f}" if scored.score is not None else ""
+        text = re.sub(r"\s+", " ", scored.node.get_content()).strip()
+        blocks.append(f"[{i}] ({source}{score})\n{text}")
+    return "\n\n".join(blocks)
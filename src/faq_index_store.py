@@ -0,0 +1,291 @@
+# src/faq_index_store.py
+
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import TextNode
+
+from src.embedding_pipeline import embed_texts, parse_pdfs
+from src.mmap_index import MmapVectorIndex, read_meta, write_mmap_index
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+LOCK_FILE = ".lock"
+STORE_VERSION = 1
+
+
+def file_digest(path: str) -> str:
+    """
+    Returns the sha256 hex digest of a file's bytes.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_digest(text: str) -> str:
+    """
+    Returns the sha256 hex digest of the text that gets embedded for a chunk.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class FaqIndexStore:
+    """
+    On-disk store for the FAQ chunks and their embeddings.
+
+    The store directory holds a JSON manifest (source file hashes plus chunk
+    text and metadata) and a float32 NumPy matrix with one embedding row per
+    chunk. On startup the manifest is compared against the PDFs in the source
+    directory: unchanged files are served straight from the memory-mapped
+    matrix, and only files whose hash changed are re-parsed. Chunks of a
+    changed file whose text hash is already known reuse their stored
+    embedding, so only genuinely new text is sent to the embedding model.
+
+    For serving, the store also keeps a memory-mapped copy of the index (see
+    src/mmap_index.py) that worker processes share instead of each holding
+    the nodes in memory. Updates take an exclusive file lock, so when several
+    workers start together one of them rebuilds and the rest reuse its files.
+    """
+
+    def __init__(
+        self,
+        source_dir: str,
+        store_dir: str,
+        embed_model_name: str,
+        parse_workers: int = 1,
+        embed_batch_size: int = 64,
+        index_dtype: str = "float16",
+    ):
+        """
+        Args:
+            source_dir (str): Directory containing the FAQ PDF files.
+            store_dir (str): Directory where the manifest and embeddings are persisted.
+            embed_model_name (str): Name of the embedding model; a change invalidates all stored vectors.
+            parse_workers (int): Processes used to parse changed PDFs in parallel.
+            embed_batch_size (int): Chunks per embedding call.
+            index_dtype (str): Vector dtype of the memory-mapped serving index ("float16" or "float32").
+        """
+        self.source_dir = source_dir
+        self.store_dir = store_dir
+        self.embed_model_name = embed_model_name
+        self.parse_workers = parse_workers
+        self.embed_batch_size = embed_batch_size
+        self.index_dtype = index_dtype
+        # Identifies the current set of source files; set by load_nodes().
+        self.fingerprint: Optional[str] = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.store_dir, MANIFEST_FILE)
+
+    @property
+    def embeddings_path(self) -> str:
+        return os.path.join(self.store_dir, EMBEDDINGS_FILE)
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds an exclusive lock on the store directory (a no-op where fcntl is unavailable).
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(os.path.join(self.store_dir, LOCK_FILE), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def source_files(self) -> List[str]:
+        """
+        Returns the sorted list of PDF files in the source directory.
+        """
+        return sorted(
+            os.path.join(self.source_dir, name)
+            for name in os.listdir(self.source_dir)
+            if name.lower().endswith(".pdf")
+        )
+
+    def _load(self):
+        """
+        Loads the manifest and memory-maps the embedding matrix.
+
+        Returns (None, None) when there is no usable store on disk.
+        """
+        if not (os.path.exists(self.manifest_path) and os.path.exists(self.embeddings_path)):
+            return None, None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"FAQ index store unreadable, rebuilding: {e}")
+            return None, None
+        if (
+            manifest.get("version") != STORE_VERSION
+            or manifest.get("embed_model") != self.embed_model_name
+            or len(manifest.get("chunks", [])) != embeddings.shape[0]
+        ):
+            logger.info("FAQ index store is stale, rebuilding")
+            return None, None
+        return manifest, embeddings
+
+    def _save(self, files: Dict[str, str], chunks: List[dict], embeddings: np.ndarray):
+        """
+        Atomically writes the manifest and embedding matrix to the store directory.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_embeddings = self.embeddings_path + ".tmp.npy"
+        tmp_manifest = self.manifest_path + ".tmp"
+        np.save(tmp_embeddings, embeddings.astype(np.float32, copy=False))
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": STORE_VERSION,
+                    "embed_model": self.embed_model_name,
+                    "files": files,
+                    "chunks": chunks,
+                },
+                f,
+            )
+        os.replace(tmp_embeddings, self.embeddings_path)
+        os.replace(tmp_manifest, self.manifest_path)
+
+    def refresh(self, embed_model) -> Tuple[List[dict], np.ndarray]:
+        """
+        Brings the store, including its serving index, up to date with the source directory.
+
+        Args:
+            embed_model: Embedding model used for chunks that are not in the store yet.
+
+        Returns:
+            Tuple[List[dict], np.ndarray]: Chunk records and their embedding matrix, in store order.
+        """
+        with self._locked():
+            return self._refresh(embed_model)
+
+    def _refresh(self, embed_model) -> Tuple[List[dict], np.ndarray]:
+        chunks, matrix = self._sync(embed_model)
+        meta = read_meta(self.store_dir)
+        if not meta or meta.get("fingerprint") != self.fingerprint or meta.get("dtype") != self.index_dtype:
+            write_mmap_index(self.store_dir, chunks, matrix, self.fingerprint, self.index_dtype)
+        return chunks, matrix
+
+    def _sync(self, embed_model) -> Tuple[List[dict], np.ndarray]:
+        manifest, embeddings = self._load()
+        old_files = manifest["files"] if manifest else {}
+        old_chunks = manifest["chunks"] if manifest else []
+
+        current_files = {os.path.basename(p): p for p in self.source_files()}
+        digests = {name: file_digest(path) for name, path in current_files.items()}
+        self.fingerprint = chunk_digest(self.embed_model_name + json.dumps(digests, sort_keys=True))
+        changed = [name for name in current_files if old_files.get(name) != digests[name]]
+        removed = [name for name in old_files if name not in current_files]
+
+        if not changed and not removed:
+            logger.info(f"FAQ index store up to date ({len(old_chunks)} chunks)")
+            if embeddings is None:
+                embeddings = np.zeros((0, 0), dtype=np.float32)
+            return old_chunks, embeddings
+
+        logger.info(f"FAQ index store refresh: changed={changed} removed={removed}")
+        known_rows = {chunk["hash"]: i for i, chunk in enumerate(old_chunks)}
+
+        parsed = parse_pdfs([current_files[name] for name in sorted(changed)], workers=self.parse_workers)
+
+        chunks: List[dict] = []
+        rows: List[Optional[int]] = []
+        for name in sorted(current_files):
+            if name not in changed:
+                for i, chunk in enumerate(old_chunks):
+                    if chunk["file"] == name:
+                        chunks.append(chunk)
+                        rows.append(i)
+                continue
+            for position, record in enumerate(parsed[current_files[name]]):
+                digest = chunk_digest(record["embed_text"])
+                chunks.append({"id": f"{name}#{position}-{digest[:12]}", "hash": digest, "file": name, **record})
+                rows.append(known_rows.get(digest))
+
+        missing = [i for i, row in enumerate(rows) if row is None]
+        new_vectors = embed_texts(
+            embed_model, [chunks[i]["embed_text"] for i in missing], batch_size=self.embed_batch_size
+        )
+        logger.info(f"FAQ index store: reused {len(rows) - len(missing)} chunks, embedded {len(missing)}")
+
+        if len(new_vectors):
+            dim = new_vectors.shape[1]
+        else:
+            dim = embeddings.shape[1] if embeddings is not None else 0
+        matrix = np.zeros((len(chunks), dim), dtype=np.float32)
+        new_row = 0
+        for i, row in enumerate(rows):
+            if row is not None:
+                matrix[i] = embeddings[row]
+            else:
+                matrix[i] = new_vectors[new_row]
+                new_row += 1
+        for chunk in chunks:
+            chunk.pop("embed_text", None)
+
+        self._save(digests, chunks, matrix)
+        return chunks, matrix
+
+    def load_nodes(self, embed_model) -> List[TextNode]:
+        """
+        Brings the store up to date with the source directory and returns the
+        chunk nodes with their embeddings attached.
+
+        Args:
+            embed_model: Embedding model used for chunks that are not in the store yet.
+
+        Returns:
+            List[TextNode]: One node per chunk, in store order.
+        """
+        chunks, matrix = self.refresh(embed_model)
+        return [self._to_node(chunk, matrix[i]) for i, chunk in enumerate(chunks)]
+
+    @staticmethod
+    def _to_node(chunk: dict, embedding) -> TextNode:
+        return TextNode(
+            id_=chunk["id"],
+            text=chunk["text"],
+            metadata=chunk["metadata"],
+            excluded_embed_metadata_keys=chunk["excluded_embed_metadata_keys"],
+            excluded_llm_metadata_keys=chunk["excluded_llm_metadata_keys"],
+            embedding=embedding.tolist(),
+        )
+
+    def build_index(self, embed_model) -> VectorStoreIndex:
+        """
+        Returns a VectorStoreIndex over the stored chunks without re-embedding
+        anything that is already persisted.
+        """
+        nodes = self.load_nodes(embed_model)
+        return VectorStoreIndex(nodes=nodes, embed_model=embed_model)
+
+    def open_mmap_index(self, embed_model) -> MmapVectorIndex:
+        """
+        Returns the memory-mapped serving index, bringing the store up to date first.
+
+        Only the refresh touches the manifest; the returned index holds
+        nothing but read-only mappings of the serving files.
+        """
+        with self._locked():
+            self._refresh(embed_model)
+            return MmapVectorIndex.open(self.store_dir, embed_model=embed_model)
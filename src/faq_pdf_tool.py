@@ -1,32 +1,171 @@
 # src/faq_pdf_tool.py
 
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.groq import Groq
+from src.resources import lazy_resource
 import os
 
-embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FAQ_DIR = os.path.join(BASE_DIR, "faqs")
+FAQ_INDEX_DIR = os.environ.get("FAQ_INDEX_DIR", os.path.join(FAQ_DIR, ".index"))
+# "huggingface" (PyTorch) or "onnx" (int8-quantized ONNX Runtime via fastembed)
+EMBED_BACKEND = os.environ.get("FAQ_EMBED_BACKEND", "huggingface")
+EMBED_BATCH_SIZE = int(os.environ.get("FAQ_EMBED_BATCH_SIZE", 64))
+# "mmap" serves vectors and chunk text from read-only memory-mapped files
+# that all worker processes share; "memory" builds an in-process VectorStoreIndex.
+INDEX_BACKEND = os.environ.get("FAQ_INDEX_BACKEND", "mmap")
+INDEX_DTYPE = os.environ.get("FAQ_INDEX_DTYPE", "float16")
+# "hybrid" (BM25 + vectors, fused) or "vector"
+RETRIEVAL_MODE = os.environ.get("FAQ_RETRIEVAL_MODE", "hybrid")
+TOP_K = int(os.environ.get("FAQ_TOP_K", 2))
+CANDIDATES = int(os.environ.get("FAQ_CANDIDATES", 10))
+# Optional cross-encoder, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_MODEL = os.environ.get("FAQ_RERANK_MODEL", "")
+# "passages" returns the retrieved chunks for the agent to answer from;
+# "synthesize" writes an answer with a separate LLM call first.
+ANSWER_MODE = os.environ.get("FAQ_ANSWER_MODE", "passages")
+# Curated Q/A files answered verbatim on a close match ("" disables).
+QA_FILES = [name for name in os.environ.get("FAQ_QA_FILES", "faq_data.pdf").split(",") if name.strip()]
+DIRECT_ANSWER_THRESHOLD = float(os.environ.get("FAQ_DIRECT_ANSWER_THRESHOLD", 0.9))
 
-data_files = ["src/faqs/faq_data.pdf"]
-documents = SimpleDirectoryReader(input_files=data_files).load_data()
+model="llama-3.3-70b-versatile"
 
 
-faq_index = VectorStoreIndex.from_documents(documents, embed_model=embed_model)
+def _build_embed_model():
+    # Imported here: pulling in the HF stack is the slowest part of startup.
+    from src.embedding_pipeline import build_embed_model
+    return build_embed_model(EMBED_MODEL_NAME, EMBED_BACKEND, EMBED_BATCH_SIZE)
 
 
-model="llama-3.3-70b-versatile"
-local_llm = Groq(model=model, api_key=os.environ['GROQ_API_KEY'], temperature=0)
+def _build_faq_store():
+    from src.embedding_pipeline import default_workers, store_model_name
+    from src.faq_index_store import FaqIndexStore
+    return FaqIndexStore(
+        FAQ_DIR,
+        FAQ_INDEX_DIR,
+        store_model_name(EMBED_MODEL_NAME, EMBED_BACKEND),
+        parse_workers=default_workers(),
+        embed_batch_size=EMBED_BATCH_SIZE,
+        index_dtype=INDEX_DTYPE,
+    )
 
 
-faq_query_engine = faq_index.as_query_engine(llm=local_llm)
+def _build_faq_index():
+    # Every PDF in src/faqs/ is indexed; unchanged files are loaded from the
+    # persisted store instead of being parsed and embedded again.
+    if INDEX_BACKEND == "mmap":
+        return faq_store.get().open_mmap_index(embed_model.get())
+    return faq_store.get().build_index(embed_model.get())
 
 
-def query_faq_pdf(question: str) -> str:
+def _build_answer_cache():
+    from src.semantic_cache import SemanticCache
+    faq_index.get()  # the fingerprint is known once the index is loaded
+    return SemanticCache(
+        embed_fn=embed_model.get().get_query_embedding,
+        # Cached entries are answers or passages depending on the mode.
+        fingerprint=f"{faq_store.get().fingerprint}:{ANSWER_MODE}",
+        threshold=float(os.environ.get("FAQ_CACHE_THRESHOLD", 0.92)),
+        max_entries=int(os.environ.get("FAQ_CACHE_MAX_ENTRIES", 2000)),
+        ttl_seconds=float(os.environ.get("FAQ_CACHE_TTL_SECONDS", 86400)),
+        path=os.environ.get("FAQ_CACHE_PATH") or None,
+    )
+
+
+def _build_faq_retriever():
+    index = faq_index.get()
+    if RETRIEVAL_MODE == "vector":
+        return index.as_retriever(similarity_top_k=TOP_K)
+    from src.hybrid_retriever import HybridRetriever
+    # With a reranker the fused candidates are cut down to TOP_K after reranking.
+    return HybridRetriever(
+        index.as_retriever(similarity_top_k=CANDIDATES),
+        index.docstore if INDEX_BACKEND == "mmap" else list(index.docstore.docs.values()),
+        top_k=CANDIDATES if RERANK_MODEL else TOP_K,
+        candidates=CANDIDATES,
+    )
+
+
+def _build_faq_reranker():
+    from src.hybrid_retriever import build_reranker
+    return build_reranker(RERANK_MODEL, TOP_K)
+
+
+def _build_faq_query_engine():
+    from llama_index.core.query_engine import RetrieverQueryEngine
+    reranker = faq_reranker.get()
+    return RetrieverQueryEngine.from_args(
+        faq_retriever.get(),
+        llm=local_llm.get(),
+        node_postprocessors=[reranker] if reranker else None,
+    )
+
+
+def _build_qa_matcher():
+    from src.faq_answers import QAMatcher, extract_qa_pairs
+    pairs = []
+    for name in QA_FILES:
+        path = os.path.join(FAQ_DIR, name.strip())
+        if os.path.exists(path):
+            pairs.extend(extract_qa_pairs(path))
+    return QAMatcher(pairs, embed_model.get().get_query_embedding, threshold=DIRECT_ANSWER_THRESHOLD)
+
+
+def _build_local_llm():
+    # Answer synthesis over a few retrieved chunks goes to the small tier of
+    # the shared model router, reusing its connection pool.
+    from src.generators import model_router
+    return model_router.get().for_task("faq_synthesis")
+
+
+embed_model = lazy_resource("embed_model", _build_embed_model)
+faq_store = lazy_resource("faq_store", _build_faq_store)
+faq_index = lazy_resource("faq_index", _build_faq_index)
+faq_retriever = lazy_resource("faq_retriever", _build_faq_retriever)
+faq_reranker = lazy_resource("faq_reranker", _build_faq_reranker)
+# Only "synthesize" mode makes an LLM call; "passages" never builds (or waits on) one.
+local_llm = lazy_resource("faq_llm", _build_local_llm) if ANSWER_MODE == "synthesize" else None
+faq_query_engine = lazy_resource("faq_query_engine", _build_faq_query_engine) if ANSWER_MODE == "synthesize" else None
+answer_cache = lazy_resource("faq_answer_cache", _build_answer_cache)
+qa_matcher = lazy_resource("faq_qa_matcher", _build_qa_matcher)
+
+
+def retrieve_passages(query):
     """
-    Search the FAQ PDF and return the most relevant answer using
-    the local LLM and embedding.
+    Returns the chunks for a QueryBundle, reranked when FAQ_RERANK_MODEL is set.
     """
-    response = faq_query_engine.query(question)
-    return str(response)
+    nodes = faq_retriever.get().retrieve(query)
+    reranker = faq_reranker.get()
+    return reranker.postprocess_nodes(nodes, query_bundle=query) if reranker else nodes
 
 
+def query_faq_pdf(question: str) -> str:
+    """
+    Search the FAQ PDFs for a question.
+
+    A close match to a curated FAQ question returns that FAQ answer
+    verbatim. Otherwise, in the default "passages" mode, the most relevant
+    passages are returned with their source so the agent answers in its own
+    generation; in "synthesize" mode the local LLM writes the answer first.
+    """
+    from llama_index.core import QueryBundle
+    from src.faq_answers import format_direct_answer, format_passages
+    from src.tracing import span
+    cache = answer_cache.get()
+    with span("faq.embed"):
+        vector = cache.embed(question)
+    direct = qa_matcher.get().match(vector)
+    if direct is not None:
+        return format_direct_answer(direct[0])
+    answer = cache.lookup(vector)
+    if answer is not None:
+        return answer
+    # Reuse the question embedding for retrieval instead of embedding it twice.
+    query = QueryBundle(question, embedding=vector.tolist())
+    if ANSWER_MODE == "synthesize":
+        with span("faq.synthesize"):
+            answer = str(faq_query_engine.get().query(query))
+    else:
+        with span("faq.retrieve", mode=RETRIEVAL_MODE):
+            answer = format_passages(retrieve_passages(query))
+    cache.store(question, vector, answer)
+    return answer
@@ -0,0 +1,268 @@
+# src/freebusy_cache.py
+
+import threading
+import time
+from bisect import bisect_right
+from datetime import date as date_cls
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pytz
+
+from src.tracing import span
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+Interval = Tuple[datetime, datetime]
+
+
+def parse_event_time(value: Dict[str, str]) -> datetime:
+    """
+    Parses an event 'start'/'end' field into a UTC datetime.
+
+    Timed events carry 'dateTime' (with 'Z', an offset, or naive, which is
+    taken as UTC); all-day events carry only 'date' and start at midnight.
+    """
+    raw = value.get("dateTime") or value["date"] + "T00:00:00"
+    parsed = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        return pytz.UTC.localize(parsed)
+    return parsed.astimezone(pytz.UTC)
+
+
+class BusyIntervals:
+    """
+    Sorted, merged busy intervals of one calendar day.
+
+    Overlapping and touching intervals are merged on construction, so both
+    the start and the end lists are sorted and an overlap query is a single
+    binary search.
+    """
+
+    def __init__(self, intervals: Iterable[Interval] = ()):
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Interval]:
+        return iter(zip(self.starts, self.ends))
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        """
+        Returns True if [start, end) intersects any busy interval.
+        """
+        # First interval that ends after `start`; it is the only candidate.
+        i = bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] < end
+
+    def with_interval(self, start: datetime, end: datetime) -> "BusyIntervals":
+        return BusyIntervals(list(self) + [(start, end)])
+
+
+def _blocks_time(event: Dict[str, Any]) -> bool:
+    # What the freebusy query counts as busy: not "show as available"
+    # (transparent) events, nor events the calendar's owner declined.
+    if event.get("transparency") == "transparent":
+        return False
+    return not any(
+        attendee.get("self") and attendee.get("responseStatus") == "declined" for attendee in event.get("attendees", ())
+    )
+
+
+class FreeBusyCache:
+    """
+    Short-lived cache of busy intervals per (calendar, day).
+
+    One events().list call fetches a whole UTC day; availability listings,
+    slot checks and the pre-booking check of the same conversation are then
+    answered from memory. Entries expire after `ttl_seconds`, and meetings
+    we insert ourselves are written through with add_busy() so the cache
+    never offers a slot we just booked.
+    """
+
+    def __init__(self, service_getter: Callable[[], object], ttl_seconds: float = 60,
+                 prefetched: Optional[Callable[[str, date_cls, bool], Optional[BusyIntervals]]] = None):
+        """
+        Args:
+            service_getter (Callable): Returns the Google Calendar service.
+            ttl_seconds (float): How long a fetched day stays fresh.
+            prefetched (Callable): Optional hook asked for a day before it is
+                fetched (e.g. calendar_prefetch.claim_prefetched); gets the
+                calendar, the day and whether the cache already has it.
+        """
+        self.service_getter = service_getter
+        self.ttl_seconds = ttl_seconds
+        self.prefetched = prefetched
+        self._days: Dict[Tuple[str, date_cls], Tuple[float, BusyIntervals]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fetch_day(self, calendar_id: str, day: date_cls) -> BusyIntervals:
+        start = pytz.UTC.localize(datetime.combine(day, datetime.min.time()))
+        end = start + timedelta(days=1)
+        events = []
+        page_token = None
+        while True:
+            with span("calendar.events_list", calendar=calendar_id):
+                result = self.service_getter().events().list(
+                    calendarId=calendar_id,
+                    timeMin=start.isoformat(),
+                    timeMax=end.isoformat(),
+                    singleEvents=True,
+                    orderBy="startTime",
+                    pageToken=page_token,
+                ).execute()
+            events.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+        logger.debug("fetched %d events for %s on %s", len(events), calendar_id, day)
+        return BusyIntervals(
+            (parse_event_time(event["start"]), parse_event_time(event["end"])) for event in events if _blocks_time(event)
+        )
+
+    def busy_for_day(self, calendar_id: str, day: date_cls) -> BusyIntervals:
+        """
+        Returns the busy intervals of a UTC day, fetching them if not cached.
+        """
+        key = (calendar_id, day)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._days.get(key)
+            fresh = cached is not None and now - cached[0] < self.ttl_seconds
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if self.prefetched is not None:
+            prefetched = self.prefetched(calendar_id, day, fresh)
+            if prefetched is not None and not fresh:
+                return prefetched
+        if fresh:
+            # Also newer than a prefetched copy if add_busy() ran since.
+            return cached[1]
+        busy = self._fetch_day(calendar_id, day)
+        with self._lock:
+            self._days[key] = (now, busy)
+        return busy
+
+    def is_cached(self, calendar_id: str, day: date_cls) -> bool:
+        """
+        Returns True if the day is cached and still fresh.
+        """
+        with self._lock:
+            cached = self._days.get((calendar_id, day))
+            return cached is not None and time.monotonic() - cached[0] < self.ttl_seconds
+
+    def _utc_days(self, start: datetime, end: datetime) -> List[date_cls]:
+        days = []
+        day = start.astimezone(pytz.UTC).date()
+        while day <= (end - timedelta(microseconds=1)).astimezone(pytz.UTC).date():
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def busy_for_range(self, calendar_ids: Sequence[str], start: datetime, end: datetime) -> Dict[str, List[Interval]]:
+        """
+        Returns busy intervals for several calendars over a date range.
+
+        Calendars with any day missing from the cache are fetched together in
+        a single freebusy().query call covering the whole range; the result
+        is split into per-day entries so later single-day lookups hit the
+        cache as well.
+
+        Args:
+            calendar_ids (Sequence[str]): Calendars to query.
+            start (datetime): Start of the range.
+            end (datetime): End of the range (exclusive).
+
+        Returns:
+            Dict[str, List[Interval]]: Busy intervals per calendar id.
+        """
+        days = self._utc_days(start, end)
+        now = time.monotonic()
+        with self._lock:
+            missing = [
+                cal for cal in calendar_ids
+                if any(
+                    (cal, day) not in self._days or now - self._days[(cal, day)][0] >= self.ttl_seconds
+                    for day in days
+                )
+            ]
+            if missing:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if missing and days:
+            range_start = pytz.UTC.localize(datetime.combine(days[0], datetime.min.time()))
+            range_end = pytz.UTC.localize(datetime.combine(days[-1], datetime.min.time())) + timedelta(days=1)
+            with span("calendar.freebusy", calendars=len(missing), days=len(days)):
+                result = self.service_getter().freebusy().query(body={
+                    "timeMin": range_start.isoformat(),
+                    "timeMax": range_end.isoformat(),
+                    "items": [{"id": cal} for cal in missing],
+                }).execute()
+            logger.debug("freebusy query for %s from %s to %s", missing, days[0], days[-1])
+            for cal in missing:
+                info = result.get("calendars", {}).get(cal, {})
+                if info.get("errors"):
+                    raise ValueError(f"freebusy query failed for calendar '{cal}': {info['errors']}")
+                per_day: Dict[date_cls, List[Interval]] = {day: [] for day in days}
+                for busy in info.get("busy", []):
+                    busy_start = parse_event_time({"dateTime": busy["start"]})
+                    busy_end = parse_event_time({"dateTime": busy["end"]})
+                    for day in self._utc_days(busy_start, busy_end):
+                        if day in per_day:
+                            per_day[day].append((busy_start, busy_end))
+                with self._lock:
+                    for day, intervals in per_day.items():
+                        self._days[(cal, day)] = (now, BusyIntervals(intervals))
+        return {cal: self.busy_between(cal, start, end) for cal in calendar_ids}
+
+    def busy_between(self, calendar_id: str, start: datetime, end: datetime) -> List[Interval]:
+        """
+        Returns the busy intervals of every UTC day touched by [start, end).
+        """
+        intervals: List[Interval] = []
+        for day in self._utc_days(start, end):
+            intervals.extend(self.busy_for_day(calendar_id, day))
+        return intervals
+
+    def is_free(self, calendar_id: str, start: datetime, end: datetime) -> bool:
+        """
+        Returns True if nothing on the calendar overlaps [start, end).
+        """
+        day = start.date()
+        while day <= (end - timedelta(microseconds=1)).date():
+            if self.busy_for_day(calendar_id, day).overlaps(start, end):
+                return False
+            day += timedelta(days=1)
+        return True
+
+    def add_busy(self, calendar_id: str, start: datetime, end: datetime):
+        """
+        Records a meeting we just created in any cached day it touches.
+        """
+        with self._lock:
+            for (cal, day), (fetched_at, busy) in list(self._days.items()):
+                if cal == calendar_id and start.date() <= day <= end.date():
+                    self._days[(cal, day)] = (fetched_at, busy.with_interval(start, end))
+
+    def invalidate(self, calendar_id: str = None, day: date_cls = None):
+        """
+        Drops cached days; with no arguments, drops everything.
+        """
+        with self._lock:
+            for cal, cached_day in list(self._days):
+                if (calendar_id is None or cal == calendar_id) and (day is None or cached_day == day):
+                    del self._days[(cal, cached_day)]
@@ -1,24 +1,479 @@
 from llama_index.llms.ollama import Ollama
 from llama_index.llms.groq import Groq
+from llama_index.core.bridge.pydantic import PrivateAttr
+from src.llm_gateway import LLMGateway, is_retryable
+from src.prompt_builder import record_llm_call
+from src.resources import lazy_resource
+from src.streaming import emit_interim, emit_token, is_streaming
+from src.tracing import current_span, record_tokens, span, start_span
+from src.utils.app_logger import GenericLogger
 from dotenv import load_dotenv
 load_dotenv()
+import asyncio
 import os
+import threading
+from typing import Any, Dict, Optional
+
+logger = GenericLogger().get_logger()
+
+DEFAULT_LARGE_MODEL = "llama-3.3-70b-versatile"
+DEFAULT_SMALL_MODEL = "llama-3.1-8b-instant"
+
+# Which tier serves each kind of LLM call. Multi-tool agent reasoning needs
+# the large model; FAQ synthesis (FAQ_ANSWER_MODE=synthesize) only writes
+# an answer from a few retrieved chunks and goes to the small one. Other
+# single-shot steps (time parsing, confirmations) are answered without an
+# LLM by the intent router and tools.
+TASK_TIERS = {
+    "agent": "large",
+    "faq_synthesis": "small",
+}
+
+
+class TierLimiter:
+    """
+    Caps the number of in-flight calls to one model tier.
+
+    Works from worker threads and from the event loop alike: async callers
+    take a free permit without blocking and only wait on a helper thread
+    when the tier is saturated. If the waiting task is cancelled, the
+    permit the helper thread goes on to take is handed straight back.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.fallbacks = 0
+        self.errors = 0
+
+    def _acquired(self):
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+
+    def acquire(self):
+        self._semaphore.acquire()
+        self._acquired()
+
+    async def acquire_async(self):
+        if not self._semaphore.acquire(blocking=False):
+            waiter = asyncio.ensure_future(asyncio.to_thread(self._semaphore.acquire))
+            try:
+                await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                waiter.add_done_callback(self._release_abandoned)
+                raise
+        self._acquired()
+
+    def _release_abandoned(self, waiter: asyncio.Future):
+        if not waiter.cancelled() and waiter.exception() is None:
+            self._semaphore.release()
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def record(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "fallbacks": self.fallbacks,
+                "errors": self.errors,
+            }
+
+
+def _should_fall_back(error: Exception) -> bool:
+    # Rate limits, 5xx responses and connection failures; request errors
+    # such as a malformed prompt would fail the same way on the other tier.
+    return is_retryable(error)
+
+
+class TierRoute:
+    """
+    Per-LLM routing state: the tier's limiter, the shared gateway and the LLM to retry on.
+    """
+
+    def __init__(self, tier: str, limiter: TierLimiter, gateway: LLMGateway, fallback=None):
+        self.tier = tier
+        self.limiter = limiter
+        self.gateway = gateway
+        self.fallback = fallback
+
+    @property
+    def retries(self) -> Optional[int]:
+        # With a fallback tier, hand over quickly instead of sitting out a rate limit.
+        return 1 if self.fallback is not None else None
+
+
+class _RoutedLLM:
+    """
+    Adds tier concurrency limits and provider fallback to an LLM class.
+
+    Every chat/complete call goes through the shared LLMGateway (request
+    coalescing, per-model rate scheduling, retries) and then holds a
+    permit of the tier's limiter while it runs. If the provider still
+    fails with a rate limit or server error, the same call is repeated
+    once on the fallback LLM (which itself never falls back again).
+    """
+
+    def _call(self, method: str, *args, **kwargs):
+        # Returns (response, served_here); False when the fallback LLM or an
+        # identical call already in flight produced it.
+        route = self._route
+        parent = super(_RoutedLLM, self)
+
+        def send():
+            route.limiter.acquire()
+            try:
+                return getattr(parent, method)(*args, **kwargs)
+            finally:
+                route.limiter.release()
+
+        try:
+            response, shared = route.gateway.call(
+                self.model, method, args, kwargs, send,
+                retries=route.retries, max_tokens=getattr(self, "max_tokens", None),
+            )
+            return response, not shared
+        except Exception as e:
+            if route.fallback is None or not _should_fall_back(e):
+                route.limiter.record("errors")
+                raise
+            self._fell_back(e)
+        return getattr(route.fallback, method)(*args, **kwargs), False
+
+    async def _acall(self, method: str, *args, **kwargs):
+        route = self._route
+        parent = super(_RoutedLLM, self)
+
+        async def send():
+            await route.limiter.acquire_async()
+            try:
+                return await getattr(parent, method)(*args, **kwargs)
+            finally:
+                route.limiter.release()
+
+        try:
+            response, shared = await route.gateway.acall(
+                self.model, method, args, kwargs, send,
+                retries=route.retries, max_tokens=getattr(self, "max_tokens", None),
+            )
+            return response, not shared
+        except Exception as e:
+            if route.fallback is None or not _should_fall_back(e):
+                route.limiter.record("errors")
+                raise
+            self._fell_back(e)
+        return await getattr(route.fallback, method)(*args, **kwargs), False
+
+    def _fell_back(self, e: Exception, call_span=None):
+        route = self._route
+        route.limiter.record("fallbacks")
+        logger.warning(f"{route.tier} tier failed ({type(e).__name__}), falling back to {route.fallback.model}")
+        call_span = call_span or current_span()
+        if call_span is not None:
+            call_span.set(fallback=route.fallback.model, error=type(e).__name__)
+
+    def _span(self, method: str):
+        return span(f"llm.{method}", tier=self._route.tier, model=self.model)
+
+    def _record(self, messages, tools=None, response=None):
+        # The fallback LLM records its own call, so this only runs for calls served here.
+        prompt_tokens, completion_tokens, estimated = record_llm_call(messages, tools, response)
+        record_tokens(self._route.tier, prompt_tokens, completion_tokens, estimated)
+
+    def chat(self, messages, **kwargs):
+        with self._span("chat"):
+            response, served = self._call("chat", messages, **kwargs)
+            if served:
+                self._record(messages, kwargs.get("tools"), response)
+        return response
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        with self._span("complete"):
+            response, served = self._call("complete", prompt, formatted=formatted, **kwargs)
+            if served:
+                self._record([prompt], None, response)
+        return response
+
+    async def achat(self, messages, **kwargs):
+        with self._span("chat"):
+            response, served = await self._acall("achat", messages, **kwargs)
+            if served:
+                self._record(messages, kwargs.get("tools"), response)
+        return response
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        with self._span("complete"):
+            response, served = await self._acall("acomplete", prompt, formatted=formatted, **kwargs)
+            if served:
+                self._record([prompt], None, response)
+        return response
+
+    async def astream_chat(self, messages, **kwargs):
+        # The permit is held, and the span kept open, until the stream is fully
+        # consumed. Streams are rate scheduled but never coalesced.
+        route = self._route
+        stream_span = start_span("llm.stream", tier=route.tier, model=self.model)
+        parent = super(_RoutedLLM, self)
+
+        async def open_stream():
+            await route.limiter.acquire_async()
+            try:
+                return await parent.astream_chat(messages, **kwargs)
+            except BaseException:
+                route.limiter.release()
+                raise
+
+        try:
+            stream, _ = await route.gateway.acall(
+                self.model, "astream_chat", [messages], kwargs, open_stream,
+                retries=route.retries, coalesce=False, max_tokens=getattr(self, "max_tokens", None),
+            )
+        except Exception as e:
+            if route.fallback is None or not _should_fall_back(e):
+                route.limiter.record("errors")
+                stream_span.finish(error=e)
+                raise
+            self._fell_back(e, stream_span)
+            stream_span.finish()
+            return await route.fallback.astream_chat(messages, **kwargs)
+        # Streams report no usage; the prompt size is estimated.
+        prompt_tokens, completion_tokens, estimated = record_llm_call(messages, kwargs.get("tools"))
+        record_tokens(route.tier, prompt_tokens, completion_tokens, estimated)
+        stream_span.set(prompt_tokens=prompt_tokens, estimated_tokens=estimated)
+
+        async def _released():
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                route.limiter.release()
+                stream_span.finish()
+        return _released()
+
+
+class StreamingGroq(Groq):
+    """
+    Groq LLM that streams its tool-calling turns when the current chat turn
+    is being streamed.
+
+    The agent always calls achat_with_tools; when an event sink is bound this
+    switches to the streaming API and returns the final accumulated response
+    (including any tool calls), so the agent loop itself is unchanged.
+
+    Whether a step calls tools is only known once its stream ends, so its
+    content deltas are held until then: the final step (no tool calls) sends
+    them as token events, while text from a tool-calling step is planning
+    rather than answer and is sent as a single interim event.
+    """
+
+    async def achat_with_tools(self, tools, user_msg=None, chat_history=None, verbose=False, allow_parallel_tool_calls=False, **kwargs):
+        if not is_streaming():
+            return await super().achat_with_tools(
+                tools,
+                user_msg=user_msg,
+                chat_history=chat_history,
+                verbose=verbose,
+                allow_parallel_tool_calls=allow_parallel_tool_calls,
+                **kwargs,
+            )
+        stream = await self.astream_chat_with_tools(
+            tools,
+            user_msg=user_msg,
+            chat_history=chat_history,
+            verbose=verbose,
+            allow_parallel_tool_calls=allow_parallel_tool_calls,
+            **kwargs,
+        )
+        response, deltas = None, []
+        async for response in stream:
+            if response.delta:
+                deltas.append(response.delta)
+        if response is None:
+            # Nothing was streamed (e.g. a dropped connection); retry without
+            # streaming so a provider error reaches the router's fallback.
+            logger.warning(f"{self.model}: empty tool-calling stream, retrying without streaming")
+            return await super().achat_with_tools(
+                tools,
+                user_msg=user_msg,
+                chat_history=chat_history,
+                verbose=verbose,
+                allow_parallel_tool_calls=allow_parallel_tool_calls,
+                **kwargs,
+            )
+        if response.message.additional_kwargs.get("tool_calls"):
+            emit_interim("".join(deltas))
+        else:
+            for delta in deltas:
+                emit_token(delta)
+        return self._validate_chat_with_tools_response(
+            response, tools, allow_parallel_tool_calls=allow_parallel_tool_calls, **kwargs
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StreamingGroq"
+
+
+class RoutedGroq(_RoutedLLM, StreamingGroq):
+    _route: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RoutedGroq"
+
+
+class RoutedOllama(_RoutedLLM, Ollama):
+    _route: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RoutedOllama"
+
+
+class ModelRouter:
+    """
+    Builds and hands out one LLM per tier ("large" and "small").
+
+    All Groq-backed LLMs share one pooled HTTP client, so the agent, the FAQ
+    tool and the fallbacks reuse the same keep-alive connections, and one
+    LLMGateway, which coalesces identical calls, keeps each model under its
+    rate limits and retries rate-limited calls. Each tier has its own
+    concurrency limit, and a tier that is still rate limited or failing
+    falls back to the other one.
+
+    Configured with:
+        LLM_LARGE_MODEL / LLM_SMALL_MODEL: model names.
+        LLM_SMALL_PROVIDER: "groq" (default) or "ollama" for a local small model.
+        LLM_LARGE_MAX_CONCURRENCY / LLM_SMALL_MAX_CONCURRENCY: in-flight calls per tier.
+        LLM_FALLBACK: set to "false" to disable cross-tier fallback.
+        LLM_POOL_MAX_CONNECTIONS: size of the shared connection pool.
+        LLM_RATE_LIMITS, LLM_RATE_HEADROOM, LLM_MAX_RETRIES, LLM_COALESCE: see src/llm_gateway.py.
+        GROQ_API_BASE, OLLAMA_BASE_URL: provider endpoints.
+    """
+
+    def __init__(self, tiers: Dict[str, Dict[str, Any]], fallback: bool = True, max_connections: int = 64,
+                 gateway: Optional[LLMGateway] = None):
+        """
+        Args:
+            tiers (Dict[str, Dict]): Per tier: "model", "provider" and "max_concurrency".
+            fallback (bool): Retry failed calls on the other tier.
+            max_connections (int): Connections kept in the shared HTTP pool.
+            gateway (LLMGateway): Gateway all calls go through; built from the environment by default.
+        """
+        import httpx
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._http_client = httpx.Client(limits=limits)
+        self._async_http_client = httpx.AsyncClient(limits=limits)
+        self.tiers = tiers
+        self.gateway = gateway or LLMGateway.from_env()
+        self.limiters = {tier: TierLimiter(config["max_concurrency"]) for tier, config in tiers.items()}
+        self._llms = {}
+        for tier in tiers:
+            other = next((t for t in tiers if t != tier), None) if fallback else None
+            fallback_llm = self._build(other, TierRoute(other, self.limiters[other], self.gateway)) if other else None
+            self._llms[tier] = self._build(tier, TierRoute(tier, self.limiters[tier], self.gateway, fallback_llm))
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        return cls(
+            tiers={
+                "large": {
+                    "model": os.environ.get("LLM_LARGE_MODEL", DEFAULT_LARGE_MODEL),
+                    "provider": "groq",
+                    "max_concurrency": int(os.environ.get("LLM_LARGE_MAX_CONCURRENCY", 8)),
+                },
+                "small": {
+                    "model": os.environ.get("LLM_SMALL_MODEL", DEFAULT_SMALL_MODEL),
+                    "provider": os.environ.get("LLM_SMALL_PROVIDER", "groq"),
+                    "max_concurrency": int(os.environ.get("LLM_SMALL_MAX_CONCURRENCY", 16)),
+                },
+            },
+            fallback=os.environ.get("LLM_FALLBACK", "true").lower() in ("1", "true", "yes"),
+            max_connections=int(os.environ.get("LLM_POOL_MAX_CONNECTIONS", 64)),
+        )
+
+    def _build(self, tier: str, route: TierRoute, model: Optional[str] = None):
+        config = self.tiers[tier]
+        model = model or config["model"]
+        if config["provider"] == "ollama":
+            llm = RoutedOllama(
+                model=model,
+                base_url=os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434"),
+                temperature=0,
+                request_timeout=float(os.environ.get("OLLAMA_TIMEOUT_SECONDS", 60)),
+            )
+        else:
+            llm = RoutedGroq(
+                model=model,
+                api_key=os.environ['GROQ_API_KEY'],
+                api_base=os.environ.get("GROQ_API_BASE", "https://api.groq.com/openai/v1"),
+                temperature=0,
+                # Retries are left to the gateway, which coordinates them across calls.
+                max_retries=0,
+                http_client=self._http_client,
+                async_http_client=self._async_http_client,
+            )
+        llm._route = route
+        return llm
+
+    def get_llm(self, tier: str = "large"):
+        return self._llms[tier]
+
+    def for_task(self, task: str):
+        """
+        Returns the LLM of the tier that serves `task` (see TASK_TIERS).
+        """
+        return self._llms[TASK_TIERS.get(task, "large")]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        gateway = self.gateway.stats()
+        stats = {}
+        for tier in self.tiers:
+            model = self.tiers[tier]["model"]
+            stats[tier] = {"model": model, **self.limiters[tier].stats()}
+            if model in gateway:
+                stats[tier]["rate_limiter"] = gateway[model]
+        return stats
+
+
+model_router = lazy_resource("model_router", ModelRouter.from_env)
+
 
 class Generators:
-    def __init__(self, model="llama-3.3-70b-versatile"):
+    def __init__(self, model: Optional[str] = None):
         # self.llm = Ollama(model=model, temperature=0)
         """
-        Initializes the Generators class with a specified language model.
+        Initializes the Generators class from the shared model router.
 
         Args:
-            model (str): The name of the model to use. Defaults to "llama-3.3-70b-versatile".
+            model (str): Optional model name overriding the large tier. Defaults to LLM_LARGE_MODEL
+                ("llama-3.3-70b-versatile").
         """
-        self.llm = Groq(model=model, api_key=os.environ['GROQ_API_KEY'], temperature=0)
+        self.router = model_router.get()
+        self.llm = self.router.get_llm("large")
+        if model and model != self.llm.model:
+            self.llm = self.router._build("large", self.llm._route, model=model)
 
-    def get_llm(self):
+    def get_llm(self, task: str = "agent"):
         """
-        Returns the currently initialized language model (LLM) instance.
+        Returns the language model (LLM) instance for a kind of task.
 
+        :param task: One of TASK_TIERS; agent reasoning gets the large model,
+            single-shot steps such as FAQ synthesis get the small one.
         :return: The language model instance used by the Generators class.
         """
-        return self.llm
\ No newline at end of file
+        if task == "agent":
+            return self.llm
+        return self.router.for_task(task)
@@ -0,0 +1,148 @@
+# src/hybrid_retriever.py
+
+import math
+import re
+from collections import Counter, defaultdict
+from heapq import nlargest
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle, TextNode
+
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+# Keeps codes such as "PRO-200" or "plan_b" together as one term.
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it my of on or our the to we what when "
+    "where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases and splits text into BM25 terms, dropping common stopwords.
+    """
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory inverted index scored with Okapi BM25.
+
+    Postings map each term to (document, term frequency) pairs, so a query
+    only touches the documents that contain one of its terms.
+    """
+
+    def __init__(self, texts: Iterable[str], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            texts (Iterable[str]): One text per document; documents are referred to by position.
+            k1 (float): Term frequency saturation.
+            b (float): Length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths: List[int] = []
+        for doc, text in enumerate(texts):
+            terms = tokenize(text)
+            self.lengths.append(len(terms))
+            for term, freq in Counter(terms).items():
+                self.postings[term].append((doc, freq))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        n = len(self.lengths)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Returns up to `top_k` (document, score) pairs, best first.
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, freq in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc] / (self.avg_length or 1))
+                scores[doc] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses ranked lists of ids: each id scores sum(1 / (k + rank)) over the lists it appears in.
+
+    Args:
+        rankings (Sequence[Sequence[str]]): Ranked id lists, best first.
+        k (int): Damping constant; 60 is the value from the original RRF paper.
+
+    Returns:
+        List[Tuple[str, float]]: (id, fused score), best first.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Combines BM25 keyword retrieval with the vector index.
+
+    Both retrievers return `candidates` results, which are fused with
+    reciprocal-rank fusion; the best `top_k` are returned. Exact terms such
+    as product, plan or policy names that embeddings blur together are
+    caught by BM25, while paraphrased questions are caught by the vectors.
+    """
+
+    def __init__(self, vector_retriever: Optional[BaseRetriever], nodes: Sequence[TextNode], top_k: int = 2, candidates: int = 10, rrf_k: int = 60):
+        """
+        Args:
+            vector_retriever (BaseRetriever): Retriever over the vector index, or None for BM25 only.
+            nodes (Sequence[TextNode]): The chunks to index for BM25 (the same ones the vector index holds);
+                kept as given, so a lazily decoded sequence such as MmapDocstore stays lazy.
+            top_k (int): Number of fused results returned.
+            candidates (int): Results taken from each retriever before fusion.
+            rrf_k (int): Reciprocal-rank fusion constant.
+        """
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.nodes = nodes
+        self.bm25 = BM25Index(node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes)
+        self.top_k = top_k
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def bm25_retrieve(self, query: str, top_k: int) -> List[NodeWithScore]:
+        return [NodeWithScore(node=self.nodes[doc], score=score) for doc, score in self.bm25.search(query, top_k)]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        keyword = self.bm25_retrieve(query_bundle.query_str, self.candidates)
+        vector = self.vector_retriever.retrieve(query_bundle) if self.vector_retriever else []
+        fused = reciprocal_rank_fusion(
+            [[n.node.node_id for n in keyword], [n.node.node_id for n in vector]], k=self.rrf_k
+        )
+        nodes = {n.node.node_id: n.node for n in vector}
+        nodes.update({n.node.node_id: n.node for n in keyword})
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused[:self.top_k]]
+
+
+def build_reranker(model: str, top_n: int):
+    """
+    Returns a cross-encoder reranking postprocessor, or None when `model` is empty.
+
+    Needs sentence-transformers, which the HuggingFace embedding backend
+    already installs; a small model such as
+    "cross-encoder/ms-marco-MiniLM-L-6-v2" runs in a few ms per pair on CPU.
+    """
+    if not model:
+        return None
+    from llama_index.core.postprocessor import SentenceTransformerRerank
+    return SentenceTransformerRerank(model=model, top_n=top_n, device="cpu")
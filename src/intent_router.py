@@ -0,0 +1,194 @@
+# src/intent_router.py
+
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.message_parsing import GREETING_RE, TIME_RE, extract_dates
+from src.tools import get_formatted_availability, greet_user_and_ask_name
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+DURATION_RE = re.compile(r"\b(\d{2,3})[\s-]*(?:min|mins|minutes)\b", re.IGNORECASE)
+# Booking, changes to a booking and negated requests always go to the agent,
+# which confirms the details with the user before it calls a tool.
+AGENT_ONLY_RE = re.compile(
+    r"\b(schedule|book\w*|set up|arrange|reserve|cancel\w*|reschedul\w*|move)\b"
+    r"|\b(not|no|never|without|don'?t|do not)\b|n't\b",
+    re.IGNORECASE,
+)
+AVAILABILITY_RE = re.compile(
+    r"\b(availab\w*|openings?|(?:free|open|available)\s+(?:slots?|times?|time slots?))\b", re.IGNORECASE
+)
+# "what happens if ...", "can I ...": questions about a policy, not a request for the listing.
+HYPOTHETICAL_RE = re.compile(r"\b(what happens|what if|can i|could i|how do i|is it possible)\b", re.IGNORECASE)
+
+# Example utterances for the embedding classifier, used when the keyword
+# rules are inconclusive. Only "availability" is ever answered from the
+# classifier; the other intents are there so that messages closer to them
+# than to an availability request are left to the agent.
+PROTOTYPES: Dict[str, List[str]] = {
+    "greeting": ["hi", "hello there", "hey", "good morning", "good evening", "hi, how are you?", "greetings"],
+    "availability": [
+        "what times are available on that day",
+        "which slots are free on this date",
+        "show me your availability for",
+        "when are you free on",
+        "do you have any openings on",
+    ],
+    "book": [
+        "schedule a meeting on this date at this time about a topic",
+        "book a call for that day at that time regarding something",
+        "set up a meeting at this time to discuss",
+        "please arrange a meeting on that date",
+    ],
+    "faq": [
+        "what is your refund policy",
+        "can I cancel my free trial",
+        "how much does it cost",
+        "what is the price of this plan",
+        "do you offer discounts",
+    ],
+}
+
+
+def _extract_date(text: str) -> Optional[str]:
+    # Read like the calendar prefetcher does; a message naming several days is left to the agent.
+    dates = extract_dates(text)
+    return dates[0].isoformat() if len(dates) == 1 else None
+
+
+class IntentRouter:
+    """
+    Answers high-confidence, simple requests without the LLM agent.
+
+    Keyword rules handle the common phrasings; when they are inconclusive an
+    optional embedding classifier (nearest prototype by cosine similarity)
+    picks the intent. A request is only handled when the intent is confident
+    and every detail the tool needs was extracted; anything else returns None
+    and goes to the agent. The router only answers read-only requests:
+    booking, cancelling and negated requests always go to the agent, so
+    nothing is booked without the user confirming it.
+
+    Handled intents:
+        - greeting (GREETING_RE only): greet_user_and_ask_name
+        - availability (one date, no time): get_formatted_availability
+    """
+
+    def __init__(self, embed_fn: Optional[Callable[[str], List[float]]] = None, threshold: float = 0.8):
+        """
+        Args:
+            embed_fn (Callable[[str], List[float]]): Embeds a text, or returns None while the model is not loaded yet.
+            threshold (float): Minimum cosine similarity for the classifier to accept an intent.
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self._prototypes: Optional[Dict[str, np.ndarray]] = None
+        self._lock = threading.Lock()
+        self.total = 0
+        self.handled: Dict[str, int] = {}
+        self.router_seconds = 0.0
+        self.agent_turns = 0
+        self.agent_seconds = 0.0
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        if self.embed_fn is None:
+            return None
+        vector = self.embed_fn(text)
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _classify(self, text: str) -> Optional[str]:
+        vector = self._embed(text)
+        if vector is None:
+            return None
+        if self._prototypes is None:
+            self._prototypes = {
+                intent: np.stack([self._embed(example) for example in examples])
+                for intent, examples in PROTOTYPES.items()
+            }
+        scores = {intent: float(np.max(matrix @ vector)) for intent, matrix in self._prototypes.items()}
+        intent = max(scores, key=scores.get)
+        return intent if scores[intent] >= self.threshold else None
+
+    def _rule_intent(self, text: str) -> Optional[str]:
+        if AVAILABILITY_RE.search(text):
+            return "availability"
+        return None
+
+    def _handle(self, text: str) -> Optional[str]:
+        # Only an exact greeting is answered: the classifier's scores sit too
+        # close together to tell "hi" from "yes, book it" on short messages.
+        if GREETING_RE.match(text):
+            return self._answer("greeting", greet_user_and_ask_name(), "greet_user_and_ask_name",
+                                "The user greeted me, so I introduced what I can help with.")
+        if AGENT_ONLY_RE.search(text) or HYPOTHETICAL_RE.search(text):
+            return None
+
+        date = _extract_date(text)
+        if date is None or TIME_RE.search(text):
+            return None
+        intent = self._rule_intent(text)
+        if intent is None:
+            try:
+                intent = self._classify(text)
+            except Exception as e:
+                logger.warning(f"intent classifier failed, falling back to the agent: {e}")
+                return None
+        if intent != "availability":
+            return None
+
+        duration_match = DURATION_RE.search(text)
+        duration = int(duration_match.group(1)) if duration_match else 60
+        return self._answer(intent, get_formatted_availability(date, duration), "get_formatted_availability",
+                            "The user asked for availability on a specific date.")
+
+    def _answer(self, intent: str, tool_output: str, tool_name: str, reasoning: str) -> str:
+        with self._lock:
+            self.handled[intent] = self.handled.get(intent, 0) + 1
+        return f"Answer: {tool_output}\n- Tool Used: {tool_name}\n- Reasoning: {reasoning}"
+
+    def route(self, query: str) -> Optional[str]:
+        """
+        Returns a templated answer for a request the router can handle, or None to use the agent.
+        """
+        started = time.perf_counter()
+        try:
+            answer = self._handle(query.strip())
+        except Exception as e:
+            logger.warning(f"intent router failed, falling back to the agent: {e}")
+            answer = None
+        with self._lock:
+            self.total += 1
+            if answer is not None:
+                self.router_seconds += time.perf_counter() - started
+        return answer
+
+    def record_agent_turn(self, seconds: float):
+        """
+        Records how long an agent turn took, to estimate the latency the router saves.
+        """
+        with self._lock:
+            self.agent_turns += 1
+            self.agent_seconds += seconds
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            handled = sum(self.handled.values())
+            avg_agent = self.agent_seconds / self.agent_turns if self.agent_turns else 0.0
+            avg_router = self.router_seconds / handled if handled else 0.0
+            return {
+                "total": self.total,
+                "handled": handled,
+                "handled_fraction": round(handled / self.total, 3) if self.total else 0.0,
+                "handled_by_intent": dict(self.handled),
+                "avg_agent_seconds": round(avg_agent, 3),
+                "avg_router_seconds": round(avg_router, 4),
+                "estimated_seconds_saved": round(handled * max(avg_agent - avg_router, 0.0), 2),
+            }
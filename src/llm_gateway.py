@@ -0,0 +1,592 @@
+# src/llm_gateway.py
+
+import asyncio
+import bisect
+import copy
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.prompt_builder import estimate_tokens
+from src.tracing import current_span, metrics
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+# Named sets of requests and tokens per minute that LLM_RATE_LIMITS can
+# refer to, e.g. "groq-free" or "groq-free,llama-3.1-8b-instant=60/12000".
+# No limits apply unless configured, so paid plans are not held to these.
+RATE_LIMIT_PRESETS = {
+    "groq-free": {
+        "llama-3.3-70b-versatile": (30, 12000),
+        "llama-3.1-8b-instant": (30, 6000),
+    },
+}
+
+# Lower values are served first.
+PRIORITIES = {"interactive": 0, "background": 1}
+_priority: ContextVar[str] = ContextVar("llm_priority", default="interactive")
+
+WAIT_SECONDS = metrics.histogram(
+    "agent_llm_gateway_wait_seconds", "Time LLM calls waited for the per-model rate limiter.", ("model", "priority"),
+)
+COALESCED = metrics.counter(
+    "agent_llm_coalesced_total", "LLM calls answered by an identical call already in flight.", ("model",),
+)
+RETRIES = metrics.counter(
+    "agent_llm_retries_total", "LLM calls retried after a rate limit or server error.", ("model", "reason"),
+)
+
+
+@contextmanager
+def llm_priority(name: str) -> Iterator[str]:
+    """
+    Runs the LLM calls made in the enclosed block at `name` priority ("interactive" or "background").
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"unknown LLM priority '{name}' (expected one of {sorted(PRIORITIES)})")
+    token = _priority.set(name)
+    try:
+        yield name
+    finally:
+        _priority.reset(token)
+
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Parses "model=rpm/tpm,model=rpm/tpm" (the LLM_RATE_LIMITS format); 0 leaves a dimension unlimited.
+
+    An item may also name a preset of RATE_LIMIT_PRESETS; later items override it per model.
+    """
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        if item.strip() in RATE_LIMIT_PRESETS:
+            limits.update(RATE_LIMIT_PRESETS[item.strip()])
+            continue
+        model, _, rates = item.rpartition("=")
+        if not model.strip():
+            raise ValueError(f"LLM_RATE_LIMITS item '{item.strip()}' is neither model=rpm/tpm nor one of {sorted(RATE_LIMIT_PRESETS)}")
+        rpm, _, tpm = rates.partition("/")
+        limits[model.strip()] = (float(rpm or 0), float(tpm or 0))
+    return limits
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    True for rate limits, 5xx responses and connection failures.
+    """
+    import httpx
+    import openai
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    status = status_of(error)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Returns the wait the provider asked for in a 429 response, in seconds.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class TokenBucket:
+    """
+    Holds up to `capacity` units and refills at `rate` units per second.
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A call larger than the bucket goes through once the bucket is full.
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def charge(self, amount: float):
+        # Positive amounts take more, negative ones give back; the level may go below zero.
+        self.level = min(self.capacity, self.level - amount)
+
+    def drain(self):
+        self.level = min(self.level, 0.0)
+
+
+class ModelScheduler:
+    """
+    Admits calls to one model at its requests- and tokens-per-minute rates.
+
+    Calls wait in one queue ordered by priority, then arrival; only the
+    first may be admitted, once both buckets hold enough for it. The
+    buckets are sized at `headroom` times the provider's limits, so
+    sustained traffic runs just under them. A 429 pauses the model for
+    the time the provider asked and empties the buckets, so admission
+    resumes at the steady rate instead of another burst.
+    """
+
+    def __init__(self, model: str, rpm: float = 0, tpm: float = 0, headroom: float = 0.9):
+        self.model = model
+        self.requests = TokenBucket(rpm * headroom, rpm * headroom / 60) if rpm else None
+        self.tokens = TokenBucket(tpm * headroom, tpm * headroom / 60) if tpm else None
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self.paused_until = 0.0
+        self.admitted = 0
+        self.rate_limited = 0
+
+    def _poll(self, ticket: Tuple[int, int], tokens: int) -> float:
+        # Called with the lock held; 0 means admitted, inf means not first in line.
+        if self._queue[0] != ticket:
+            return math.inf
+        now = time.monotonic()
+        wait = max(0.0, self.paused_until - now)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        if self.requests is not None:
+            self.requests.take(1, now)
+        if self.tokens is not None:
+            self.tokens.take(tokens, now)
+        self._queue.pop(0)
+        self.admitted += 1
+        self._cond.notify_all()
+        return 0.0
+
+    def _leave(self, ticket: Tuple[int, int]):
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def acquire(self, tokens: int, priority: int = 0) -> float:
+        """
+        Blocks until the call may be sent; returns the seconds waited.
+        """
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            bisect.insort(self._queue, ticket)
+        try:
+            with self._cond:
+                while True:
+                    wait = self._poll(ticket, tokens)
+                    if wait == 0:
+                        return time.monotonic() - started
+                    self._cond.wait(None if wait == math.inf else wait)
+        except BaseException:
+            self._leave(ticket)
+            raise
+
+    async def aacquire(self, tokens: int, priority: int = 0) -> float:
+        """
+        Async variant of acquire(); waits without blocking the event loop.
+        """
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            bisect.insort(self._queue, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._poll(ticket, tokens)
+                if wait == 0:
+                    return time.monotonic() - started
+                await asyncio.sleep(0.01 if wait == math.inf else wait)
+        except BaseException:
+            self._leave(ticket)
+            raise
+
+    def settle(self, reserved: int, used: int):
+        """
+        Corrects the token bucket once the provider reported what the call really used.
+        """
+        if self.tokens is None or used == reserved:
+            return
+        with self._cond:
+            self.tokens.charge(used - reserved)
+            self._cond.notify_all()
+
+    def penalize(self, seconds: float):
+        """
+        Holds back every call to the model for `seconds` after a 429.
+        """
+        with self._cond:
+            self.rate_limited += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.drain()
+
+    def queued(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+
+# Result of a flight whose leader went away without a result or an error.
+_ABANDONED = object()
+
+
+def _copy(result: Any) -> Any:
+    return result.model_copy(deep=True) if hasattr(result, "model_copy") else copy.deepcopy(result)
+
+
+class Singleflight:
+    """
+    Shares one execution among concurrent calls with the same key.
+
+    The first caller runs the call; callers arriving while it is in flight
+    wait for it and get a copy of its result (or its exception). If the
+    first caller goes away without one (cancelled, interrupted), the flight
+    is dropped and the waiting callers try again, one of them running the
+    call this time.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _done(self, key: str, future: Future, result: Any = None, error: Optional[Exception] = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns (result, shared): shared is True when another caller's call produced it.
+        """
+        future, leader = self._join(key)
+        while not leader:
+            result = future.result()
+            if result is not _ABANDONED:
+                return _copy(result), True
+            future, leader = self._join(key)
+        try:
+            result = fn()
+        except Exception as e:
+            self._done(key, future, error=e)
+            raise
+        except BaseException:
+            self._done(key, future, _ABANDONED)
+            raise
+        self._done(key, future, result)
+        return result, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        future, leader = self._join(key)
+        while not leader:
+            # Shielded: a waiter being cancelled must not cancel the shared future.
+            result = await asyncio.shield(asyncio.wrap_future(future))
+            if result is not _ABANDONED:
+                return _copy(result), True
+            future, leader = self._join(key)
+        try:
+            result = await fn()
+        except Exception as e:
+            self._done(key, future, error=e)
+            raise
+        except BaseException:
+            self._done(key, future, _ABANDONED)
+            raise
+        self._done(key, future, result)
+        return result, False
+
+
+def _plain(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    return value
+
+
+def request_key(model: str, method: str, args: Sequence[Any], kwargs: Dict[str, Any]) -> str:
+    """
+    Hashes everything that determines an LLM response (model, method, messages or prompt and options).
+    """
+    # Objects without a plain form fall back to str(), which for most
+    # includes their id, so such calls are simply never coalesced.
+    payload = json.dumps([model, method, _plain(list(args)), _plain(kwargs)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMGateway:
+    """
+    The single path every LLM call of the process takes to the provider.
+
+    - Identical concurrent calls (same model, messages and options) are
+      coalesced into one upstream request.
+    - Each model with known limits has a ModelScheduler: calls wait, in
+      priority order, until its request and token budgets allow them.
+    - 429s, 5xx responses and connection failures are retried with
+      jittered exponential backoff (at least the provider's retry-after
+      for a 429, which also pauses the model for every caller).
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None, headroom: float = 0.9,
+                 max_retries: int = 3, backoff_seconds: float = 0.5, backoff_max_seconds: float = 20.0,
+                 coalesce: bool = True, completion_tokens: int = 256):
+        """
+        Args:
+            limits (Dict[str, Tuple[float, float]]): Requests and tokens per minute per model.
+            headroom (float): Fraction of each limit to use.
+            max_retries (int): Retries of a failed call (callers may ask for fewer).
+            backoff_seconds (float): Base of the exponential backoff.
+            backoff_max_seconds (float): Cap of the backoff.
+            coalesce (bool): Share identical in-flight calls.
+            completion_tokens (int): Completion size reserved when a call sets no max_tokens.
+        """
+        self.limits = dict(limits or {})
+        self.headroom = headroom
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.coalesce = coalesce
+        self.completion_tokens = completion_tokens
+        self._schedulers: Dict[str, Optional[ModelScheduler]] = {}
+        self._lock = threading.Lock()
+        self._flights = Singleflight()
+        metrics.gauge(
+            "agent_llm_gateway_queued",
+            "LLM calls waiting for the per-model rate limiter.",
+            lambda: {(("model", s.model),): s.queued() for s in list(self._schedulers.values()) if s is not None},
+        )
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        limits = parse_rate_limits(os.environ.get("LLM_RATE_LIMITS", ""))
+        if limits:
+            logger.info("LLM rate limits (requests/tokens per minute): " + ", ".join(
+                f"{model}={rpm:g}/{tpm:g}" for model, (rpm, tpm) in sorted(limits.items())
+            ))
+        else:
+            logger.info("LLM rate limits: none configured (set LLM_RATE_LIMITS, e.g. 'groq-free'); 429s are retried")
+        return cls(
+            limits=limits,
+            headroom=float(os.environ.get("LLM_RATE_HEADROOM", 0.9)),
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", 3)),
+            backoff_seconds=float(os.environ.get("LLM_BACKOFF_SECONDS", 0.5)),
+            backoff_max_seconds=float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", 20)),
+            coalesce=os.environ.get("LLM_COALESCE", "true").lower() in ("1", "true", "yes"),
+        )
+
+    def scheduler(self, model: str) -> Optional[ModelScheduler]:
+        """
+        Returns the model's scheduler, or None when its limits are unknown.
+        """
+        with self._lock:
+            if model not in self._schedulers:
+                rpm, tpm = self.limits.get(model, (0, 0))
+                self._schedulers[model] = ModelScheduler(model, rpm, tpm, self.headroom) if rpm or tpm else None
+            return self._schedulers[model]
+
+    @staticmethod
+    def prompt_tokens(args: Sequence[Any], kwargs: Dict[str, Any]) -> int:
+        """
+        Estimated prompt size of a call: its messages (or prompt) and tool specs.
+        """
+        prompt = 0
+        for item in args:
+            for message in item if isinstance(item, (list, tuple)) else [item]:
+                prompt += estimate_tokens(str(getattr(message, "content", message) or ""))
+        return prompt + sum(estimate_tokens(json.dumps(spec, default=str)) for spec in kwargs.get("tools") or ())
+
+    def reserve(self, prompt_tokens: int, kwargs: Dict[str, Any], max_tokens: Optional[int] = None) -> int:
+        """
+        Tokens to reserve for a call: its prompt plus the longest completion expected.
+        """
+        return prompt_tokens + int(kwargs.get("max_tokens") or max_tokens or self.completion_tokens)
+
+    def _delay(self, error: BaseException, attempt: int) -> float:
+        backoff = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** attempt)
+        wait = retry_after(error) if status_of(error) == 429 else None
+        if wait is not None:
+            # Spread the retries over a backoff interval after the provider's wait.
+            return wait + random.uniform(0, backoff)
+        return random.uniform(0, backoff)
+
+    def _retrying(self, model: str, error: BaseException, attempt: int, retries: int) -> Optional[float]:
+        # Returns how long to wait before the next attempt, or None to give up.
+        if attempt >= retries or not is_retryable(error):
+            return None
+        delay = self._delay(error, attempt)
+        status = status_of(error)
+        reason = "rate_limited" if status == 429 else "server_error" if status else "connection"
+        RETRIES.inc(model=model, reason=reason)
+        scheduler = self.scheduler(model)
+        if status == 429 and scheduler is not None:
+            scheduler.penalize(retry_after(error) or delay)
+        logger.warning(f"{model} call failed ({type(error).__name__}, {reason}); retry {attempt + 1}/{retries} in {delay:.2f}s")
+        return delay
+
+    def _admit(self, model: str, tokens: int) -> Optional[ModelScheduler]:
+        scheduler = self.scheduler(model)
+        if scheduler is not None:
+            priority = _priority.get()
+            waited = scheduler.acquire(tokens, PRIORITIES[priority])
+            WAIT_SECONDS.observe(waited, model=model, priority=priority)
+        return scheduler
+
+    async def _aadmit(self, model: str, tokens: int) -> Optional[ModelScheduler]:
+        scheduler = self.scheduler(model)
+        if scheduler is not None:
+            priority = _priority.get()
+            waited = await scheduler.aacquire(tokens, PRIORITIES[priority])
+            WAIT_SECONDS.observe(waited, model=model, priority=priority)
+        return scheduler
+
+    @staticmethod
+    def _used(result: Any, prompt_tokens: int) -> Optional[int]:
+        # Tokens the call really used: as reported by the provider, else
+        # estimated from the completion text (None for streams).
+        reported = getattr(result, "additional_kwargs", None) or {}
+        if "prompt_tokens" in reported:
+            return int(reported["prompt_tokens"]) + int(reported.get("completion_tokens", 0))
+        message = getattr(result, "message", None)
+        text = getattr(message, "content", None) if message is not None else getattr(result, "text", None)
+        return prompt_tokens + estimate_tokens(text) if isinstance(text, str) else None
+
+    def _send(self, model: str, tokens: Tuple[int, int], fn: Callable[[], Any], retries: int) -> Any:
+        attempt = 0
+        while True:
+            scheduler = self._admit(model, tokens[1])
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retrying(model, e, attempt, retries)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            used = self._used(result, tokens[0])
+            if scheduler is not None and used is not None:
+                scheduler.settle(tokens[1], used)
+            return result
+
+    async def _asend(self, model: str, tokens: Tuple[int, int], fn: Callable[[], Awaitable[Any]], retries: int) -> Any:
+        attempt = 0
+        while True:
+            scheduler = await self._aadmit(model, tokens[1])
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._retrying(model, e, attempt, retries)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            used = self._used(result, tokens[0])
+            if scheduler is not None and used is not None:
+                scheduler.settle(tokens[1], used)
+            return result
+
+    def _coalesced(self, model: str, shared: bool):
+        if shared:
+            COALESCED.inc(model=model)
+            call_span = current_span()
+            if call_span is not None:
+                call_span.set(coalesced=True)
+
+    def call(self, model: str, method: str, args: Sequence[Any], kwargs: Dict[str, Any], fn: Callable[[], Any],
+             retries: Optional[int] = None, coalesce: bool = True, max_tokens: Optional[int] = None) -> Tuple[Any, bool]:
+        """
+        Sends one LLM call through the gateway.
+
+        Args:
+            model (str): Model the call goes to.
+            method (str): LLM method name, part of the coalescing key.
+            args (Sequence): Positional arguments of the call (messages or prompt).
+            kwargs (Dict): Keyword arguments of the call (tools, options).
+            fn (Callable): Makes the actual call.
+            retries (int): Retries for this call, at most the gateway's max_retries.
+            coalesce (bool): Whether the call may be shared with identical ones.
+            max_tokens (int): The LLM's completion limit, for the token reservation.
+
+        Returns:
+            Tuple[Any, bool]: The response, and whether it came from another caller's call.
+        """
+        retries = self.max_retries if retries is None else min(retries, self.max_retries)
+        prompt_tokens = self.prompt_tokens(args, kwargs)
+        tokens = (prompt_tokens, self.reserve(prompt_tokens, kwargs, max_tokens))
+        send = lambda: self._send(model, tokens, fn, retries)
+        if not (self.coalesce and coalesce):
+            return send(), False
+        result, shared = self._flights.do(request_key(model, method, args, kwargs), send)
+        self._coalesced(model, shared)
+        return result, shared
+
+    async def acall(self, model: str, method: str, args: Sequence[Any], kwargs: Dict[str, Any],
+                    fn: Callable[[], Awaitable[Any]], retries: Optional[int] = None, coalesce: bool = True,
+                    max_tokens: Optional[int] = None) -> Tuple[Any, bool]:
+        """
+        Async variant of call().
+        """
+        retries = self.max_retries if retries is None else min(retries, self.max_retries)
+        prompt_tokens = self.prompt_tokens(args, kwargs)
+        tokens = (prompt_tokens, self.reserve(prompt_tokens, kwargs, max_tokens))
+        send = lambda: self._asend(model, tokens, fn, retries)
+        if not (self.coalesce and coalesce):
+            return await send(), False
+        result, shared = await self._flights.ado(request_key(model, method, args, kwargs), send)
+        self._coalesced(model, shared)
+        return result, shared
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            schedulers = [s for s in self._schedulers.values() if s is not None]
+        return {
+            s.model: {"admitted": s.admitted, "queued": s.queued(), "rate_limited": s.rate_limited}
+            for s in schedulers
+        }
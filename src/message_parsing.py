@@ -0,0 +1,106 @@
+# src/message_parsing.py
+
+# Dates, times and greetings in user messages. The intent router, the
+# calendar prefetcher and the prompt builder's tool selection all read
+# messages through these patterns, so they agree on what a message asks for.
+
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+GREETING_RE = re.compile(
+    r"^\s*(hi+|hello+|hey+|hiya|howdy|greetings|good\s+(morning|afternoon|evening)|hi there|hello there)"
+    r"[\s!.,]*(there|team|everyone|all)?[\s!.,]*$",
+    re.IGNORECASE,
+)
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+RELATIVE_DATE_RE = re.compile(r"\b(day after tomorrow|tomorrow|today|tonight)\b", re.IGNORECASE)
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+WEEKDAY_RE = re.compile(r"\b(?:(this|next|coming)\s+)?(" + "|".join(WEEKDAYS) + r")\b", re.IGNORECASE)
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_MONTH = r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+MONTH_DAY_RE = re.compile(rf"\b{_MONTH}\s+{_DAY}(?:,?\s+(\d{{4}}))?\b", re.IGNORECASE)
+DAY_MONTH_RE = re.compile(rf"\b{_DAY}\s+(?:of\s+)?{_MONTH}(?:,?\s+(\d{{4}}))?\b", re.IGNORECASE)
+# "3pm", "3:30 PM", "15:00"
+TIME_RE = re.compile(r"\b(\d{1,2}:\d{2}(?:\s*[ap]\.?m\.?)?|\d{1,2}\s*[ap]\.?m\.?)(?=\W|$)", re.IGNORECASE)
+
+
+def normalize_time(raw: str) -> str:
+    """
+    Converts a TIME_RE match ("3pm", "3:30 p.m.", "15:00") to "HH:MM" with parse_time().
+    """
+    # Imported here: src.tools builds the calendar prefetcher on top of this module.
+    from src.tools import parse_time
+
+    raw = re.sub(r"\.", "", raw).upper().replace("AM", " AM").replace("PM", " PM")
+    raw = re.sub(r"\s+", " ", raw).strip()
+    if ":" not in raw:
+        hour, suffix = raw.split(" ")
+        raw = f"{hour}:00 {suffix}"
+    return parse_time(raw)
+
+
+def _month_date(month: str, day: str, year: Optional[str], today: date) -> Optional[date]:
+    try:
+        found = date(int(year) if year else today.year, MONTHS.index(month[:3].lower()) + 1, int(day))
+    except ValueError:
+        return None
+    if not year and found < today:
+        found = found.replace(year=today.year + 1)
+    return found
+
+
+def extract_dates(text: str, today: Optional[date] = None) -> List[date]:
+    """
+    Finds the calendar dates a message refers to, in order of appearance.
+
+    Understands ISO dates, today/tomorrow/day after tomorrow, weekday names
+    (the next such day; "this friday" on a Friday is today) and month-name
+    dates such as "March 5th" or "5 March 2030" (next year when already past).
+
+    Args:
+        text (str): The user message.
+        today (date): Reference day, UTC today by default.
+
+    Returns:
+        List[date]: The distinct dates found.
+    """
+    today = today or datetime.utcnow().date()
+    found: List[Tuple[int, date]] = []
+    for match in ISO_DATE_RE.finditer(text):
+        try:
+            found.append((match.start(), date(*(int(part) for part in match.groups()))))
+        except ValueError:
+            pass
+    for match in RELATIVE_DATE_RE.finditer(text):
+        word = match.group(1).lower()
+        offset = 2 if word == "day after tomorrow" else 1 if word == "tomorrow" else 0
+        found.append((match.start(), today + timedelta(days=offset)))
+    for match in WEEKDAY_RE.finditer(text):
+        qualifier, name = (match.group(1) or "").lower(), match.group(2).lower()
+        ahead = (WEEKDAYS.index(name) - today.weekday()) % 7
+        if ahead == 0 and qualifier != "this":
+            ahead = 7
+        found.append((match.start(), today + timedelta(days=ahead)))
+    for match in MONTH_DAY_RE.finditer(text):
+        found.append((match.start(), _month_date(match.group(1), match.group(2), match.group(3), today)))
+    for match in DAY_MONTH_RE.finditer(text):
+        found.append((match.start(), _month_date(match.group(2), match.group(1), match.group(3), today)))
+    dates: List[date] = []
+    for _, day in sorted(found, key=lambda item: item[0]):
+        if day is not None and day not in dates:
+            dates.append(day)
+    return dates
+
+
+def extract_times(text: str) -> List[str]:
+    """
+    Finds clock times in a message, normalized to "HH:MM" with parse_time().
+    """
+    times = []
+    for raw in TIME_RE.findall(text):
+        parsed = normalize_time(raw)
+        if re.fullmatch(r"\d{2}:\d{2}", parsed) and parsed not in times:
+            times.append(parsed)
+    return times
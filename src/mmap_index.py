@@ -0,0 +1,229 @@
+# src/mmap_index.py
+
+import json
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+VECTORS_FILE = "vectors.npy"
+DOCSTORE_FILE = "docstore.bin"
+OFFSETS_FILE = "docstore_offsets.npy"
+META_FILE = "mmap_index.json"
+INDEX_DTYPES = ("float16", "float32")
+# Rows scored per matrix product; bounds the float32 temporary for float16 vectors.
+SEARCH_BLOCK_ROWS = 16384
+
+
+def _replace_atomically(path: str, write):
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def write_mmap_index(directory: str, chunks: Sequence[dict], embeddings: np.ndarray, fingerprint: str, dtype: str = "float16"):
+    """
+    Writes the serving files for a chunk set: unit-normalized vectors and a packed docstore.
+
+    The docstore is every chunk record (id, text, metadata) JSON-encoded and
+    concatenated into one file, with an int64 offsets array so record i is
+    bytes offsets[i]:offsets[i + 1]. Files are replaced atomically; processes
+    that already mapped the old files keep reading them until they reopen.
+
+    Args:
+        directory (str): Directory to write to.
+        chunks (Sequence[dict]): Chunk records as kept in the FAQ index store manifest.
+        embeddings (np.ndarray): One embedding row per chunk.
+        fingerprint (str): Identifies the source files the chunks were built from.
+        dtype (str): One of INDEX_DTYPES; float16 halves the file at a negligible cost in ranking precision.
+    """
+    if dtype not in INDEX_DTYPES:
+        raise ValueError(f"unknown index dtype '{dtype}', expected one of {INDEX_DTYPES}")
+    os.makedirs(directory, exist_ok=True)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if len(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+
+    def write_docstore(path):
+        with open(path, "wb") as f:
+            for i, chunk in enumerate(chunks):
+                record = json.dumps(
+                    {
+                        "id": chunk["id"],
+                        "text": chunk["text"],
+                        "metadata": chunk["metadata"],
+                        "excluded_embed_metadata_keys": chunk["excluded_embed_metadata_keys"],
+                        "excluded_llm_metadata_keys": chunk["excluded_llm_metadata_keys"],
+                    },
+                    ensure_ascii=False,
+                ).encode("utf-8")
+                f.write(record)
+                offsets[i + 1] = offsets[i] + len(record)
+
+    def save_array(array):
+        def write(path):
+            # Through a file object: np.save would append ".npy" to the temporary name.
+            with open(path, "wb") as f:
+                np.save(f, array)
+        return write
+
+    _replace_atomically(os.path.join(directory, DOCSTORE_FILE), write_docstore)
+    _replace_atomically(os.path.join(directory, OFFSETS_FILE), save_array(offsets))
+    _replace_atomically(os.path.join(directory, VECTORS_FILE), save_array(vectors.astype(dtype)))
+    # Written last: readers trust the files only once the metadata matches.
+    meta = {"fingerprint": fingerprint, "dtype": dtype, "chunks": len(chunks), "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0}
+    _replace_atomically(os.path.join(directory, META_FILE), lambda path: _write_json(path, meta))
+    logger.info(f"wrote memory-mapped FAQ index: {len(chunks)} chunks, {dtype}")
+
+
+def _write_json(path: str, value: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+
+
+def read_meta(directory: str) -> Optional[dict]:
+    """
+    Returns the serving files' metadata, or None when they are missing or unreadable.
+    """
+    try:
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class MmapDocstore(Sequence[TextNode]):
+    """
+    Read-only sequence of chunk nodes decoded on access from the packed docstore.
+
+    Nothing is loaded up front: the record bytes stay in the page cache,
+    shared by every process that maps the file.
+    """
+
+    def __init__(self, directory: str):
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        path = os.path.join(directory, DOCSTORE_FILE)
+        # np.memmap refuses empty files.
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def record(self, i: int) -> dict:
+        return json.loads(self.data[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes())
+
+    def __getitem__(self, i: int) -> TextNode:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        record = self.record(i)
+        return TextNode(
+            id_=record["id"],
+            text=record["text"],
+            metadata=record["metadata"],
+            excluded_embed_metadata_keys=record["excluded_embed_metadata_keys"],
+            excluded_llm_metadata_keys=record["excluded_llm_metadata_keys"],
+        )
+
+    def __iter__(self) -> Iterator[TextNode]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class MmapVectorIndex:
+    """
+    Vector index served from memory-mapped, read-only files.
+
+    Vectors are unit-normalized rows of a float16 or float32 matrix, so
+    cosine similarity is one matrix-vector product followed by a partial
+    sort. The pages are backed by the files on disk, so any number of worker
+    processes share a single copy of the index in the OS page cache.
+    """
+
+    def __init__(self, vectors: np.ndarray, docstore: MmapDocstore, embed_model=None):
+        """
+        Args:
+            vectors (np.ndarray): Memory-mapped (chunks, dim) matrix of unit-normalized embeddings.
+            docstore (MmapDocstore): The chunk nodes, in the same order as the rows.
+            embed_model: Embeds queries that arrive without an embedding.
+        """
+        self.vectors = vectors
+        self.docstore = docstore
+        self.embed_model = embed_model
+
+    @classmethod
+    def open(cls, directory: str, embed_model=None) -> "MmapVectorIndex":
+        """
+        Memory-maps the serving files written by write_mmap_index().
+        """
+        vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        docstore = MmapDocstore(directory)
+        if vectors.shape[0] != len(docstore):
+            raise ValueError(f"FAQ index files disagree: {vectors.shape[0]} vectors, {len(docstore)} chunks")
+        logger.info(f"memory-mapped FAQ index: {len(docstore)} chunks, {vectors.dtype}")
+        return cls(vectors, docstore, embed_model)
+
+    def search(self, query, top_k: int) -> List[Tuple[int, float]]:
+        """
+        Returns up to `top_k` (row, cosine similarity) pairs, best first.
+
+        Args:
+            query: Query embedding (any length-dim sequence).
+            top_k (int): Number of results.
+        """
+        n = self.vectors.shape[0]
+        if n == 0 or top_k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ q
+        k = min(top_k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def as_retriever(self, similarity_top_k: int = 2) -> "MmapRetriever":
+        return MmapRetriever(self, similarity_top_k)
+
+    def stats(self) -> dict:
+        return {
+            "chunks": len(self.docstore),
+            "dtype": str(self.vectors.dtype),
+            "vector_bytes": int(self.vectors.nbytes),
+            "docstore_bytes": int(self.docstore.data.nbytes),
+        }
+
+
+class MmapRetriever(BaseRetriever):
+    """
+    Dense retriever over an MmapVectorIndex.
+    """
+
+    def __init__(self, index: MmapVectorIndex, similarity_top_k: int = 2):
+        super().__init__()
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self.index.embed_model.get_query_embedding(query_bundle.query_str)
+        return [
+            NodeWithScore(node=self.index.docstore[row], score=score)
+            for row, score in self.index.search(embedding, self.similarity_top_k)
+        ]
@@ -0,0 +1,309 @@
+# src/prompt_builder.py
+
+import contextvars
+import json
+import re
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from llama_index.core.tools.types import ToolMetadata
+
+from src.message_parsing import GREETING_RE
+from src.session_pool import get_session_state
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+RULE_RE = re.compile(r"^(\d+)\.\s+(.*)$")
+
+CALENDAR_RE = re.compile(
+    r"\b(\d{4}-\d{2}-\d{2}|\d{1,2}(:\d{2})?\s*[ap]\.?m\.?|\d{1,2}:\d{2}|schedul\w*|book\w*|meet\w*|call|"
+    r"appointment|availab\w*|free|slots?|calendar|today|tomorrow|next week|this week|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    re.IGNORECASE,
+)
+FAQ_RE = re.compile(
+    r"\b(polic\w*|pric\w*|cost\w*|services?|products?|refunds?|support|company|offer\w*|plans?|features?|"
+    r"accounts?|payments?|contracts?|hours|contact|faqs?)\b",
+    re.IGNORECASE,
+)
+
+# Tools exposed per detected intent; a turn with no clear intent sees every
+# tool, and a turn with one also keeps the tools of the previous turn's
+# intents, so "yes, go ahead with the demo" can finish a proposed booking.
+INTENT_TOOLS: Dict[str, List[str]] = {
+    "calendar": [
+        "get_formatted_availability",
+        "get_calendar_availability",
+        "get_multi_day_availability",
+        "is_time_slot_available",
+        "schedule_google_meet",
+    ],
+    "faq": ["faq_pdf_tool"],
+    "greeting": ["greet_user_and_ask_name"],
+}
+
+_current_usage: contextvars.ContextVar[Optional["TokenUsage"]] = contextvars.ContextVar("token_usage", default=None)
+_hidden_tools: contextvars.ContextVar[FrozenSet[str]] = contextvars.ContextVar("hidden_tools", default=frozenset())
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token) for when the provider reports no usage.
+    """
+    return max(1, len(text) // 4) if text else 0
+
+
+def compact_instructions(text: str) -> str:
+    """
+    Normalizes a prompt written as an indented multi-line string.
+
+    Strips indentation and trailing whitespace, collapses runs of blank
+    lines, drops numbered rules that repeat an earlier rule word for word
+    (ignoring their number), and renumbers the rules left in each section.
+
+    Args:
+        text (str): The prompt as written in the source.
+
+    Returns:
+        str: The compacted prompt.
+    """
+    lines: List[str] = []
+    seen: Set[str] = set()
+    number = 0
+    for raw in text.splitlines():
+        line = re.sub(r"\s+", " ", raw).strip()
+        if not line:
+            if lines and lines[-1]:
+                lines.append("")
+            continue
+        match = RULE_RE.match(line)
+        if not match:
+            number = 0
+            lines.append(line)
+            continue
+        key = match.group(2).lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        number += 1
+        lines.append(f"{number}. {match.group(2)}")
+    return "\n".join(lines).strip()
+
+
+def _strip_titles(schema: Any) -> Any:
+    # Pydantic adds a "title" to every property; the model does not need it.
+    if isinstance(schema, dict):
+        return {k: _strip_titles(v) for k, v in schema.items() if k != "title" or not isinstance(v, str)}
+    if isinstance(schema, list):
+        return [_strip_titles(v) for v in schema]
+    return schema
+
+
+@dataclass
+class CompactToolMetadata(ToolMetadata):
+    """
+    ToolMetadata whose OpenAI tool schema is serialized once.
+
+    The stock metadata rebuilds the JSON schema from the pydantic model on
+    every agent step; this one computes it (without property titles) up
+    front and hands out copies, since the LLM client adds keys to the spec
+    it receives.
+    """
+
+    def __post_init__(self):
+        self._parameters = _strip_titles(super().get_parameters_dict())
+        self._spec = super().to_openai_tool()
+        self._spec["function"]["parameters"] = self._parameters
+        self.schema_tokens = estimate_tokens(json.dumps(self._spec))
+
+    def get_parameters_dict(self) -> dict:
+        return dict(self._parameters)
+
+    def to_openai_tool(self, skip_length_check: bool = False) -> Dict[str, Any]:
+        function = self._spec["function"]
+        return {"type": "function", "function": {**function, "parameters": dict(function["parameters"])}}
+
+
+def compact_tool(tool):
+    """
+    Replaces a tool's metadata with a CompactToolMetadata; returns the tool.
+    """
+    metadata = tool.metadata
+    tool._metadata = CompactToolMetadata(
+        description=re.sub(r"\s+", " ", metadata.description).strip(),
+        name=metadata.name,
+        fn_schema=metadata.fn_schema,
+        return_direct=metadata.return_direct,
+    )
+    return tool
+
+
+def detect_intents(text: str) -> Set[str]:
+    """
+    Returns the intents a user message clearly touches ("calendar", "faq", "greeting").
+    """
+    intents: Set[str] = set()
+    if GREETING_RE.match(text):
+        intents.add("greeting")
+    if CALENDAR_RE.search(text):
+        intents.add("calendar")
+    if FAQ_RE.search(text):
+        intents.add("faq")
+    return intents
+
+
+class TokenUsage:
+    """
+    Token counts of the LLM calls made while serving one request.
+    """
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "estimated": self.estimated,
+        }
+
+
+@contextmanager
+def track_tokens():
+    """
+    Collects the token counts of every LLM call made inside the block.
+    """
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+@contextmanager
+def without_tools(names: Iterable[str]):
+    """
+    Hides the named tools from the agent for the turns run inside the block.
+
+    The agent can only call tools the retriever offered for the step, so a
+    hidden tool cannot run at all.
+    """
+    token = _hidden_tools.set(frozenset(names))
+    try:
+        yield
+    finally:
+        _hidden_tools.reset(token)
+
+
+def record_llm_call(messages: Sequence[Any], tools: Optional[Iterable[Dict]] = None, response: Any = None) -> Tuple[int, int, bool]:
+    """
+    Counts the tokens of one LLM call and adds them to the current request's TokenUsage, if one is being tracked.
+
+    Uses the usage the provider reported on the response; streamed calls
+    report none, so their prompt size is estimated from the messages and
+    tool specs that were sent.
+
+    Returns:
+        Tuple[int, int, bool]: Prompt tokens, completion tokens, and whether they were estimated.
+    """
+    reported = getattr(response, "additional_kwargs", None) or {}
+    if "prompt_tokens" in reported:
+        prompt_tokens = reported["prompt_tokens"]
+        completion_tokens = reported.get("completion_tokens", 0)
+        estimated = False
+    else:
+        prompt_tokens = sum(estimate_tokens(str(getattr(m, "content", m) or "")) for m in messages)
+        prompt_tokens += sum(estimate_tokens(json.dumps(spec)) for spec in tools or ())
+        completion_tokens = 0
+        estimated = True
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.llm_calls += 1
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+        usage.estimated = usage.estimated or estimated
+    return prompt_tokens, completion_tokens, estimated
+
+
+class PromptBuilder:
+    """
+    Assembles the parts of the agent prompt that are fixed per process.
+
+    The system prompt is compacted once, tool schemas are serialized once,
+    and on each turn only the tools relevant to the detected intent are
+    offered to the model. It is passed to the agent as its tool retriever.
+    Per-request token counts are aggregated for reporting.
+    """
+
+    def __init__(self, system_prompt: str, tools: Sequence[Any], select_tools: bool = True):
+        """
+        Args:
+            system_prompt (str): The instructions as written in the source.
+            tools (Sequence[BaseTool]): Every tool the agent may use.
+            select_tools (bool): Offer only intent-relevant tools per turn.
+        """
+        self.system_prompt = compact_instructions(system_prompt)
+        self.tools = [compact_tool(tool) for tool in tools]
+        self.select_tools = select_tools
+        self._by_name = {tool.metadata.name: tool for tool in self.tools}
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.total_prompt_tokens = 0
+        self.total_llm_calls = 0
+        logger.info(
+            f"system prompt {estimate_tokens(system_prompt)} -> {estimate_tokens(self.system_prompt)} tokens, "
+            f"tool schemas {sum(tool.metadata.schema_tokens for tool in self.tools)} tokens"
+        )
+
+    def tools_for(self, message: str, recent_intents: Iterable[str] = ()) -> List[Any]:
+        """
+        Returns the tools to offer for a user message.
+
+        Args:
+            message (str): The user message of the turn.
+            recent_intents (Iterable[str]): Intents of the previous turn, whose tools stay on offer.
+        """
+        intents = detect_intents(message or "") if self.select_tools else set()
+        if not intents:
+            return list(self.tools)
+        intents.update(intent for intent in recent_intents if intent in INTENT_TOOLS)
+        names = {name for intent in intents for name in INTENT_TOOLS[intent]}
+        return [tool for tool in self.tools if tool.metadata.name in names]
+
+    def retrieve(self, message: Any) -> List[Any]:
+        # ObjectRetriever interface used by the agent worker on every step.
+        tools = self.tools_for(str(message), get_session_state().get("recent_intents", ()))
+        hidden = _hidden_tools.get()
+        return [tool for tool in tools if tool.metadata.name not in hidden] if hidden else tools
+
+    def remember_turn(self, message: str, tool_names: Iterable[str]):
+        """
+        Stores the intents of a finished turn (its message and the tools it called) in the session state.
+        """
+        intents = detect_intents(message or "")
+        intents.update(intent for intent, names in INTENT_TOOLS.items() if set(names) & set(tool_names))
+        get_session_state()["recent_intents"] = sorted(intents)
+
+    def record(self, usage: TokenUsage):
+        with self._lock:
+            self.turns += 1
+            self.total_prompt_tokens += usage.prompt_tokens
+            self.total_llm_calls += usage.llm_calls
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "system_prompt_tokens": estimate_tokens(self.system_prompt),
+                "tool_schema_tokens": {tool.metadata.name: tool.metadata.schema_tokens for tool in self.tools},
+                "turns": self.turns,
+                "avg_prompt_tokens_per_turn": round(self.total_prompt_tokens / self.turns, 1) if self.turns else 0.0,
+                "avg_llm_calls_per_turn": round(self.total_llm_calls / self.turns, 2) if self.turns else 0.0,
+            }
@@ -0,0 +1,149 @@
+# src/resources.py
+
+import multiprocessing
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+PROCESS_STARTED_AT = time.monotonic()
+
+_registry: Dict[str, "LazyResource"] = {}
+_registry_lock = threading.Lock()
+
+
+class LazyResource:
+    """
+    A value that is built on first use instead of at import time.
+
+    Building is guarded by a lock so concurrent callers wait for a single
+    build. A failed build is recorded (and reported by readiness) and retried
+    on the next call to get().
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        """
+        Args:
+            name (str): Name reported in readiness status and logs.
+            factory (Callable[[], Any]): Zero-argument callable that builds the value.
+        """
+        self.name = name
+        self.factory = factory
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.build_seconds: Optional[float] = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def get(self) -> Any:
+        """
+        Returns the value, building it first if needed.
+        """
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state == "ready":
+                return self._value
+            self.state = "building"
+            started = time.monotonic()
+            logger.info(f"building resource '{self.name}'")
+            try:
+                value = self.factory()
+            except Exception as e:
+                self.state = "failed"
+                self.error = f"{type(e).__name__}: {e}"
+                logger.exception(f"resource '{self.name}' failed to build")
+                raise
+            self._value = value
+            self.build_seconds = round(time.monotonic() - started, 3)
+            self.error = None
+            self.state = "ready"
+            logger.info(f"resource '{self.name}' ready in {self.build_seconds}s")
+            return value
+
+    def reset(self):
+        """
+        Drops the built value so the next get() rebuilds it.
+        """
+        with self._lock:
+            self._value = None
+            self.state = "pending"
+            self.build_seconds = None
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "build_seconds": self.build_seconds, "error": self.error}
+
+
+def lazy_resource(name: str, factory: Callable[[], Any]) -> LazyResource:
+    """
+    Creates a LazyResource and registers it for warm-up and readiness checks.
+    """
+    resource = LazyResource(name, factory)
+    with _registry_lock:
+        _registry[name] = resource
+    return resource
+
+
+def _pending() -> List[LazyResource]:
+    with _registry_lock:
+        return [r for r in _registry.values() if r.state in ("pending", "building")]
+
+
+def _warm_up_all():
+    # Building one resource may import modules that register more, so keep
+    # sweeping the registry until nothing is left pending.
+    attempted = set()
+    while True:
+        todo = [r for r in _pending() if r.name not in attempted]
+        if not todo:
+            break
+        for resource in todo:
+            attempted.add(resource.name)
+            try:
+                resource.get()
+            except Exception:
+                pass
+    logger.info(f"warm-up finished {round(time.monotonic() - PROCESS_STARTED_AT, 3)}s after process start")
+
+
+def warm_up(background: bool = True) -> Optional[threading.Thread]:
+    """
+    Builds every registered resource, by default on a daemon thread so the
+    caller can start serving immediately. Does nothing in multiprocessing
+    workers (e.g. PDF parsers), which re-import the entry script.
+
+    Args:
+        background (bool): Run on a background thread instead of blocking.
+
+    Returns:
+        Optional[threading.Thread]: The warm-up thread when running in the background.
+    """
+    if multiprocessing.parent_process() is not None:
+        return None
+    if not background:
+        _warm_up_all()
+        return None
+    thread = threading.Thread(target=_warm_up_all, name="resource-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> Tuple[bool, Dict[str, Any]]:
+    """
+    Returns whether every registered resource is built, plus per-resource status.
+    """
+    with _registry_lock:
+        resources = {name: r.status() for name, r in _registry.items()}
+    ready = bool(resources) and all(r["state"] == "ready" for r in resources.values())
+    return ready, {
+        "ready": ready,
+        "uptime_seconds": round(time.monotonic() - PROCESS_STARTED_AT, 3),
+        "resources": resources,
+    }
@@ -0,0 +1,198 @@
+# src/semantic_cache.py
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.tracing import metrics
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+CACHE_LOOKUPS = metrics.counter("agent_faq_cache_lookups_total", "FAQ answer cache lookups, by outcome.", ("outcome",))
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by question meaning rather than exact text.
+
+    Questions are embedded and compared by cosine similarity against the
+    cached questions (one matrix-vector product over a preallocated float32
+    table). A match at or above `threshold` returns the stored answer without
+    touching retrieval or the LLM. Entries are evicted least-recently-used
+    beyond `max_entries` and expire after `ttl_seconds`.
+
+    The cache is tied to a fingerprint of the FAQ index it answers from; a
+    persisted cache whose fingerprint differs is discarded on load. The FAQ
+    index is only built at startup, so that load-time check is what keeps
+    answers in line with the index; invalidate() is there for code that
+    swaps the index in a running process.
+
+    Hits and misses are counted in agent_faq_cache_lookups_total and the
+    number of cached answers is exposed as agent_faq_cache_entries on
+    /metrics; stats() reports the same for /ready.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        fingerprint: str = "",
+        threshold: float = 0.92,
+        max_entries: int = 2000,
+        ttl_seconds: float = 86400,
+        path: Optional[str] = None,
+    ):
+        """
+        Args:
+            embed_fn (Callable[[str], List[float]]): Embeds a question.
+            fingerprint (str): Identifies the FAQ index the answers came from.
+            threshold (float): Minimum cosine similarity for a hit.
+            max_entries (int): Maximum number of cached answers.
+            ttl_seconds (float): Age after which an answer is no longer served.
+            path (str): Optional file prefix for persisting the cache across restarts.
+        """
+        self.embed_fn = embed_fn
+        self.fingerprint = fingerprint
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._matrix: Optional[np.ndarray] = None
+        # row index -> {"question", "answer", "created"}, in LRU order
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._free_rows: List[int] = []
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+            atexit.register(self.save)
+        metrics.gauge("agent_faq_cache_entries", "Answers held in the FAQ answer cache.", lambda: {(): len(self._entries)})
+
+    def embed(self, question: str) -> np.ndarray:
+        """
+        Returns the unit-normalized embedding of a question.
+        """
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector: np.ndarray) -> Optional[str]:
+        """
+        Returns the cached answer of the most similar question, or None on a miss.
+        """
+        with self._lock:
+            answer = self._lookup(vector)
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_LOOKUPS.inc(outcome="miss" if answer is None else "hit")
+        return answer
+
+    def _lookup(self, vector: np.ndarray) -> Optional[str]:
+        if not self._entries:
+            return None
+        rows = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+        scores = self._matrix[rows] @ vector
+        best = int(np.argmax(scores))
+        row = int(rows[best])
+        entry = self._entries[row]
+        if scores[best] < self.threshold:
+            return None
+        if time.time() - entry["created"] > self.ttl_seconds:
+            self._evict(row)
+            return None
+        self._entries.move_to_end(row)
+        logger.debug(f"semantic cache hit ({scores[best]:.3f}): {entry['question']!r}")
+        return entry["answer"]
+
+    def store(self, question: str, vector: np.ndarray, answer: str, created: Optional[float] = None):
+        """
+        Caches an answer under the question's embedding.
+        """
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._free_rows = list(range(self.max_entries - 1, -1, -1))
+            if not self._free_rows:
+                self._evict(next(iter(self._entries)))
+            row = self._free_rows.pop()
+            self._matrix[row] = vector
+            self._entries[row] = {"question": question, "answer": answer, "created": created or time.time()}
+            self._unsaved += 1
+            should_save = self.path and self._unsaved >= 50
+        if should_save:
+            self.save()
+
+    def _evict(self, row: int):
+        del self._entries[row]
+        self._free_rows.append(row)
+
+    def invalidate(self, fingerprint: str = ""):
+        """
+        Drops every cached answer, e.g. because the FAQ index changed.
+        """
+        with self._lock:
+            self.fingerprint = fingerprint
+            self._entries.clear()
+            self._matrix = None
+            self._free_rows = []
+            self._unsaved = 0
+        logger.info("semantic cache invalidated")
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def save(self):
+        """
+        Writes the cache to `path`.json / `path`.npy.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            rows = list(self._entries.keys())
+            entries = [self._entries[row] for row in rows]
+            vectors = self._matrix[rows] if rows else np.zeros((0, 0), dtype=np.float32)
+            self._unsaved = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        np.save(self.path + ".tmp.npy", vectors)
+        with open(self.path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": entries}, f)
+        os.replace(self.path + ".tmp.npy", self.path + ".npy")
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+
+    def _load(self):
+        if not (os.path.exists(self.path + ".json") and os.path.exists(self.path + ".npy")):
+            return
+        try:
+            with open(self.path + ".json", "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            vectors = np.load(self.path + ".npy")
+        except (OSError, ValueError) as e:
+            logger.warning(f"semantic cache at {self.path} unreadable, starting empty: {e}")
+            return
+        if saved.get("fingerprint") != self.fingerprint:
+            logger.info("semantic cache on disk belongs to another FAQ index, starting empty")
+            return
+        now = time.time()
+        path, self.path = self.path, None  # no write-back while loading
+        for entry, vector in zip(saved["entries"], vectors):
+            if now - entry["created"] <= self.ttl_seconds:
+                self.store(entry["question"], vector, entry["answer"], created=entry["created"])
+        self.path = path
+        self._unsaved = 0
+        logger.info(f"semantic cache loaded {len(self._entries)} answers")
@@ -0,0 +1,252 @@
+# src/session_pool.py
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from llama_index.core.llms import MessageRole
+
+from src.conversation_store import SessionStore, SessionWrite, WriteBehind, encode_message, encode_state
+from src.tracing import span
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+DEFAULT_SESSION_ID = "default"
+
+# Per-conversation state (user name, booked meetings, ...) used by the tools.
+# Bound for the duration of a chat turn; the fallback is used when tools are
+# called directly, outside of any agent session.
+_fallback_state: Dict[str, Any] = {"start_time": datetime.utcnow()}
+_current_state: ContextVar[Dict[str, Any]] = ContextVar("session_state", default=_fallback_state)
+
+
+def get_session_state() -> Dict[str, Any]:
+    """
+    Returns the state dict of the session handling the current chat turn.
+    """
+    return _current_state.get()
+
+
+@contextmanager
+def bind_session_state(state: Dict[str, Any]):
+    """
+    Makes `state` the current session state for the enclosed block.
+    """
+    token = _current_state.set(state)
+    try:
+        yield state
+    finally:
+        _current_state.reset(token)
+
+
+class Session:
+    """
+    One user's conversation: its own agent (and therefore chat memory) plus
+    the tool-side state dict.
+    """
+
+    def __init__(self, session_id: str, agent: Any):
+        self.session_id = session_id
+        self.agent = agent
+        self.state: Dict[str, Any] = {"session_id": session_id, "start_time": datetime.utcnow()}
+        self.last_used = time.monotonic()
+        # Serialize turns within a session; different sessions run concurrently.
+        self.lock = threading.RLock()
+        self.async_lock = asyncio.Lock()
+        # Session store bookkeeping: the stored version this copy matches
+        # (None: unknown, check before the next turn), how many memory
+        # messages are already stored, and writes not yet applied.
+        self.version: Optional[int] = None
+        self.persisted = 0
+        self.saved_state: Optional[bytes] = None
+        self.pending = 0
+        self.base_version: Optional[int] = None
+
+
+class SessionPool:
+    """
+    Bounded LRU of sessions with idle-TTL eviction.
+
+    Sessions are created on first use through `agent_factory`. When the pool
+    is full the least recently used session is dropped, and sessions idle
+    for longer than `idle_ttl_seconds` are dropped on the next access.
+
+    With a session store, the pool is only a cache: hydrate() before a turn
+    reloads a session whose stored version moved on (another replica served
+    it, or it was evicted here), and persist() after the turn queues its new
+    messages and state for the store, so any replica can serve any turn.
+    """
+
+    def __init__(self, agent_factory: Callable[[], Any], max_sessions: int = 500, idle_ttl_seconds: float = 1800,
+                 store: Optional[SessionStore] = None, history_messages: int = 40, write_behind: bool = True,
+                 flush_interval: float = 0.02):
+        """
+        Args:
+            agent_factory (Callable[[], Any]): Builds a fresh agent for a new session.
+            max_sessions (int): Maximum number of sessions kept in memory.
+            idle_ttl_seconds (float): Sessions unused for this long are evicted.
+            store (SessionStore): Durable store shared with other replicas, or None.
+            history_messages (int): Most recent messages loaded when a session is hydrated.
+            write_behind (bool): Batch writes on a background thread instead of writing at the end of each turn.
+            flush_interval (float): Seconds between write-behind flushes.
+        """
+        self.agent_factory = agent_factory
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.store = store
+        self.history_messages = history_messages
+        self.writer = WriteBehind(store, flush_interval) if store is not None and write_behind else None
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_expired(self, now: float):
+        # The dict is in LRU order, so expired sessions are all at the front.
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.idle_ttl_seconds:
+                break
+            del self._sessions[session_id]
+            logger.info(f"session '{session_id}' evicted after idling")
+
+    def get(self, session_id: str) -> Session:
+        """
+        Returns the session for `session_id`, creating it if needed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.last_used = now
+                return session
+        # Build outside the pool lock; agent construction is not free.
+        created = Session(session_id, self.agent_factory())
+        with self._lock:
+            session = self._sessions.setdefault(session_id, created)
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                logger.info(f"session '{evicted_id}' evicted (pool full)")
+        return session
+
+    def peek(self, session_id: str) -> Optional[Session]:
+        """
+        Returns the session if it exists, without creating or touching it.
+        """
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def reset(self, session_id: str):
+        """
+        Forgets a session entirely; its next turn starts a fresh conversation.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.store is not None:
+            if self.writer is not None:
+                self.writer.flush()
+            self.store.delete(session_id)
+
+    def hydrate(self, session: Session):
+        """
+        Brings the session up to date with the store before a turn.
+
+        Costs one version lookup when nothing changed. Otherwise the state
+        and only the most recent `history_messages` messages are loaded. A
+        session with writes still queued is already the newest copy. Store
+        errors are logged and the local copy is used.
+        """
+        if self.store is None or session.pending:
+            return
+        try:
+            if session.version is not None and self.store.version(session.session_id) == session.version:
+                return
+            with span("session.hydrate"):
+                stored = self.store.load(session.session_id, self.history_messages)
+        except Exception as e:
+            logger.warning(f"session '{session.session_id}' not loaded from the store: {e}")
+            return
+        session.version = stored.version
+        if stored.version == 0:
+            return
+        messages = stored.messages
+        # The history must not start in the middle of a tool exchange.
+        while messages and messages[0].role in (MessageRole.ASSISTANT, MessageRole.TOOL):
+            messages = messages[1:]
+        session.agent.memory.set(messages)
+        session.persisted = len(messages)
+        # Updated in place: the dict is already bound as the turn's session state.
+        session.state.clear()
+        session.state.update(stored.state or {})
+        session.state["session_id"] = session.session_id
+        session.saved_state = encode_state(session.state)
+
+    def persist(self, session: Session):
+        """
+        Queues what the last turn added (new messages and the state) for the store.
+        """
+        if self.store is None:
+            return
+        messages = session.agent.memory.get_all()
+        new_messages = messages[session.persisted:]
+        state = encode_state(session.state)
+        if not new_messages and state == session.saved_state:
+            return
+        write = SessionWrite(session.session_id, state, [encode_message(message) for message in new_messages])
+        persisted = session.persisted
+        session.persisted = len(messages)
+        session.saved_state = state
+        with self._lock:
+            if not session.pending:
+                session.base_version = session.version
+            session.pending += 1
+
+        def saved(before: int, after: int):
+            with self._lock:
+                # A different starting version means another replica wrote in
+                # between; the local copy is then reloaded before the next turn.
+                if session.base_version is not None and session.base_version in (before, after):
+                    session.base_version = after
+                else:
+                    session.base_version = None
+                session.pending -= 1
+                if not session.pending:
+                    session.version = session.base_version
+
+        def failed():
+            with self._lock:
+                # Sent again with the next turn's changes.
+                session.persisted, session.saved_state = min(session.persisted, persisted), None
+                session.pending -= 1
+                if not session.pending:
+                    # The store still holds the version from before this write.
+                    session.version = session.base_version
+
+        if self.writer is not None:
+            self.writer.submit(write, saved, failed)
+            return
+        try:
+            before, after = self.store.save_many([write])[session.session_id]
+        except Exception as e:
+            logger.warning(f"session '{session.session_id}' not saved to the store: {e}")
+            failed()
+            return
+        saved(before, after)
+
+    def flush(self):
+        """
+        Writes queued session changes now (e.g. before shutting down).
+        """
+        if self.writer is not None:
+            self.writer.flush()
@@ -0,0 +1,199 @@
+# src/slot_engine.py
+
+import os
+from datetime import date as date_cls
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pytz
+
+Interval = Tuple[datetime, datetime]
+
+
+def merge_intervals(intervals: Iterable[Interval], buffer: timedelta = timedelta(0)) -> List[Interval]:
+    """
+    Sorts intervals, pads each by `buffer` on both sides and merges any that
+    overlap or touch.
+
+    Args:
+        intervals (Iterable[Interval]): Busy (start, end) pairs, in any order.
+        buffer (timedelta): Padding kept free around every busy interval.
+
+    Returns:
+        List[Interval]: Disjoint intervals in ascending order.
+    """
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        start, end = start - buffer, end + buffer
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class SlotEngine:
+    """
+    Computes free windows and bookable slots from busy intervals.
+
+    Busy intervals are merged once, then a single sweep walks the working
+    window of each day alongside the merged list, so the cost is linear in
+    days + busy intervals + slots returned rather than slots x events.
+
+    Slots start on a grid of `step_minutes` beginning at the start of the
+    working day (or at `not_before`, if later) and must fit entirely inside
+    a free window.
+    """
+
+    def __init__(
+        self,
+        work_start: str = "08:00",
+        work_end: str = "18:00",
+        step_minutes: int = 30,
+        buffer_minutes: int = 0,
+        timezone: str = "UTC",
+        workdays: Optional[Iterable[int]] = None,
+    ):
+        """
+        Args:
+            work_start (str): Start of the working day, HH:MM.
+            work_end (str): End of the working day, HH:MM.
+            step_minutes (int): Distance between consecutive slot starts.
+            buffer_minutes (int): Free time kept before and after every busy interval.
+            timezone (str): Timezone the working hours are expressed in.
+            workdays (Iterable[int]): Weekdays (Monday=0) that have working hours; defaults to every day.
+        """
+        self.work_start = datetime.strptime(work_start, "%H:%M").time()
+        self.work_end = datetime.strptime(work_end, "%H:%M").time()
+        self.step = timedelta(minutes=step_minutes)
+        self.buffer = timedelta(minutes=buffer_minutes)
+        self.tz = pytz.timezone(timezone)
+        self.workdays = set(workdays) if workdays is not None else set(range(7))
+
+    @classmethod
+    def from_env(cls) -> "SlotEngine":
+        """
+        Builds an engine from WORK_DAY_START, WORK_DAY_END, SLOT_STEP_MINUTES,
+        SLOT_BUFFER_MINUTES and WORK_TIMEZONE.
+        """
+        return cls(
+            work_start=os.environ.get("WORK_DAY_START", "08:00"),
+            work_end=os.environ.get("WORK_DAY_END", "18:00"),
+            step_minutes=int(os.environ.get("SLOT_STEP_MINUTES", 30)),
+            buffer_minutes=int(os.environ.get("SLOT_BUFFER_MINUTES", 0)),
+            timezone=os.environ.get("WORK_TIMEZONE", "UTC"),
+        )
+
+    def _localize(self, day: date_cls, at: time) -> datetime:
+        return self.tz.localize(datetime.combine(day, at)).astimezone(pytz.UTC)
+
+    def working_windows(self, start_date: date_cls, end_date: date_cls) -> List[Tuple[date_cls, datetime, datetime]]:
+        """
+        Returns (day, start, end) working windows in UTC for each working day in the inclusive range.
+        """
+        windows = []
+        day = start_date
+        while day <= end_date:
+            if day.weekday() in self.workdays:
+                windows.append((day, self._localize(day, self.work_start), self._localize(day, self.work_end)))
+            day += timedelta(days=1)
+        return windows
+
+    def free_windows(
+        self,
+        busy: Iterable[Interval],
+        start_date: date_cls,
+        end_date: date_cls,
+        not_before: Optional[datetime] = None,
+    ) -> Dict[date_cls, List[Interval]]:
+        """
+        Returns the free gaps inside working hours for each day of the range.
+
+        Args:
+            busy (Iterable[Interval]): Busy intervals covering (at least) the range.
+            start_date (date): First day, inclusive.
+            end_date (date): Last day, inclusive.
+            not_before (datetime): Ignore time before this instant (e.g. now).
+
+        Returns:
+            Dict[date, List[Interval]]: Free (start, end) windows per day, in order.
+        """
+        merged = merge_intervals(busy, self.buffer)
+        result: Dict[date_cls, List[Interval]] = {}
+        i = 0
+        for day, window_start, window_end in self.working_windows(start_date, end_date):
+            if not_before is not None:
+                window_start = max(window_start, not_before)
+            gaps: List[Interval] = []
+            # Skip busy intervals that ended before this window; they cannot
+            # matter for any later day either.
+            while i < len(merged) and merged[i][1] <= window_start:
+                i += 1
+            cursor = window_start
+            j = i
+            while cursor < window_end:
+                if j < len(merged) and merged[j][0] < window_end:
+                    busy_start, busy_end = merged[j]
+                    if busy_start > cursor:
+                        gaps.append((cursor, busy_start))
+                    cursor = max(cursor, busy_end)
+                    j += 1
+                else:
+                    gaps.append((cursor, window_end))
+                    break
+            result[day] = gaps
+        return result
+
+    def fits(self, busy: Iterable[Interval], start: datetime, end: datetime) -> bool:
+        """
+        Returns True if [start, end) lies inside one free window: within
+        working hours and clear of every busy interval and its buffer.
+
+        Args:
+            busy (Iterable[Interval]): Busy intervals covering (at least) the working day of `start`.
+            start (datetime): Timezone-aware start of the meeting.
+            end (datetime): Timezone-aware end of the meeting.
+        """
+        day = start.astimezone(self.tz).date()
+        gaps = self.free_windows(busy, day, day).get(day, [])
+        return any(gap_start <= start and end <= gap_end for gap_start, gap_end in gaps)
+
+    def slots(
+        self,
+        busy: Iterable[Interval],
+        start_date: date_cls,
+        end_date: date_cls,
+        duration_minutes: int = 60,
+        not_before: Optional[datetime] = None,
+    ) -> Dict[date_cls, List[Interval]]:
+        """
+        Returns bookable (start, end) slots of `duration_minutes` for each day of the range.
+
+        Args:
+            busy (Iterable[Interval]): Busy intervals covering (at least) the range.
+            start_date (date): First day, inclusive.
+            end_date (date): Last day, inclusive.
+            duration_minutes (int): Length of the meeting.
+            not_before (datetime): No slot starts before this instant.
+
+        Returns:
+            Dict[date, List[Interval]]: Slots per day, in order.
+        """
+        duration = timedelta(minutes=duration_minutes)
+        result: Dict[date_cls, List[Interval]] = {}
+        for day, gaps in self.free_windows(busy, start_date, end_date, not_before).items():
+            day_slots: List[Interval] = []
+            if gaps:
+                origin = self._localize(day, self.work_start)
+                if not_before is not None:
+                    origin = max(origin, not_before)
+                for gap_start, gap_end in gaps:
+                    # First grid point at or after the start of the gap.
+                    steps = -((origin - gap_start) // self.step)
+                    slot_start = origin + max(steps, 0) * self.step
+                    while slot_start + duration <= gap_end:
+                        day_slots.append((slot_start, slot_start + duration))
+                        slot_start += self.step
+            result[day] = day_slots
+        return result
@@ -0,0 +1,67 @@
+# src/streaming.py
+
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+# Receives the events of the chat turn being streamed: LLM tokens and tool
+# progress. Unset (None) for ordinary, non-streaming turns, in which case
+# emitting is a no-op.
+_event_sink: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar("event_sink", default=None)
+
+
+@contextmanager
+def bind_event_sink(sink: Callable[[Dict[str, Any]], None]):
+    """
+    Routes events emitted during the enclosed block to `sink`.
+    """
+    token = _event_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _event_sink.reset(token)
+
+
+def is_streaming() -> bool:
+    """
+    Returns True when the current chat turn is being streamed.
+    """
+    return _event_sink.get() is not None
+
+
+def emit(event: Dict[str, Any]):
+    """
+    Sends an event to the current sink, if any.
+    """
+    sink = _event_sink.get()
+    if sink is not None:
+        sink(event)
+
+
+def emit_token(text: str):
+    if text:
+        emit({"type": "token", "text": text})
+
+
+def emit_interim(text: str):
+    """
+    Sends text the agent wrote alongside a tool call; it is not part of the answer.
+    """
+    if text:
+        emit({"type": "interim", "text": text})
+
+
+def emit_tool(name: str, status: str, message: str = ""):
+    """
+    Sends a tool progress event; status is "started" or "finished".
+    """
+    emit({"type": "tool", "name": name, "status": status, "message": message})
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """
+    Serializes an event as a Server-Sent Events frame.
+    """
+    payload = {k: v for k, v in event.items() if k != "type"}
+    return f"event: {event['type']}\ndata: {json.dumps(payload)}\n\n"
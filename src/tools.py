@@ -1,16 +1,64 @@
 import math
 import json
+import os
 import pytz
 from datetime import datetime, timedelta
 from calendar_service import get_calendar_service
+from src.booking import BookingQueue, idempotency_key
+from src.calendar_prefetch import CalendarPrefetcher, claim_prefetched
+from src.freebusy_cache import FreeBusyCache
+from src.session_pool import DEFAULT_SESSION_ID, get_session_state
+from src.slot_engine import SlotEngine
+from src.tracing import metrics
+from src.utils.app_logger import GenericLogger
 from typing import List, Dict, Any, Optional
 
+logger = GenericLogger().get_logger()
+
+CALENDAR_ID = "primary"
+# Calendars (e.g. one per sales rep) checked by get_multi_day_availability.
+AVAILABILITY_CALENDAR_IDS = [c.strip() for c in os.environ.get("AVAILABILITY_CALENDAR_IDS", CALENDAR_ID).split(",") if c.strip()]
+MAX_AVAILABILITY_DAYS = int(os.environ.get("MAX_AVAILABILITY_DAYS", 31))
+
+# Busy intervals per calendar day, shared by all availability tools so one
+# scheduling conversation costs a single events().list call per day.
+# Days prefetched for the current agent turn are taken over as they arrive.
+freebusy_cache = FreeBusyCache(
+    get_calendar_service,
+    ttl_seconds=float(os.environ.get("FREEBUSY_CACHE_TTL_SECONDS", 60)),
+    prefetched=claim_prefetched,
+)
+
+# Reservations and background calendar inserts for schedule_google_meet.
+booking_queue = BookingQueue(get_calendar_service, freebusy_cache)
+metrics.gauge(
+    "agent_bookings_pending",
+    "Reserved meetings not yet confirmed on the calendar.",
+    lambda: {(): booking_queue.pending()},
+)
+# How long a booking request waits for the calendar event before replying
+# with just the reservation (0: reply as soon as the slot is held). A
+# booking still pending then is reported on the session's next turn (see
+# settle_bookings()).
+BOOKING_CONFIRM_WAIT_SECONDS = float(os.environ.get("BOOKING_CONFIRM_WAIT_SECONDS", 10))
+
+# Working hours, slot step and buffers come from WORK_DAY_START/WORK_DAY_END,
+# SLOT_STEP_MINUTES, SLOT_BUFFER_MINUTES and WORK_TIMEZONE.
+slot_engine = SlotEngine.from_env()
+
+# Fetches the days a message mentions while the LLM plans the turn (started
+# by AgentController when CALENDAR_PREFETCH is on).
+calendar_prefetcher = CalendarPrefetcher(
+    freebusy_cache,
+    CALENDAR_ID,
+    slot_engine,
+    max_days=int(os.environ.get("CALENDAR_PREFETCH_MAX_DAYS", 3)),
+)
 
-session = dict()
-session['start_time'] = datetime.utcnow()
 
 def greet_user_and_ask_name() -> str:
     """Greet the user, ask their name if not set, and explain what the assistant can do."""
+    session = get_session_state()
     if session.get("name"):
         return (
             f"👋 Hi {session['name']}! I can help you with:\n"
@@ -30,92 +78,45 @@ def greet_user_and_ask_name() -> str:
 
 def get_calendar_availability(date: str, duration_minutes: int = 60, start_after_datetime: Optional[datetime] = None) -> List[Dict[str, str]]:
     try:
-        utc_tz = pytz.UTC
-        start_of_day_naive = datetime.strptime(f"{date} 08:00", "%Y-%m-%d %H:%M")
-        end_of_day_naive = datetime.strptime(f"{date} 18:00", "%Y-%m-%d %H:%M")
-        start_of_day = utc_tz.localize(start_of_day_naive)
-        end_of_day = utc_tz.localize(end_of_day_naive)
-        
-        # Handle start_after_datetime (assume UTC if provided)
-        if start_after_datetime:
-            current_time = max(start_of_day, start_after_datetime)
-        else:
-            current_time = start_of_day
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+        windows = slot_engine.working_windows(day, day)
+        if not windows:
+            return []
+        _, start_of_day, end_of_day = windows[0]
         
-        print(f"DEBUG: Fetching availability for {date} from {current_time} to {end_of_day} (UTC)")  # Debug
+        logger.debug("fetching availability for %s from %s to %s (UTC)", date, start_of_day, end_of_day)
         
-        service = get_calendar_service()
+        # Busy intervals for the day (cached), swept once against the working hours
+        busy_intervals = freebusy_cache.busy_between(CALENDAR_ID, start_of_day, end_of_day)
+        logger.debug("found %d busy intervals on %s", len(busy_intervals), date)
         
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=start_of_day.isoformat(),
-            timeMax=end_of_day.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        events = events_result.get('items', [])
-        
-        # Debug: Print all events for the day
-        print(f"DEBUG: Found {len(events)} events on {date}:")
-        for event in events:
-            start_str = event['start'].get('dateTime', event['start'].get('date') + 'T00:00:00')
-            end_str = event['end'].get('dateTime', event['end'].get('date') + 'T00:00:00')
-            summary = event.get('summary', 'No Title')
-            print(f"  - {start_str} to {end_str}: {summary}")
-        
-        # Build busy intervals (timezone-aware)
-        busy_intervals = []
-        for event in events:
-            event_start_str = event['start'].get('dateTime', event['start'].get('date') + 'T00:00:00')
-            event_end_str = event['end'].get('dateTime', event['end'].get('date') + 'T00:00:00')
-            
-            # Parse event times as UTC
-            if 'Z' in event_start_str:
-                event_start = datetime.fromisoformat(event_start_str.replace('Z', '+00:00'))
-            else:
-                event_start_naive = datetime.fromisoformat(event_start_str)
-                event_start = utc_tz.localize(event_start_naive)
-            
-            if 'Z' in event_end_str:
-                event_end = datetime.fromisoformat(event_end_str.replace('Z', '+00:00'))
-            else:
-                event_end_naive = datetime.fromisoformat(event_end_str)
-                event_end = utc_tz.localize(event_end_naive)
-            
-            busy_intervals.append((event_start, event_end))
-        
-        available_slots = []
-        slot_duration = timedelta(minutes=duration_minutes)
-        slot_step = timedelta(minutes=30)
-        
-        while current_time + slot_duration <= end_of_day:
-            slot_end = current_time + slot_duration
-            
-            # Check overlap
-            is_available = True
-            for busy_start, busy_end in busy_intervals:
-                if not (slot_end <= busy_start or current_time >= busy_end):
-                    is_available = False
-                    break
-            
-            if is_available:
-                available_slots.append({
-                    "start": current_time.strftime("%H:%M"),
-                    "end": slot_end.strftime("%H:%M")
-                })
-            
-            current_time += slot_step
+        # Handle start_after_datetime (assume UTC if provided)
+        slots = slot_engine.slots(busy_intervals, day, day, duration_minutes, not_before=start_after_datetime)[day]
+        available_slots = [
+            {"start": slot_start.strftime("%H:%M"), "end": slot_end.strftime("%H:%M")}
+            for slot_start, slot_end in slots
+        ]
         
-        print(f"DEBUG: Generated {len(available_slots)} available slots.")  # Debug
+        logger.debug("generated %d available slots", len(available_slots))
         return available_slots
         
     except Exception as e:
-        print(f"Error getting availability: {e}")
+        logger.exception(f"error getting availability: {e}")
         return []
 
 
 
+def _slot_fits(start: datetime, end: datetime) -> bool:
+    # Same working hours and buffers as the slots get_calendar_availability offers.
+    day = start.astimezone(slot_engine.tz).date()
+    windows = slot_engine.working_windows(day, day)
+    if not windows:
+        return False
+    _, start_of_day, end_of_day = windows[0]
+    busy = freebusy_cache.busy_between(CALENDAR_ID, min(start_of_day, start), max(end_of_day, end))
+    return slot_engine.fits(busy, start, end)
+
+
 def is_time_slot_available(date: str, time: str, duration_minutes: int = 60) -> bool:
     """
     Check if a specific time slot is available.
@@ -135,37 +136,13 @@ def is_time_slot_available(date: str, time: str, duration_minutes: int = 60) ->
         requested_start = utc_tz.localize(requested_start_naive)
         requested_end = requested_start + timedelta(minutes=duration_minutes)
         
-        print(f"DEBUG: Checking availability for {requested_start} to {requested_end} (UTC)")  # Debug log
-        
-        service = get_calendar_service()
-        
-        # Query events with timezone-aware ISO strings
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=requested_start.isoformat(),  # Already includes timezone
-            timeMax=requested_end.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        logger.debug("checking availability for %s to %s (UTC)", requested_start, requested_end)
         
-        events = events_result.get('items', [])
-        
-        # Debug: Print any events found
-        if events:
-            print(f"DEBUG: Found {len(events)} overlapping events:")
-            for event in events:
-                start_str = event['start'].get('dateTime', event['start'].get('date'))
-                end_str = event['end'].get('dateTime', event['end'].get('date'))
-                summary = event.get('summary', 'No Title')
-                print(f"  - {start_str} to {end_str}: {summary}")
-        else:
-            print("DEBUG: No overlapping events found - slot is available.")
-        
-        # If there are any events in this time range, the slot is not available
-        return len(events) == 0
+        # Answered from the cached busy intervals of that day, within working hours and buffers
+        return _slot_fits(requested_start, requested_end)
         
     except Exception as e:
-        print(f"Error checking time slot availability: {e}")
+        logger.exception(f"error checking time slot availability: {e}")
         return False
 
 
@@ -183,59 +160,138 @@ def get_formatted_availability(date: str, duration_minutes: int = 60) -> str:
     return f"Available time slots for {date}:\n{slots_info}"
 
 
+def get_multi_day_availability(start_date: str, end_date: str, duration_minutes: int = 60) -> str:
+    """
+    Get available time slots for every day in a date range, for all configured calendars, in one lookup.
+
+    Args:
+        start_date (str): First day, YYYY-MM-DD
+        end_date (str): Last day (inclusive), YYYY-MM-DD
+        duration_minutes (int): Duration of the meeting in minutes
+
+    Returns:
+        str: Available slots per day (and per calendar when several are configured)
+    """
+    try:
+        first_day = datetime.strptime(start_date, "%Y-%m-%d").date()
+        last_day = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if last_day < first_day:
+            first_day, last_day = last_day, first_day
+        if (last_day - first_day).days >= MAX_AVAILABILITY_DAYS:
+            last_day = first_day + timedelta(days=MAX_AVAILABILITY_DAYS - 1)
+        windows = slot_engine.working_windows(first_day, last_day)
+        if not windows:
+            return f"No working days between {first_day} and {last_day}."
+
+        # One freebusy request covers every calendar and every day
+        busy_by_calendar = freebusy_cache.busy_for_range(AVAILABILITY_CALENDAR_IDS, windows[0][1], windows[-1][2])
+
+        # Free windows rather than every 30-minute slot keep the answer short
+        duration = timedelta(minutes=duration_minutes)
+        lines = [f"Free windows that fit a {duration_minutes} minute meeting, {first_day} to {last_day}:"]
+        for calendar_id, busy in busy_by_calendar.items():
+            if len(busy_by_calendar) > 1:
+                lines.append(f"{calendar_id}:")
+            for day, gaps in slot_engine.free_windows(busy, first_day, last_day).items():
+                times = ", ".join(
+                    f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}" for start, end in gaps if end - start >= duration
+                )
+                lines.append(f"{day.strftime('%a %Y-%m-%d')}: {times or 'fully booked'}")
+        return "\n".join(lines)
+
+    except Exception as e:
+        logger.exception(f"error getting multi-day availability: {e}")
+        return "Sorry, I couldn't check availability for that period right now."
+
+
+def _booking_reply(booking) -> str:
+    when = f"📅 {booking.start} UTC"
+    if booking.status == "confirmed":
+        return f"✅ Meeting '{booking.subject}' scheduled!\n{when}\n🔗 Meet link: {booking.meet_link or 'No Meet link'}"
+    if booking.status == "reserved":
+        return (
+            f"✅ The slot is reserved for '{booking.subject}'!\n{when}\n"
+            "⏳ The calendar invite and Meet link are being created; ask again with the same details for the link."
+        )
+    if booking.status == "conflict":
+        return f"❌ The time slot {booking.start.strftime('%H:%M')} on {booking.start.date()} was just taken. Please choose another time."
+    return "❌ Sorry, I couldn’t schedule the meeting right now. Please try again or contact support."
+
+
 def schedule_google_meet(date: str, time: str, subject: str, duration_minutes: int = 60) -> str:
+    """
+    Reserve a slot and book a Google Meet meeting on it.
+
+    The slot is held at once and the event is created by the booking queue
+    (see src/booking.py); the reply waits at most BOOKING_CONFIRM_WAIT_SECONDS
+    for it. Asking again for the same meeting returns the existing booking
+    instead of creating a second one.
+
+    Args:
+        date (str): YYYY-MM-DD
+        time (str): HH:MM (24-hour format)
+        subject (str): Meeting title
+        duration_minutes (int): Duration of the meeting in minutes
+
+    Returns:
+        str: Confirmation, reservation notice or alternatives
+    """
     if not date or not time or not subject:
         return "⚠️ Please provide the date (YYYY-MM-DD), time (HH:MM), and subject to schedule a meeting."
 
-    # Check availability (now timezone-aware)
-    if not is_time_slot_available(date, time, duration_minutes):
-        # Get alternatives
-        alternatives = get_calendar_availability(date, duration_minutes)
-        alt_slots = [f"{slot['start']}-{slot['end']}" for slot in alternatives[:3]]  # Limit to 3
-        return f"❌ The time slot {time} on {date} is not available. Here are some alternatives: {alt_slots}. Please choose one."
-
     try:
-        utc_tz = pytz.UTC
-        dt_start_naive = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-        dt_start = utc_tz.localize(dt_start_naive)
+        dt_start = pytz.UTC.localize(datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M"))
         dt_end = dt_start + timedelta(minutes=duration_minutes)
+        session = get_session_state()
+        key = idempotency_key(CALENDAR_ID, dt_start, duration_minutes, subject, str(session.get("session_id", DEFAULT_SESSION_ID)))
+
+        booking = booking_queue.get(key)
+        if booking is None or booking.status not in ("reserved", "confirmed"):
+            booking = booking_queue.reserve(key, CALENDAR_ID, dt_start, dt_end, subject) if _slot_fits(dt_start, dt_end) else None
+            if booking is None:
+                # Get alternatives
+                alternatives = get_calendar_availability(date, duration_minutes)
+                alt_slots = [f"{slot['start']}-{slot['end']}" for slot in alternatives[:3]]  # Limit to 3
+                return f"❌ The time slot {time} on {date} is not available. Here are some alternatives: {alt_slots}. Please choose one."
 
-        event = {
-            "summary": subject,
-            "start": {"dateTime": dt_start.isoformat(), "timeZone": "UTC"},
-            "end": {"dateTime": dt_end.isoformat(), "timeZone": "UTC"},
-            "conferenceData": {
-                "createRequest": {
-                    "requestId": f"meet-{int(datetime.now().timestamp())}",
-                    "conferenceSolutionKey": {"type": "hangoutsMeet"},
-                }
-            }
-        }
-
-        event = service.events().insert(
-            calendarId="primary",
-            body=event,
-            conferenceDataVersion=1
-        ).execute()
-
-        entry_points = event.get("conferenceData", {}).get("entryPoints", [])
-        meet_link = entry_points[0]["uri"] if entry_points else "No Meet link"
-
-        if "meetings" not in session:
-            session["meetings"] = []
-        session["meetings"].append({
-            "subject": subject,
-            "datetime": dt_start.isoformat(),
-            "link": meet_link
-        })
-
-        return f"✅ Meeting '{subject}' scheduled!\n📅 {dt_start} UTC\n🔗 Meet link: {meet_link}"
+        if BOOKING_CONFIRM_WAIT_SECONDS > 0:
+            booking.wait(BOOKING_CONFIRM_WAIT_SECONDS)
+        # Recorded here, in the turn, so it is saved with the turn's state.
+        meetings = session.setdefault("meetings", [])
+        meeting = next((meeting for meeting in meetings if meeting.get("key") == key), None)
+        if meeting is None:
+            meeting = {"key": key, "subject": subject, "datetime": dt_start.isoformat()}
+            meetings.append(meeting)
+        meeting.update(status=booking.status, link=booking.meet_link)
+        return _booking_reply(booking)
 
     except Exception as e:
-        print(f"Error scheduling meeting: {e}")
+        logger.exception(f"error scheduling meeting: {e}")
         return "❌ Sorry, I couldn’t schedule the meeting right now. Please try again or contact support."
     
 
+def settle_bookings() -> List[str]:
+    """
+    Records the outcome of the current session's bookings that were still pending when their turn replied.
+
+    Called at the start of a turn, with the session locked and its state
+    bound, so the outcome is saved with that turn.
+
+    Returns:
+        List[str]: A notice for each booking that finished since.
+    """
+    notices = []
+    for meeting in get_session_state().get("meetings", []):
+        if meeting.get("status") != "reserved":
+            continue
+        booking = booking_queue.get(meeting["key"])
+        if booking is None or not booking.done.is_set():
+            continue
+        meeting.update(status=booking.status, link=booking.meet_link)
+        notices.append(f"Update on your booking '{meeting['subject']}': {_booking_reply(booking)}")
+    return notices
+
+
 def parse_time(time_str: str) -> str:
     """
     Convert user-friendly time strings (e.g., "9:00 AM") to 24-hour format (e.g., "09:00").
@@ -274,5 +330,5 @@ def parse_time(time_str: str) -> str:
         pass
     
     # If all fail, return original (assume it's already valid or handle in caller)
-    print(f"Warning: Could not parse time '{time_str}', using as-is.")
+    logger.warning(f"could not parse time '{time_str}', using as-is")
     return time_str
@@ -0,0 +1,442 @@
+# src/tracing.py
+
+import bisect
+import functools
+import inspect
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.utils.app_logger import GenericLogger
+
+logger = GenericLogger().get_logger()
+
+# Finished traces kept for GET /traces (0 disables keeping them).
+TRACE_BUFFER = int(os.environ.get("TRACE_BUFFER", 200))
+# Spans kept per trace; a runaway agent loop cannot grow a trace without bound.
+MAX_SPANS_PER_TRACE = int(os.environ.get("TRACE_MAX_SPANS", 256))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACEPARENT_RE = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$")
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+def _label_key(labelnames: Sequence[str], labels: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: Sequence[str], key: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with labels, as exposed by Prometheus.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text exposition format.
+
+    Gauges are callbacks evaluated at scrape time, so components such as the
+    chat runner expose their current state without pushing updates.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, collect: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]):
+        """
+        Registers a gauge whose values `collect()` returns as {((label, value), ...): number}.
+        """
+        with self._lock:
+            self._gauges[name] = (help, collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            gauges = list(self._gauges.items())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, (help, collect) in gauges:
+            try:
+                values = collect()
+            except Exception as e:
+                logger.warning(f"gauge '{name}' failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(values.items()):
+                label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+                lines.append(f"{name}{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+SPAN_SECONDS = metrics.histogram(
+    "agent_span_duration_seconds", "Duration of traced operations (agent steps, LLM, tool, calendar and retrieval calls).", ("span", "status")
+)
+REQUEST_SECONDS = metrics.histogram(
+    "agent_request_duration_seconds", "End-to-end duration of traced requests.", ("route", "status")
+)
+LLM_TOKENS = metrics.counter("agent_llm_tokens_total", "LLM tokens by model tier and kind.", ("tier", "kind"))
+
+
+class Span:
+    """
+    One timed operation inside a trace.
+    """
+
+    __slots__ = ("name", "trace", "span_id", "parent_id", "started_at", "_started", "duration", "attributes", "status")
+
+    def __init__(self, name: str, trace: Optional["Trace"], parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, error: Optional[BaseException] = None):
+        """
+        Ends the span, records its duration and attaches it to its trace.
+        """
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        SPAN_SECONDS.observe(self.duration, span=self.name, status=self.status)
+        if self.trace is not None:
+            self.trace.add(self)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "span %s %.1fms trace=%s %s",
+                self.name, self.duration * 1000, self.trace.trace_id if self.trace else "-", self.attributes,
+            )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_offset_ms": round((self.started_at - self.trace.started_at) * 1000, 2) if self.trace else 0.0,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """
+    The spans recorded while serving one request.
+    """
+
+    def __init__(self, route: str, trace_id: Optional[str] = None):
+        self.route = route
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self._lock = threading.Lock()
+        self._token = None
+
+    def add(self, span: Span):
+        with self._lock:
+            if len(self.spans) < MAX_SPANS_PER_TRACE:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+    def finish(self, status: Any = "ok"):
+        """
+        Ends the trace, records the request latency and keeps it for GET /traces.
+        """
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        self.status = str(status)
+        REQUEST_SECONDS.observe(self.duration, route=self.route, status=self.status)
+        if TRACE_BUFFER:
+            _recent.append(self)
+        if self._token is not None:
+            try:
+                _current_trace.reset(self._token)
+            except ValueError:
+                # Finished from another context (e.g. a streamed response).
+                pass
+            self._token = None
+
+    def breakdown(self) -> Dict[str, float]:
+        """
+        Returns the total milliseconds spent per span name.
+        """
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span in self.spans:
+                totals[span.name] = totals.get(span.name, 0.0) + (span.duration or 0.0) * 1000
+        return {name: round(ms, 2) for name, ms in sorted(totals.items(), key=lambda item: -item[1])}
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [span.as_dict() for span in self.spans]
+        return {
+            "trace_id": self.trace_id,
+            "route": self.route,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "breakdown_ms": self.breakdown(),
+            "spans": spans,
+            "dropped_spans": self.dropped_spans,
+        }
+
+
+_recent: Deque[Trace] = deque(maxlen=TRACE_BUFFER or 1)
+
+
+def trace_id_from_headers(headers) -> Optional[str]:
+    """
+    Returns the trace id of an incoming W3C traceparent or X-Request-Id header, if any.
+    """
+    match = TRACEPARENT_RE.match(headers.get("traceparent", "").strip().lower())
+    if match:
+        return match.group(1)
+    request_id = headers.get("X-Request-Id", "").strip()
+    return request_id[:64] or None
+
+
+def start_trace(route: str, trace_id: Optional[str] = None) -> Trace:
+    """
+    Starts a trace and makes it current in the calling context.
+
+    Spans opened in this context, and in tasks or threads that copy it
+    (asyncio tasks, asyncio.to_thread), are attached to it until finish().
+    """
+    trace = Trace(route, trace_id)
+    trace._token = _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def adopt_trace(trace: Optional[Trace]):
+    """
+    Makes a trace started elsewhere current in this context, e.g. in a task
+    that another thread submitted to an event loop.
+    """
+    _current_trace.set(trace)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, **attributes) -> Span:
+    """
+    Starts a span without making it current; the caller must call finish().
+
+    For operations that do not map onto a with-block, such as an LLM stream
+    that ends when the caller has consumed it.
+    """
+    return Span(name, _current_trace.get(), _current_span.get(), attributes)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Times the block as a span of the current trace; spans opened inside it become its children.
+    """
+    current = Span(name, _current_trace.get(), _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+def traced(name: str):
+    """
+    Decorator that runs a function (sync or async) inside span(name).
+    """
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_tokens(tier: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+    """
+    Counts the tokens of one LLM call and attaches them to the current span.
+    """
+    LLM_TOKENS.inc(prompt_tokens, tier=tier, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, tier=tier, kind="completion")
+    current = _current_span.get()
+    if current is not None:
+        current.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, estimated_tokens=estimated)
+
+
+def recent_traces(limit: int = 20, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Returns the most recent finished traces, newest first (or the one with `trace_id`).
+    """
+    traces = list(_recent) if TRACE_BUFFER else []
+    if trace_id:
+        return [t.as_dict() for t in traces if t.trace_id == trace_id]
+    return [t.as_dict() for t in reversed(traces[-limit:])]
+
+
+class AgentStepSpans:
+    """
+    Turns llama-index agent steps into spans.
+
+    Registered as a span handler on llama-index's root instrumentation
+    dispatcher; every other llama-index span is ignored.
+    """
+
+    STEP_METHODS = ("AgentRunner._run_step-", "AgentRunner._arun_step-")
+
+    @classmethod
+    def install(cls):
+        """
+        Adds the handler to llama-index's root dispatcher (once per process).
+        """
+        from llama_index.core.instrumentation import get_dispatcher
+        from llama_index.core.instrumentation.span_handlers import BaseSpanHandler
+
+        class _Handler(BaseSpanHandler):
+            def new_span(self, id_, bound_args, instance=None, parent_span_id=None, tags=None, **kwargs):
+                if id_.startswith(cls.STEP_METHODS):
+                    _open_steps[id_] = start_span("agent.step")
+                return None
+
+            def prepare_to_exit_span(self, id_, bound_args, instance=None, result=None, **kwargs):
+                step = _open_steps.pop(id_, None)
+                if step is not None:
+                    step.set(last=bool(getattr(result, "is_last", False)))
+                    step.finish()
+                return None
+
+            def prepare_to_drop_span(self, id_, bound_args, instance=None, err=None, **kwargs):
+                step = _open_steps.pop(id_, None)
+                if step is not None:
+                    step.finish(error=err)
+                return None
+
+        global _steps_installed
+        with _install_lock:
+            if not _steps_installed:
+                get_dispatcher().add_span_handler(_Handler())
+                _steps_installed = True
+
+
+_open_steps: Dict[str, Span] = {}
+_steps_installed = False
+_install_lock = threading.Lock()
@@ -1,32 +1,43 @@
 import logging
+import os
+import threading
+
+_configure_lock = threading.Lock()
+
 
 class GenericLogger:
     def __init__(self):
         """
         __init__ constructor for GenericLogger class
-        
+
         Does nothing currently. Just a placeholder
         """
         pass
 
     def get_logger(self):
         """
-        Gets a logger for the application with the level set to DEBUG
-        
+        Gets a logger for the application with the level set to LOG_LEVEL (default DEBUG)
+
         The logger is configured to log to the console with the following format:
         %(asctime)s - %(name)s - %(levelname)s - %(message)s
-        
+
+        Every module calls this at import time; the console handler is only
+        attached on the first call, so each record is written once.
+
         :return: A logger object
         """
         logger = logging.getLogger(__name__)
-        logger.setLevel(logging.DEBUG)  
+        with _configure_lock:
+            if not getattr(logger, "_generic_configured", False):
+                logger.setLevel(os.environ.get("LOG_LEVEL", "DEBUG").upper())
 
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+                formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-        stream_handler = logging.StreamHandler()
-        stream_handler.setFormatter(formatter)
+                stream_handler = logging.StreamHandler()
+                stream_handler.setFormatter(formatter)
 
-        logger.addHandler(stream_handler)
+                logger.addHandler(stream_handler)
 
-        logger.propagate = False
+                logger.propagate = False
+                logger._generic_configured = True
         return logger